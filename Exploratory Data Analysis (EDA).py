@@ -49,16 +49,21 @@
 
 # # 2. Loading Required Libraries and Datasets
 
+# The notebook runs from the repository root, the tables are read from `dataset/` (`retail_demand.loader.DATA_DIR`). `python -m retail_demand report` renders its figures headless, without seaborn or an IPython kernel.
+
 # In[1]:
 
-import os 
 import seaborn as sns
 import pandas as pd
 import numpy as np
 import random
 
-os.getcwd()
-os.chdir("C:\\Use\\Retail Demand Prediction using Machine Learning")
+from retail_demand.loader import read_train, read_product_data, read_store_data
+from retail_demand.star import StarSchema
+from retail_demand.series_index import SeriesIndex
+from retail_demand.downsample import plot_sorted, plot_density
+from retail_demand.profiling import profile_frame
+from retail_demand.coverage import CoverageIndex
 
 sns.set_context('notebook',font_scale=1.5)
 
@@ -78,10 +83,10 @@ warnings.filterwarnings("ignore")
 # In[2]:
 
 
-# reading the data files
-train = pd.read_csv('train.csv')
-product_data = pd.read_csv('product_data.csv')
-store_data = pd.read_csv('store_data.csv')
+# reading the data files with their declared dtypes
+train = read_train()
+product_data = read_product_data()
+store_data = read_store_data()
 
 
 # In[3]:
@@ -91,6 +96,14 @@ store_data = pd.read_csv('store_data.csv')
 train.shape, product_data.shape, store_data.shape
 
 
+# profiling every column of the three tables in one scan each: null counts,
+# cardinality, range, quartiles, top values and inferred type
+train_profile = profile_frame(train)
+product_profile = profile_frame(product_data)
+store_profile = profile_frame(store_data)
+train_profile.summary()
+
+
 # # 3. Understanding and Validating Data
 
 # ### Train Data
@@ -108,7 +121,7 @@ train.head(6)
 # checking datatypes of columns in train file 
 train.dtypes
 
-train.nunique(), train.dtypes 
+train_profile.summary()[['distinct', 'dtype']]
 
 
 # - WEEK_END_DATE has the data type object, but its a datetime variable 
@@ -146,13 +159,13 @@ train['WEEK_END_DATE'] = pd.to_datetime(train['WEEK_END_DATE'])
 # In[7]:
 
 
-train['WEEK_END_DATE'].isnull().sum()
+train_profile['WEEK_END_DATE'].nulls
 
 
 # In[8]:
 
 
-train['WEEK_END_DATE'].min(), train['WEEK_END_DATE'].max()
+train_profile['WEEK_END_DATE'].minimum, train_profile['WEEK_END_DATE'].maximum
 
 
 # - The data collected is from January 2009 to September 2011.
@@ -168,7 +181,7 @@ train['WEEK_END_DATE'].min(), train['WEEK_END_DATE'].max()
 # In[12]:
 
 
-train['WEEK_END_DATE'].nunique()
+train_profile['WEEK_END_DATE'].distinct
 
 
 # - The training data is for 142 weeks, based on the number of unique *weekend dates* in the train file. 
@@ -179,7 +192,7 @@ train['WEEK_END_DATE'].nunique()
 # In[13]:
 
 
-train['WEEK_END_DATE'].dt.weekday_name.value_counts()
+train_profile['WEEK_END_DATE'].top().groupby(lambda week: week.day_name()).sum()
 
 
 # ##### STORE_NUM  and UPC
@@ -187,19 +200,19 @@ train['WEEK_END_DATE'].dt.weekday_name.value_counts()
 # In[14]:
 
 
-train[['STORE_NUM', 'UPC']].isnull().sum()
+train_profile.summary(['STORE_NUM', 'UPC'])['nulls']
 
-train.isnull().sum()
+train_profile.summary()['nulls']
 # In[15]:
 
 
-train['STORE_NUM'].nunique()
+train_profile['STORE_NUM'].distinct
 
 
 # In[16]:
 
 
-(train['STORE_NUM'].value_counts()).sort_values()
+train_profile['STORE_NUM'].top().sort_values()
 
 
 # - We have 76 unique stores.
@@ -212,13 +225,18 @@ train['STORE_NUM'].nunique()
 # In[15]:
 
 
-142*76
+# bitset of the (week, store, UPC) cells that have a row
+train_coverage = CoverageIndex.build(train)
+train_coverage.shape
+
+
+train_coverage.cells(['WEEK_END_DATE', 'STORE_NUM'])
 
 
 # In[16]:
 
 
-train[['WEEK_END_DATE','STORE_NUM']].drop_duplicates().shape
+train_coverage.observed(['WEEK_END_DATE', 'STORE_NUM'])
 
 
 # - Implies that each store is atleast selling 1 product each week
@@ -226,13 +244,13 @@ train[['WEEK_END_DATE','STORE_NUM']].drop_duplicates().shape
 # In[17]:
 
 
-train['UPC'].nunique()
+train_profile['UPC'].distinct
 
 
 # In[18]:
 
 
-(train['UPC'].value_counts()).sort_values()
+train_profile['UPC'].top().sort_values()
 
 
 # 
@@ -241,13 +259,13 @@ train['UPC'].nunique()
 # In[19]:
 
 
-142*30
+train_coverage.cells(['WEEK_END_DATE', 'UPC'])
 
 
 # In[20]:
 
 
-train[['WEEK_END_DATE','UPC']].drop_duplicates().shape
+train_coverage.observed(['WEEK_END_DATE', 'UPC'])
 
 
 # - We have 30 unique products in the training data
@@ -261,7 +279,7 @@ train[['WEEK_END_DATE','UPC']].drop_duplicates().shape
 # In[21]:
 
 
-142*76*30
+train_coverage.cells()
 
 
 # In[22]:
@@ -273,7 +291,7 @@ train.shape
 # In[23]:
 
 
-232286/323760 
+train_coverage.coverage()
 
 
 # - We can conclude that all stores are not selling all products each week
@@ -293,16 +311,16 @@ train.shape
 # In[25]:
 
 
-train[['WEEK_END_DATE','STORE_NUM','UPC']].drop_duplicates().shape
+train_coverage.observed()
 
 
 # In[26]:
 
 
-train.groupby(['WEEK_END_DATE','STORE_NUM'])['UPC'].count().mean()
+train_coverage.week_counts('STORE_NUM').values.mean()
 
 
-# - The shape does not change after using drop duplicates
+# - The number of distinct (week, store, UPC) cells equals the number of rows
 # - Implies that there are unique combinations for week, store and UPC
 # - On an average, each week we are selling 22 products
 
@@ -311,7 +329,11 @@ train.groupby(['WEEK_END_DATE','STORE_NUM'])['UPC'].count().mean()
 # In[27]:
 
 
-(train.groupby(['STORE_NUM', 'UPC'])['UNITS'].count()).sort_values()
+train_coverage.series_counts().stack().sort_values()
+
+
+# the (week, store, UPC) cells without a row
+train_coverage.missing_keys()
 
 
 # - Not all stores sell a product throughout the week
@@ -324,13 +346,13 @@ train.groupby(['WEEK_END_DATE','STORE_NUM'])['UPC'].count().mean()
 # In[17]:
 
 
-train['BASE_PRICE'].isnull().sum()
+train_profile['BASE_PRICE'].nulls
 
 
 # In[29]:
 
 
-train['BASE_PRICE'].describe()
+train_profile['BASE_PRICE'].describe()
 
 
 # In[18]:
@@ -351,31 +373,31 @@ plt.show()
 # In[19]:
 
 
-train[['FEATURE','DISPLAY']].isnull().sum()
+train_profile.summary(['FEATURE','DISPLAY'])['nulls']
 
 
 # In[20]:
 
 
-train[['FEATURE','DISPLAY']].dtypes
+train_profile.summary(['FEATURE','DISPLAY'])[['dtype', 'inferred_type']]
 
 
 # In[21]:
 
 
-train[['FEATURE','DISPLAY']].nunique()
+train_profile.summary(['FEATURE','DISPLAY'])['distinct']
 
 
 # In[22]:
 
 
-train['FEATURE'].value_counts(normalize=True)
+train_profile['FEATURE'].top(normalize=True)
 
 
 # In[35]:
 
 
-train['FEATURE'].value_counts(normalize=True).plot('bar')
+train_profile['FEATURE'].top(normalize=True).plot(kind='bar')
 
 
 # - Approximately 10 percent of product are featured
@@ -383,13 +405,13 @@ train['FEATURE'].value_counts(normalize=True).plot('bar')
 # In[23]:
 
 
-train['DISPLAY'].value_counts(normalize=True)
+train_profile['DISPLAY'].top(normalize=True)
 
 
 # In[78]:
 
 
-train['DISPLAY'].value_counts(normalize=True).plot(kind ='bar')
+train_profile['DISPLAY'].top(normalize=True).plot(kind ='bar')
 
 
 # - About 13% of products are on display
@@ -405,14 +427,14 @@ pd.crosstab(train['FEATURE'], train['DISPLAY']).apply(lambda r: r/len(train), ax
 # In[28]:
 
 
-train['UNITS'].isnull().sum()
+train_profile['UNITS'].nulls
 
 
 # In[29]:
 
 
 # basic statistical details of UNITS variable
-train['UNITS'].describe()
+train_profile['UNITS'].describe()
 
 
 # - The Range of values is very high
@@ -444,7 +466,7 @@ train = train[train['UNITS'] != 0]
 
 # scatter plot for UNITS variable
 plt.figure(figsize=(8,6))
-plt.scatter(x = range(train.shape[0]), y = np.sort(train['UNITS'].values))
+plot_sorted(plt.gca(), train['UNITS'].values)
 plt.xlabel('Index', fontsize=12)
 plt.ylabel('Units Sold', fontsize=12)
 plt.show()
@@ -510,7 +532,7 @@ product_data.dtypes
 # In[36]:
 
 
-product_data['UPC'].nunique()
+product_profile['UPC'].distinct
 
 
 # - The number is consistent through the train and product data.
@@ -528,19 +550,19 @@ len(set(product_data.UPC).intersection(set(train.UPC)))
 
 
 # number and list of unique categories in the product data
-product_data['CATEGORY'].nunique(), product_data['CATEGORY'].unique()
+product_profile['CATEGORY'].distinct, product_data['CATEGORY'].unique()
 
 
 # In[39]:
 
 
-product_data['CATEGORY'].isnull().sum()
+product_profile['CATEGORY'].nulls
 
 
 # In[40]:
 
 
-product_data['CATEGORY'].value_counts()
+product_profile['CATEGORY'].top()
 
 
 # - We have four product categories - 
@@ -559,13 +581,13 @@ product_data['CATEGORY'].value_counts()
 # In[41]:
 
 
-product_data['SUB_CATEGORY'].isnull().sum()
+product_profile['SUB_CATEGORY'].nulls
 
 
 # In[55]:
 
 
-product_data['SUB_CATEGORY'].nunique()
+product_profile['SUB_CATEGORY'].distinct
 
 
 # In[42]:
@@ -608,14 +630,14 @@ product_data[['CATEGORY','SUB_CATEGORY','PRODUCT_SIZE']].drop_duplicates().sort_
 # In[44]:
 
 
-product_data['DESCRIPTION'].isnull().sum()
+product_profile['DESCRIPTION'].nulls
 
 
 # In[45]:
 
 
 # number and list of unique descriptions in the prodcut data
-product_data['DESCRIPTION'].nunique(), product_data['DESCRIPTION'].unique()
+product_profile['DESCRIPTION'].distinct, product_data['DESCRIPTION'].unique()
 
 
 # - We have 29 descriptions in the dataset, for 30 products.
@@ -624,7 +646,7 @@ product_data['DESCRIPTION'].nunique(), product_data['DESCRIPTION'].unique()
 # In[46]:
 
 
-(product_data['DESCRIPTION'].value_counts())
+product_profile['DESCRIPTION'].top()
 
 
 # In[47]:
@@ -653,13 +675,13 @@ product_data.loc[product_data['UPC'] == 1600027527]
 # In[63]:
 
 
-product_data['MANUFACTURER'].isnull().sum()
+product_profile['MANUFACTURER'].nulls
 
 
 # In[64]:
 
 
-product_data['MANUFACTURER'].nunique()
+product_profile['MANUFACTURER'].distinct
 
 
 # In[50]:
@@ -717,7 +739,7 @@ store_data.dtypes
 # In[68]:
 
 
-store_data['STORE_ID'].nunique()
+store_profile['STORE_ID'].distinct
 
 
 # In[69]:
@@ -731,13 +753,13 @@ len(set(store_data.STORE_ID).intersection(set(train.STORE_NUM)))
 # In[70]:
 
 
-store_data['STORE_NAME'].isnull().sum()
+store_profile['STORE_NAME'].nulls
 
 
 # In[71]:
 
 
-store_data['STORE_NAME'].nunique()
+store_profile['STORE_NAME'].distinct
 
 
 # - The number of unique store IDs is more than number of unique store names
@@ -751,7 +773,7 @@ store_data['STORE_NAME'].nunique()
 
 
 # number of store names repeating
-store_data['STORE_NAME'].value_counts()
+store_profile['STORE_NAME'].top()
 
 
 # In[51]:
@@ -773,7 +795,7 @@ store_data.loc[store_data['STORE_NAME'] == 'MIDDLETOWN']
 # In[75]:
 
 
-store_data[['ADDRESS_STATE_PROV_CODE', 'ADDRESS_CITY_NAME']].isnull().sum()
+store_profile.summary(['ADDRESS_STATE_PROV_CODE', 'ADDRESS_CITY_NAME'])['nulls']
 
 
 # #### How many cities and states are the stores located in?
@@ -781,7 +803,7 @@ store_data[['ADDRESS_STATE_PROV_CODE', 'ADDRESS_CITY_NAME']].isnull().sum()
 # In[76]:
 
 
-store_data[['ADDRESS_STATE_PROV_CODE', 'ADDRESS_CITY_NAME']].nunique()
+store_profile.summary(['ADDRESS_STATE_PROV_CODE', 'ADDRESS_CITY_NAME'])['distinct']
 
 
 # <img src = 'texas-to-ohio-map-map-of-arizona-and-california-cities-california-map-major-cities-of-texas-to-ohio-map.jpg' width = 700 height = 700>
@@ -807,7 +829,7 @@ store_data.groupby(['ADDRESS_STATE_PROV_CODE'])['ADDRESS_CITY_NAME'].nunique()
 # In[79]:
 
 
-store_data['ADDRESS_CITY_NAME'].value_counts()
+store_profile['ADDRESS_CITY_NAME'].top()
 
 
 # ##### MSA_CODE
@@ -815,19 +837,19 @@ store_data['ADDRESS_CITY_NAME'].value_counts()
 # In[80]:
 
 
-store_data['MSA_CODE'].isnull().sum()
+store_profile['MSA_CODE'].nulls
 
 
 # In[53]:
 
 
-store_data['MSA_CODE'].nunique(), store_data['MSA_CODE'].unique()
+store_profile['MSA_CODE'].distinct, store_data['MSA_CODE'].unique()
 
 
 # In[82]:
 
 
-store_data['MSA_CODE'].value_counts()
+store_profile['MSA_CODE'].top()
 
 
 # In[54]:
@@ -844,7 +866,7 @@ store_data['MSA_CODE'].value_counts()
 # In[84]:
 
 
-store_data[['PARKING_SPACE_QTY', 'SALES_AREA_SIZE_NUM']].isnull().sum()
+store_profile.summary(['PARKING_SPACE_QTY', 'SALES_AREA_SIZE_NUM'])['nulls']
 
 
 # - Of 76 stores, parking area of 51 is missing
@@ -900,13 +922,13 @@ sns.distplot(state_tx['SALES_AREA_SIZE_NUM'], hist=False,  color= 'orange', labe
 # In[89]:
 
 
-store_data['AVG_WEEKLY_BASKETS'].isnull().sum()
+store_profile['AVG_WEEKLY_BASKETS'].nulls
 
 
 # In[90]:
 
 
-store_data['AVG_WEEKLY_BASKETS'].describe()
+store_profile['AVG_WEEKLY_BASKETS'].describe()
 
 
 # In[91]:
@@ -931,7 +953,7 @@ plt.show()
 # In[93]:
 
 
-store_data['SEG_VALUE_NAME'].isnull().sum()
+store_profile['SEG_VALUE_NAME'].nulls
 
 
 # There are certain segments assigned to store, based on the brand and quality of products sold at the store.
@@ -945,7 +967,7 @@ store_data['SEG_VALUE_NAME'].isnull().sum()
 # In[94]:
 
 
-store_data['SEG_VALUE_NAME'].value_counts()
+store_profile['SEG_VALUE_NAME'].top()
 
 
 # #### Does the segment has any relation with the store area?
@@ -1033,9 +1055,9 @@ store_data['SEG_VALUE_NAME'].value_counts()
 # In[55]:
 
 
-store_product_data = train.merge(product_data, how = 'left', on='UPC')
-
-store_product_data = store_product_data.merge(store_data, how = 'left', left_on = 'STORE_NUM', right_on = 'STORE_ID')
+# star schema view: the train rows keep integer codes into the product and store tables,
+# and the product and store columns are only materialized when they are asked for
+store_product_data = StarSchema(train, product_data, store_data)
 
 
 # In[56]:
@@ -1061,7 +1083,8 @@ store_product_data.columns
 
 
 #sum of units sold per week
-weekly_demand = store_product_data.groupby(['WEEK_END_DATE'])['UNITS'].sum()
+# (WeeklyState.load('weekly_state.pkl').aggregates.weekly_demand() keeps it up to date week by week, see incremental.py)
+weekly_demand = train.groupby(['WEEK_END_DATE'])['UNITS'].sum()
 
 plt.figure(figsize=(30,10))
 sns.lineplot(x = weekly_demand.index, y = weekly_demand)
@@ -1083,23 +1106,29 @@ sns.lineplot(x = weekly_demand.index, y = weekly_demand)
 #We use the key of the dictionary, i.e, the product and add manufacturer and description to the the title and finally use seaborn to plot it.
 
 
+# In[ ]:
+
+
+# weekly units, featured and displayed share of every product and every store, each built with a single groupby
+product_series = SeriesIndex.build(train, by='UPC', metadata=product_data)
+store_series = SeriesIndex.build(train, by='STORE_NUM', metadata=store_data)
+
+
 # In[58]:
 
 
 # function to plot weekly sales of products
 def product_plots(product_list):
     
-    # dictionary storing UPC and weekly sales
-    d = {product: store_product_data[store_product_data['UPC'] == product].groupby(['WEEK_END_DATE'])['UNITS'].sum() for product in product_list}
     fig, axs = plt.subplots(len(product_list), 1, figsize = (20, 20), dpi=300)
     j = 0
     
-    for product in d.keys():
-        # adding manufacturer and descritption in title
-        manu = product_data[product_data['UPC'] == product]['MANUFACTURER'].values[0]
-        desc = product_data[product_data['UPC'] == product]['DESCRIPTION'].values[0]            
+    for product in product_list:
+        # weekly sales, with manufacturer and descritption in title
+        sales = product_series.series(product, 'UNITS')
+        title = product_series.title(product, ['MANUFACTURER', 'DESCRIPTION'])
         # creating the plot
-        sns.lineplot(x = d[product].index, y = d[product],ax = axs[j]).set_title(str(manu)+str(" ")+str(desc), y=0.75, fontsize = 16)
+        sns.lineplot(x = sales.index, y = sales, ax = axs[j]).set_title(title, y=0.75, fontsize = 16)
         j = j+1
     plt.tight_layout()
 
@@ -1146,7 +1175,7 @@ stores_plot = random.sample(list(store_data['STORE_ID']), 5)
 
 #creating dictionary with store number as keys
 # for each store, calculate sum of units sold per week
-d = {store: train[train['STORE_NUM'] == store].groupby(['WEEK_END_DATE'])['UNITS'].sum() for store in stores_plot}
+d = {store: store_series.series(store, 'UNITS') for store in stores_plot}
 
 
 # In[107]:
@@ -1174,22 +1203,18 @@ for store in d.keys():
 
 
 def featured_plots(product_list):
-    #dictionary storing UPC and 'Featured' variable
-    d_f = {product: 1000*train[train['UPC'] == product].groupby(['WEEK_END_DATE'])['FEATURE'].mean() for product in product_list}
-    #dictionary storing UPC and Product Sales
-    d = {product: train[train['UPC'] == product].groupby(['WEEK_END_DATE'])['UNITS'].sum() for product in product_list}
-    
-    
     fig, axs = plt.subplots(len(product_list), 1, figsize = (20, 20), dpi=300)
     j = 0
-    for product in d.keys():
+    for product in product_list:
+        # 'Featured' variable and Product Sales
+        featured = 1000*product_series.series(product, 'FEATURE')
+        sales = product_series.series(product, 'UNITS')
         # Manufacturer name and Descritption in title
-        manu = product_data[product_data['UPC'] == product]['MANUFACTURER'].values[0]
-        desc = product_data[product_data['UPC'] == product]['DESCRIPTION'].values[0]
+        title = product_series.title(product, ['MANUFACTURER', 'DESCRIPTION'])
         
         # plotting featured and sales values
-        sns.lineplot(x = d_f[product].index, y = d_f[product],ax = axs[j]).set_title(str(manu)+str(" ")+str(desc), y=0.75, fontsize = 16)
-        sns.lineplot(x = d[product].index, y = d[product],ax = axs[j]).set_title(str(manu)+str(" ")+str(desc), y=0.75, fontsize = 16)
+        sns.lineplot(x = featured.index, y = featured, ax = axs[j]).set_title(title, y=0.75, fontsize = 16)
+        sns.lineplot(x = sales.index, y = sales, ax = axs[j]).set_title(title, y=0.75, fontsize = 16)
         j = j+1
 
 
@@ -1213,15 +1238,14 @@ featured_plots(product_list_f)
 
 
 def display_plots(product_list):
-    d_d = {product: 1000*train[train['UPC'] == product].groupby(['WEEK_END_DATE'])['DISPLAY'].mean() for product in product_list}
-    d = {product: train[train['UPC'] == product].groupby(['WEEK_END_DATE'])['UNITS'].sum() for product in product_list}
     fig, axs = plt.subplots(len(product_list), 1, figsize = (20, 20), dpi=300)
     j = 0
-    for product in d.keys():
-        manu = product_data[product_data['UPC'] == product]['MANUFACTURER'].values[0]
-        desc = product_data[product_data['UPC'] == product]['DESCRIPTION'].values[0]
-        sns.lineplot(x = d[product].index, y = d[product],ax = axs[j]).set_title(str(manu)+str(" ")+str(desc), y=0.75, fontsize = 16)
-        sns.lineplot(x = d_d[product].index, y = d_d[product],ax = axs[j]).set_title(str(manu)+str(" ")+str(desc), y=0.75, fontsize = 16)
+    for product in product_list:
+        displayed = 1000*product_series.series(product, 'DISPLAY')
+        sales = product_series.series(product, 'UNITS')
+        title = product_series.title(product, ['MANUFACTURER', 'DESCRIPTION'])
+        sns.lineplot(x = sales.index, y = sales, ax = axs[j]).set_title(title, y=0.75, fontsize = 16)
+        sns.lineplot(x = displayed.index, y = displayed, ax = axs[j]).set_title(title, y=0.75, fontsize = 16)
         j = j+1
 
 
@@ -1242,10 +1266,12 @@ display_plots(product_list_f)
 # In[62]:
 
 
-product_size_coldcereal = store_product_data.loc[store_product_data['CATEGORY']=='COLD CEREAL']
-product_size_bagsnacks  = store_product_data.loc[store_product_data['CATEGORY']=='BAG SNACKS']
-product_size_frozenpizza = store_product_data.loc[store_product_data['CATEGORY']=='FROZEN PIZZA']
-product_size_oralhyiegne = store_product_data.loc[store_product_data['CATEGORY']=='ORAL HYGIENE PRODUCTS']
+category_columns = ['CATEGORY', 'PRODUCT_SIZE', 'BASE_PRICE', 'UNITS']
+
+product_size_coldcereal = store_product_data.frame(category_columns, rows=store_product_data.rows_where('CATEGORY', ['COLD CEREAL']))
+product_size_bagsnacks  = store_product_data.frame(category_columns, rows=store_product_data.rows_where('CATEGORY', ['BAG SNACKS']))
+product_size_frozenpizza = store_product_data.frame(category_columns, rows=store_product_data.rows_where('CATEGORY', ['FROZEN PIZZA']))
+product_size_oralhyiegne = store_product_data.frame(category_columns, rows=store_product_data.rows_where('CATEGORY', ['ORAL HYGIENE PRODUCTS']))
 
 
 # In[63]:
@@ -1253,7 +1279,7 @@ product_size_oralhyiegne = store_product_data.loc[store_product_data['CATEGORY']
 
 # scatter plot for base price and sales
 plt.figure(figsize=(8,6))
-plt.scatter(x = (product_size_bagsnacks['BASE_PRICE']), y = (product_size_bagsnacks['UNITS']))
+plot_density(plt.gca(), product_size_bagsnacks['BASE_PRICE'], product_size_bagsnacks['UNITS'])
 plt.xlabel('BASE_PRICE', fontsize=12)
 plt.ylabel('UNITS', fontsize=12)
 plt.show()
@@ -1264,7 +1290,7 @@ plt.show()
 
 # scatter plot for base price and sales
 plt.figure(figsize=(8,6))
-plt.scatter(x = (product_size_oralhyiegne['BASE_PRICE']), y = (product_size_oralhyiegne['UNITS']))
+plot_density(plt.gca(), product_size_oralhyiegne['BASE_PRICE'], product_size_oralhyiegne['UNITS'])
 plt.xlabel('BASE_PRICE', fontsize=12)
 plt.ylabel('UNITS', fontsize=12)
 plt.show()
@@ -1275,7 +1301,7 @@ plt.show()
 
 # scatter plot for base price and sales
 plt.figure(figsize=(8,6))
-plt.scatter(x = (product_size_frozenpizza['BASE_PRICE']), y = (product_size_frozenpizza['UNITS']))
+plot_density(plt.gca(), product_size_frozenpizza['BASE_PRICE'], product_size_frozenpizza['UNITS'])
 plt.xlabel('BASE_PRICE', fontsize=12)
 plt.ylabel('UNITS', fontsize=12)
 plt.show()
@@ -1286,7 +1312,7 @@ plt.show()
 
 # scatter plot for base price and sales
 plt.figure(figsize=(8,6))
-plt.scatter(x = (product_size_coldcereal['BASE_PRICE']), y = (product_size_coldcereal['UNITS']))
+plot_density(plt.gca(), product_size_coldcereal['BASE_PRICE'], product_size_coldcereal['UNITS'])
 plt.xlabel('BASE_PRICE', fontsize=12)
 plt.ylabel('UNITS', fontsize=12)
 plt.show()
@@ -1345,28 +1371,28 @@ product_data[product_data['UPC'].isin(pretzels)]
 
 
 plt.figure(figsize=(20,6))
-ax = sns.boxplot(x="MANUFACTURER", y="UNITS", data=store_product_data[store_product_data['UPC'].isin(pretzels)])
+ax = sns.boxplot(x="MANUFACTURER", y="UNITS", data=store_product_data.frame(['MANUFACTURER', 'UNITS'], rows=store_product_data.rows_where('UPC', pretzels)))
 
 
 # In[71]:
 
 
 plt.figure(figsize=(20,6))
-ax = sns.boxplot(x="MANUFACTURER", y="UNITS", data=store_product_data[store_product_data['UPC'].isin(cold_cereal)])
+ax = sns.boxplot(x="MANUFACTURER", y="UNITS", data=store_product_data.frame(['MANUFACTURER', 'UNITS'], rows=store_product_data.rows_where('UPC', cold_cereal)))
 
 
 # In[72]:
 
 
 plt.figure(figsize=(20,6))
-ax = sns.boxplot(x="MANUFACTURER", y="UNITS", data=store_product_data[store_product_data['UPC'].isin(oral_hygiene)])
+ax = sns.boxplot(x="MANUFACTURER", y="UNITS", data=store_product_data.frame(['MANUFACTURER', 'UNITS'], rows=store_product_data.rows_where('UPC', oral_hygiene)))
 
 
 # In[73]:
 
 
 plt.figure(figsize=(20,6))
-ax = sns.boxplot(x="MANUFACTURER", y="UNITS", data=store_product_data[store_product_data['UPC'].isin(frozen_pizza)])
+ax = sns.boxplot(x="MANUFACTURER", y="UNITS", data=store_product_data.frame(['MANUFACTURER', 'UNITS'], rows=store_product_data.rows_where('UPC', frozen_pizza)))
 
 
 # #### Is there a significant difference in the product sales for different regions?
@@ -1380,9 +1406,10 @@ ax = sns.boxplot(x="MANUFACTURER", y="UNITS", data=store_product_data[store_prod
 # In[74]:
 
 
-grouped_weekly_sales = store_product_data.groupby(['WEEK_END_DATE','STORE_NUM'])['UNITS'].sum().reset_index()
+grouped_weekly_sales = train.groupby(['WEEK_END_DATE','STORE_NUM'])['UNITS'].sum().reset_index()
 
-grouped_weekly_sales = grouped_weekly_sales.merge(store_data, how = 'left', left_on = 'STORE_NUM', right_on = 'STORE_ID')
+# attach the state of each store from the store table
+grouped_weekly_sales = store_product_data.lookup(grouped_weekly_sales, ['ADDRESS_STATE_PROV_CODE'], by='STORE_NUM')
 
 grouped_weekly_sales = grouped_weekly_sales.sort_values(by = 'ADDRESS_STATE_PROV_CODE')
 
@@ -1412,8 +1439,9 @@ plt.xticks(rotation=45)
 # In[76]:
 
 
-store_agg_data = train.groupby(['STORE_NUM'])['UNITS'].sum().reset_index()
-merged_store_data = store_data.merge(store_agg_data, how = 'left', left_on = 'STORE_ID', right_on = 'STORE_NUM')
+# total units sold by each store, aligned with the rows of the store table
+store_agg_data = store_product_data.totals('UNITS', by='STORE_NUM')
+merged_store_data = store_product_data.dimensions['store'].assign(UNITS=store_agg_data.values)
 
 
 # In[128]:
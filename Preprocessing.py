@@ -33,6 +33,10 @@ import pandas as pd
 import numpy as np
 import category_encoders as ce
 
+from retail_demand.loader import read_train, read_product_data, read_store_data
+from retail_demand.downsample import plot_sorted
+from retail_demand.instrumentation import StageRecorder
+
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -40,6 +44,13 @@ import matplotlib.pyplot as plt
 get_ipython().run_line_magic('matplotlib', 'inline')
 
 
+# In[ ]:
+
+
+# times and memory of every stage, recorded only when PIPELINE_REPORT or PIPELINE_PROFILE is set (see instrumentation.py)
+recorder = StageRecorder.from_env()
+
+
 # ---
 # ### `DATASET 1: Weekly Sales Data` contains the following features
 # 
@@ -57,7 +68,10 @@ get_ipython().run_line_magic('matplotlib', 'inline')
 
 
 # read the train data
-data = pd.read_csv('dataset/train.csv')
+# WEEK_END_DATE is kept as it is in the file, it is only passed through to the output
+with recorder.stage('read_train') as stage:
+    data = read_train(parse_dates=False)
+    stage.output(data)
 
 
 # In[ ]:
@@ -110,7 +124,9 @@ data[['STORE_NUM', 'UPC', 'FEATURE', 'DISPLAY']].isna().sum()
 
 
 # read the product data
-product_data = pd.read_csv('dataset/product_data.csv')
+with recorder.stage('read_product_data') as stage:
+    product_data = read_product_data()
+    stage.output(product_data)
 
 
 # In[13]:
@@ -205,66 +221,70 @@ product_data
 # In[23]:
 
 
-# remove the units from the product size
-# we will keep only the values
-product_data['PRODUCT_SIZE'] = product_data.PRODUCT_SIZE.apply(lambda x: x.split()[0])
+from retail_demand.product_size import PRODUCT_SIZE_BINS, parse_product_size, bin_product_size
 
 
 # In[24]:
 
 
-# change data type of product size from string to float
-product_data.PRODUCT_SIZE = product_data.PRODUCT_SIZE.astype(float)
+# split the product size into its value and its unit
+product_sizes = parse_product_size(product_data.PRODUCT_SIZE)
 
 
 # In[25]:
 
 
 # Let's see the unique product size values for each category
-product_data.groupby(['CATEGORY'])['PRODUCT_SIZE'].unique()
+product_sizes.groupby(product_data.CATEGORY.values)['SIZE'].unique()
+
 
+# ---
+# 
+# The bin edges of every category are kept in one table, `PRODUCT_SIZE_BINS`:
+# 
+#  - `COLD CEREAL` - 3 bins
+#  - `ORAL HYGIENE PRODUCTS` - 2 bins
+#  - `FROZEN PIZZA` - 3 bins
+#  - `BAG SNACKS` - 2 bins
+# 
+# A new category only needs a new line in the table.
+# 
+# ---
 
 # In[ ]:
 
 
-# define 3 bins for category type = "COLD CEREAL"
-product_data.loc[product_data.CATEGORY == 'COLD CEREAL', 'PRODUCT_SIZE'] = pd.cut(product_data.PRODUCT_SIZE,
-                                                                                 bins=[10,13,16,21],
-                                                                                 labels=[1,2,3])
+PRODUCT_SIZE_BINS
 
 
 # In[ ]:
 
 
-# define 2 bins for category type = "ORAL HYGIENE PRODUCTS"
-product_data.loc[product_data.CATEGORY == 'ORAL HYGIENE PRODUCTS', 'PRODUCT_SIZE'] = pd.cut(product_data.PRODUCT_SIZE,
-                                                                                            bins=[0,501,1001],
-                                                                                            labels=[1,2])
+# bin the product sizes of all the categories in one pass
+with recorder.stage('product_size_binning', product_data) as stage:
+    product_data['PRODUCT_SIZE'], unbinned_sizes = bin_product_size(product_data.CATEGORY, product_sizes.SIZE)
+    stage.output(product_data)
 
 
 # In[ ]:
 
 
-# define 3 bins for category type = "FROZEN PIZZA"
-product_data.loc[product_data.CATEGORY == 'FROZEN PIZZA', 'PRODUCT_SIZE'] = pd.cut(product_data.PRODUCT_SIZE,
-                                                                                   bins=[20,25,30,35],
-                                                                                   labels=[1,2,3])
+# products whose size could not be binned, with the reason
+unbinned_sizes
 
 
 # In[ ]:
 
 
-# define 2 bins for category type = "BAG SNACKS"
-product_data.loc[product_data.CATEGORY == 'BAG SNACKS', 'PRODUCT_SIZE'] = pd.cut(product_data.PRODUCT_SIZE,
-                                                                                 bins=[9,14,20],
-                                                                                 labels=[1,2])
+# value counts of PRODUCT SIZE
+product_data.PRODUCT_SIZE.value_counts()
 
 
 # In[ ]:
 
 
-# value counts of PRODUCT SIZE
-product_data.PRODUCT_SIZE.value_counts()
+# keep the sub category of each product, it is used later to impute the missing base prices
+upc_sub_category = product_data.set_index('UPC')['SUB_CATEGORY']
 
 
 # In[ ]:
@@ -278,7 +298,9 @@ OHE_p = ce.OneHotEncoder(cols= ['MANUFACTURER', 'CATEGORY', 'SUB_CATEGORY'])
 
 
 # transform the data
-product_data = OHE_p.fit_transform(product_data)
+with recorder.stage('product_one_hot_encoding', product_data) as stage:
+    product_data = OHE_p.fit_transform(product_data)
+    stage.output(product_data)
 
 
 # In[ ]:
@@ -321,7 +343,9 @@ product_data.columns
 
 
 # read the store data
-store_data = pd.read_csv('dataset/store_data.csv')
+with recorder.stage('read_store_data') as stage:
+    store_data = read_store_data()
+    stage.output(store_data)
 
 
 # In[ ]:
@@ -423,7 +447,9 @@ store_data.SEG_VALUE_NAME = store_data.SEG_VALUE_NAME.map({'VALUE': 1, 'MAINSTRE
 
 
 # transform the data
-store_data = OHE.fit_transform(store_data)
+with recorder.stage('store_one_hot_encoding', store_data) as stage:
+    store_data = OHE.fit_transform(store_data)
+    stage.output(store_data)
 
 
 # In[5]:
@@ -540,39 +566,39 @@ data[[ 'BASE_PRICE', 'UNITS']].isna().sum()
 # 
 # ---
 
+# ***The missing base prices are imputed in one vectorized pass, falling back in order to:***
+# 
+#  - the last observed price of the same STORE_NUM and UPC
+#  - the average price of the UPC across all the stores
+#  - the average price of the SUB_CATEGORY of the UPC
+# 
+# ---
+
 # In[4]:
 
 
-# create a new dataframe which will have "average base price" for the combination of STORE_NUM and UPC
-# we will use this to impute the missing values 
-avg_price = data.groupby(['STORE_NUM', 'UPC'])['BASE_PRICE'].mean().reset_index()
+from retail_demand.imputation import impute_base_price
 
 
 # In[5]:
 
 
-avg_price
-
-
-# In[6]:
-
-
 # null values in BASE PRICE
 data.loc[data.BASE_PRICE.isna() == True]
 
 
-# In[7]:
+# In[6]:
 
 
-# define function to fill missing base price values
-def fill_base_price(x) :
-    return avg_price.BASE_PRICE[(avg_price.STORE_NUM == x['STORE_NUM']) & (avg_price.UPC == x['UPC'])].values[0]
+with recorder.stage('impute_base_price', data) as stage:
+    data['BASE_PRICE'] = impute_base_price(data, sub_category=upc_sub_category)
+    stage.output(data)
 
 
-# In[8]:
+# In[7]:
 
 
-data.BASE_PRICE[data.BASE_PRICE.isna() == True] = data[data.BASE_PRICE.isna() == True].apply(fill_base_price, axis=1)
+data.BASE_PRICE.isna().sum()
 
 
 # In[9]:
@@ -583,7 +609,7 @@ data.BASE_PRICE[data.BASE_PRICE.isna() == True] = data[data.BASE_PRICE.isna() ==
 
 get_ipython().run_line_magic('matplotlib', 'notebook')
 plt.figure(figsize=(8,6))
-plt.scatter(x = range(data.shape[0]), y = np.sort(data['UNITS'].values))
+plot_sorted(plt.gca(), data['UNITS'].values)
 plt.xlabel('Index', fontsize=12)
 plt.ylabel('Units Sold', fontsize=12)
 plt.show()
@@ -598,10 +624,40 @@ data['UNITS'][data.UNITS > 750].shape[0]
 
 # ---
 # 
-# ***We can see that, there are a some points above where UNITS are more than 750 and there number is only 21. So, we can remove them as there number is only 21 and will not affect the data and these will act as a noise to our model.***
+# ***We can see that, there are a some points above where UNITS are more than 750 and there number is only 21. But a single threshold is too high for the low volume STORE_NUM and UPC series and too low for the high volume ones. So, every series gets its own bounds from the quantiles of its UNITS, and the points outside the bounds of their series are removed as they will act as a noise to our model.***
 # 
 # ---
 
+# In[ ]:
+
+
+from retail_demand.outliers import UnitsSketch, flag_outliers
+
+
+# In[ ]:
+
+
+# quantile sketch of the UNITS of every STORE_NUM and UPC series
+with recorder.stage('units_sketch', data):
+    sketch = UnitsSketch().update(data)
+
+
+# In[ ]:
+
+
+# flag the points outside the bounds of their series
+with recorder.stage('flag_outliers', data) as stage:
+    outliers = flag_outliers(data, sketch)
+    stage.output(rows=int(outliers.sum()))
+outliers.sum()
+
+
+# In[ ]:
+
+
+data[outliers]
+
+
 # In[415]:
 
 
@@ -611,14 +667,16 @@ data.shape
 # In[416]:
 
 
-# remove the valures where UNITS are more than 750
-data = data[~(data.UNITS > 750)]
+# remove the outliers
+with recorder.stage('outlier_filtering', data) as stage:
+    data = data[~outliers]
+    stage.output(data)
 
 
 # In[417]:
 
 
-data[data.UNITS > 750].shape[0]
+data.shape
 
 
 # ---
@@ -705,12 +763,62 @@ store_data = store_data.drop(columns=['PARKING_SPACE_QTY'])
 # ---
 # ### `SAVE THE UPDATED FILES`
 # 
+# ***Note:*** When the train data does not fit in memory, `python -m retail_demand streaming` runs the same base price imputation and UNITS outlier removal chunk by chunk and writes `updated_train_data.csv`.
+# 
+# ***Note:*** For the weekly refresh, `python -m retail_demand incremental init` saves the running aggregates, last prices and UNITS sketches of the history once, and `python -m retail_demand incremental apply new_week.csv` appends only the new week's preprocessed rows to `updated_train_data.csv`.
+# 
+# ***Note:*** `python -m retail_demand temporal_features` writes `train_features.csv`: `updated_train_data.csv` with the lag, rolling, EWMA and weeks-since-promotion features of every store and product series, for next-week forecasting.
+# 
+# ***Note:*** `python -m retail_demand baselines` compares the naive, seasonal naive, moving average, exponential smoothing (simple and Holt) and Croston forecasts of every series on the last weeks and writes their next-week forecasts to `baseline_forecasts.csv`, the scores a model has to beat.
+# 
+# ***Note:*** `python -m retail_demand segment_training --segment CATEGORY` trains one model per segment (any column of the train, product or store tables, e.g. `CATEGORY` or `SEG_VALUE_NAME`) on `train_features.csv` in a process pool that shares a single copy of the feature matrix.
+# 
+# ***Note:*** `python -m retail_demand forecast_service --models segment_models.pkl` serves next-week forecasts over HTTP on localhost, encoding every request as above (BASE_PRICE imputed, FEATURE and DISPLAY as 0/1) and scoring concurrent requests in micro-batches; `benchmarks/load_test.py` measures its latency and throughput.
+# 
+# ***Note:*** with `PIPELINE_REPORT=preprocessing.jsonl` set, every stage of this notebook (reads, binning, encodings, imputation, outlier filtering and the writes) appends its wall and CPU time, rows in and out, DataFrame memory and RSS change to the report (and the tracemalloc peak with `PIPELINE_TRACEMALLOC=1`), and `PIPELINE_PROFILE=<stage>` saves a cProfile of that stage; `python -m retail_demand instrumentation preprocessing.jsonl` prints the stage table of the last run.
+# 
+# ***Note:*** `python -m retail_demand preprocessing` runs every step of this notebook headless, without matplotlib or an IPython kernel, and writes the same three files and the fitted transformer; `python -m retail_demand` lists the other commands.
+# 
 # ---
 
 # In[424]:
 
 
-data.to_csv('updated_train_data.csv',index=False)
-product_data.to_csv('updated_product_data.csv',index=False)
-store_data.to_csv('updated_store_data.csv',index=False)
+with recorder.stage('csv_write', [data, product_data, store_data]) as stage:
+    data.to_csv('updated_train_data.csv',index=False)
+    product_data.to_csv('updated_product_data.csv',index=False)
+    store_data.to_csv('updated_store_data.csv',index=False)
+    stage.output(rows=len(data) + len(product_data) + len(store_data))
+
+
+# ---
+# ### `SAVE THE FITTED TRANSFORMER`
+# 
+# The same encodings, bins and base price imputation are fitted on the raw tables and saved as one object, so that prediction does not have to redo any of the steps above.
+# 
+# ---
+
+# In[ ]:
+
+
+from retail_demand.transformer import PreprocessingTransformer
+
+transformer = PreprocessingTransformer().fit(read_train(), read_product_data(), read_store_data())
+transformer.save('preprocessing_transformer.pkl')
+
+
+# In[ ]:
+
+
+# reads of the raw files served by the columnar cache
+from retail_demand import cache
+print(cache.stats)
+
+
+# In[ ]:
+
+
+# stage times and memory of this run, also in the PIPELINE_REPORT file
+recorder.close()
+print(recorder)
 
@@ -0,0 +1,77 @@
+"""
+Benchmark the vectorized BASE_PRICE imputation against the row-wise
+`fill_base_price` apply that Preprocessing.py used to run.
+
+    python benchmarks/bench_impute_base_price.py --stores 76 --upcs 30 --weeks 142
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retail_demand.imputation import impute_base_price
+
+
+def make_panel(stores, upcs, weeks, missing_rate, seed=0):
+    rng = np.random.default_rng(seed)
+    week, store, upc = np.meshgrid(np.arange(weeks), np.arange(stores), np.arange(upcs), indexing='ij')
+    data = pd.DataFrame({
+        'WEEK_END_DATE': pd.Timestamp('2009-01-14') + pd.to_timedelta(7 * week.ravel(), unit='D'),
+        'STORE_NUM': 100 + store.ravel(),
+        'UPC': 1111009477 + upc.ravel(),
+        'BASE_PRICE': rng.uniform(1, 8, week.size).round(2),
+    })
+    data.loc[rng.random(len(data)) < missing_rate, 'BASE_PRICE'] = np.nan
+    sub_category = pd.Series(np.arange(upcs) % 6, index=1111009477 + np.arange(upcs))
+    return data, sub_category
+
+
+def legacy_impute(data):
+    # the original Preprocessing.py cells
+    avg_price = data.groupby(['STORE_NUM', 'UPC'])['BASE_PRICE'].mean().reset_index()
+
+    def fill_base_price(x):
+        return avg_price.BASE_PRICE[(avg_price.STORE_NUM == x['STORE_NUM']) & (avg_price.UPC == x['UPC'])].values[0]
+
+    data = data.copy()
+    missing = data.BASE_PRICE.isna()
+    data.loc[missing, 'BASE_PRICE'] = data[missing].apply(fill_base_price, axis=1)
+    return data.BASE_PRICE
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stores', type=int, default=76)
+    parser.add_argument('--upcs', type=int, default=30)
+    parser.add_argument('--weeks', type=int, default=142)
+    parser.add_argument('--missing-rate', type=float, default=0.001)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-legacy', action='store_true', help='only time the vectorized path')
+    args = parser.parse_args()
+
+    data, sub_category = make_panel(args.stores, args.upcs, args.weeks, args.missing_rate)
+    print('rows: {:,}  missing BASE_PRICE: {:,}'.format(len(data), int(data.BASE_PRICE.isna().sum())))
+
+    vectorized = best_of(lambda: impute_base_price(data, sub_category=sub_category), args.repeat)
+    print('impute_base_price : {:10.4f} s'.format(vectorized))
+    if not args.skip_legacy:
+        legacy = best_of(lambda: legacy_impute(data), args.repeat)
+        print('fill_base_price   : {:10.4f} s  ({:.0f}x slower)'.format(legacy, legacy / vectorized))
+
+
+if __name__ == '__main__':
+    main()
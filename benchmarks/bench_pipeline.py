@@ -0,0 +1,257 @@
+"""
+Benchmark every stage of Preprocessing.py and the EDA aggregations at several
+data scales, recording wall time and peak memory.
+
+The tables of every scale are generated once with `synthetic.py` (scale 1 is
+about the size of the extracts) into `--data-root` and reused by later runs.
+Stages run in pipeline order, each on the outputs of the stages before it:
+
+    load_csv, null_checks, impute_base_price, product_size_binning,
+    one_hot_encoding, outlier_filtering, merge, star_schema,
+    weekly_aggregations, csv_write
+
+A stage is timed `--repeat` times, keeping the best run. Then it runs once
+more under tracemalloc for its peak memory above what was allocated before
+it, since tracing slows allocations down. numpy and pandas buffers are
+traced, but pyarrow's are not. Results are printed as a stage x scale
+table, with the scaling exponent of the time between consecutive scales
+(1.0 is linear in the rows), and written as JSON. `--compare` checks them
+against an earlier JSON and exits with status 1 when a stage got slower by
+more than `--tolerance`.
+
+    python benchmarks/bench_pipeline.py --scales 1 10 100 --output bench_pipeline.json
+    python benchmarks/bench_pipeline.py --scales 1 10 --stages impute_base_price outlier_filtering --repeat 5
+    python benchmarks/bench_pipeline.py --scales 1 10 --compare bench_pipeline.json --tolerance 1.3
+    python benchmarks/bench_pipeline.py --scales 1 10 --format parquet    # train read from parquet shards
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import category_encoders as ce
+except ImportError:  # pragma: no cover - optional dependency
+    ce = None
+
+from retail_demand.imputation import impute_base_price
+from retail_demand.loader import parquet_parts, read_product_data, read_store_data, read_train, table_path
+from retail_demand.outliers import UnitsSketch, flag_outliers
+from retail_demand.product_size import bin_product_size, parse_product_size
+from retail_demand.star import StarSchema
+from retail_demand.synthetic import generate, scaled
+
+SCALES = (1, 10, 100)
+DATA_ROOT = os.path.join(tempfile.gettempdir(), 'bench_pipeline')
+
+
+def one_hot(frame, columns):
+    """The OneHotEncoder of the notebooks, or get_dummies without category_encoders."""
+    if ce is not None:
+        return ce.OneHotEncoder(cols=columns).fit_transform(frame)
+    return pd.get_dummies(frame, columns=columns, dtype=np.uint8)
+
+
+# every stage takes the outputs so far and returns the ones it adds or replaces, without changing its inputs
+def load_csv(data):
+    return {
+        'train': read_train(data_dir=data['data_dir'], parse_dates=False, use_cache=False),
+        'product_data': read_product_data(data_dir=data['data_dir'], use_cache=False),
+        'store_data': read_store_data(data_dir=data['data_dir'], use_cache=False),
+    }
+
+
+def null_checks(data):
+    return {'nulls': {name: data[name].isna().sum() for name in ('train', 'product_data', 'store_data')}}
+
+
+def impute_base_price_stage(data):
+    sub_category = data['product_data'].set_index('UPC')['SUB_CATEGORY']
+    return {'train': data['train'].assign(BASE_PRICE=impute_base_price(data['train'], sub_category=sub_category))}
+
+
+def product_size_binning(data):
+    product_data = data['product_data']
+    sizes = parse_product_size(product_data['PRODUCT_SIZE'])
+    binned, _ = bin_product_size(product_data['CATEGORY'], sizes['SIZE'])
+    return {'product_data': product_data.assign(PRODUCT_SIZE=binned)}
+
+
+def one_hot_encoding(data):
+    product_data = data['product_data'].drop(columns=['DESCRIPTION'])
+    store_data = data['store_data'].drop(columns=['STORE_NAME', 'ADDRESS_CITY_NAME'])
+    store_data = store_data.assign(SEG_VALUE_NAME=store_data['SEG_VALUE_NAME'].astype(str).map(
+        {'VALUE': 1, 'MAINSTREAM': 2, 'UPSCALE': 3}))
+    return {
+        'product_data': one_hot(product_data, ['MANUFACTURER', 'CATEGORY', 'SUB_CATEGORY']),
+        'store_data': one_hot(store_data, ['ADDRESS_STATE_PROV_CODE', 'MSA_CODE']),
+    }
+
+
+def outlier_filtering(data):
+    train = data['train']
+    sketch = UnitsSketch().update(train)
+    return {'train': train[~flag_outliers(train, sketch)]}
+
+
+def merge(data):
+    merged = data['train'].merge(data['product_data'], on='UPC', how='left')
+    return {'merged': merged.merge(data['store_data'], left_on='STORE_NUM', right_on='STORE_ID', how='left')}
+
+
+def star_schema(data):
+    return {'star': StarSchema(data['train'], data['product_data'], data['store_data'])}
+
+
+def weekly_aggregations(data):
+    train = data['train']
+    return {'aggregates': {
+        'weekly_demand': train.groupby('WEEK_END_DATE', observed=True)['UNITS'].sum(),
+        'grouped_weekly_sales': train.groupby(['WEEK_END_DATE', 'STORE_NUM'], observed=True)['UNITS'].sum(),
+        'store_agg_data': train.groupby('STORE_NUM')['UNITS'].sum(),
+        'avg_price': train.groupby(['STORE_NUM', 'UPC'])['BASE_PRICE'].mean(),
+    }}
+
+
+def csv_write(data):
+    out_dir = os.path.join(data['data_dir'], 'output')
+    os.makedirs(out_dir, exist_ok=True)
+    data['train'].to_csv(os.path.join(out_dir, 'updated_train_data.csv'), index=False)
+    data['product_data'].to_csv(os.path.join(out_dir, 'updated_product_data.csv'), index=False)
+    data['store_data'].to_csv(os.path.join(out_dir, 'updated_store_data.csv'), index=False)
+    return {}
+
+
+STAGES = [
+    ('load_csv', load_csv),
+    ('null_checks', null_checks),
+    ('impute_base_price', impute_base_price_stage),
+    ('product_size_binning', product_size_binning),
+    ('one_hot_encoding', one_hot_encoding),
+    ('outlier_filtering', outlier_filtering),
+    ('merge', merge),
+    ('star_schema', star_schema),
+    ('weekly_aggregations', weekly_aggregations),
+    ('csv_write', csv_write),
+]
+
+
+def dataset(scale, data_root=DATA_ROOT, workers=None, file_format='csv'):
+    """Directory of the synthetic tables of `scale`, generated on first use."""
+    data_dir = os.path.join(data_root, 'scale_{:g}{}'.format(scale, '' if file_format == 'csv' else '_' + file_format))
+    if not (os.path.exists(table_path('train', data_dir)) or parquet_parts('train', data_dir)):
+        generate(data_dir, scaled(scale), workers=workers, file_format=file_format)
+    return data_dir
+
+
+def measure(stage, data, repeat):
+    """Best wall time of `repeat` runs, the peak traced memory of one more run, and the outputs."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = stage(data)
+        timings.append(time.perf_counter() - start)
+        del outputs
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    outputs = stage(data)
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return min(timings), peak, outputs
+
+
+def run_scale(scale, stages=None, repeat=3, data_root=DATA_ROOT, workers=None, file_format='csv'):
+    """One result dict per timed stage; stages not in `stages` only run for their outputs."""
+    data = {'data_dir': dataset(scale, data_root, workers, file_format)}
+    results = []
+    for name, stage in STAGES:
+        if stages is not None and name not in stages:
+            data.update(stage(data))
+            continue
+        seconds, peak, outputs = measure(stage, data, repeat)
+        data.update(outputs)
+        results.append({'scale': scale, 'rows': len(data['train']), 'stage': name, 'seconds': seconds,
+                        'peak_mb': peak / 2 ** 20})
+        print('  {:>6g}x  {:<22} {:9.3f} s  {:9.1f} MB'.format(scale, name, seconds, peak / 2 ** 20), flush=True)
+    return results
+
+
+def summary(results):
+    """Stage x scale tables of seconds and peak MB, and the scaling exponent of the time."""
+    frame = pd.DataFrame(results)
+    order = [name for name, _ in STAGES if name in set(frame['stage'])]
+    seconds = frame.pivot(index='stage', columns='scale', values='seconds').reindex(order)
+    peak = frame.pivot(index='stage', columns='scale', values='peak_mb').reindex(order)
+    rows = frame.groupby('scale')['rows'].first()
+    exponents = pd.DataFrame(index=seconds.index)
+    for low, high in zip(rows.index[:-1], rows.index[1:]):
+        exponents['{:g}x->{:g}x'.format(low, high)] = (np.log(seconds[high] / seconds[low])
+                                                      / np.log(rows[high] / rows[low]))
+    return seconds, peak, exponents
+
+
+def regressions(results, baseline, tolerance):
+    """Stages at least `tolerance` times slower than in `baseline`, at the scales both have."""
+    before = {(result['scale'], result['stage']): result['seconds'] for result in baseline['results']}
+    slower = []
+    for result in results:
+        previous = before.get((result['scale'], result['stage']))
+        if previous and result['seconds'] > tolerance * previous:
+            slower.append(dict(result, baseline_seconds=previous, ratio=result['seconds'] / previous))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=float, nargs='+', default=list(SCALES))
+    parser.add_argument('--stages', nargs='+', choices=[name for name, _ in STAGES], help='all by default')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of every stage, the best is kept')
+    parser.add_argument('--data-root', default=DATA_ROOT, help='where the synthetic tables are generated')
+    parser.add_argument('--workers', type=int, default=None, help='processes generating the tables')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='file format of the train table')
+    parser.add_argument('--output', default='bench_pipeline.json')
+    parser.add_argument('--compare', help='JSON of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown reported as a regression')
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        print('scale {:g}x'.format(scale), flush=True)
+        results.extend(run_scale(scale, args.stages, args.repeat, args.data_root, args.workers, args.format))
+
+    seconds, peak, exponents = summary(results)
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.3f}'.format):
+        print('\nseconds\n{}\n\npeak MB\n{}'.format(seconds, peak))
+        if len(exponents.columns):
+            print('\nscaling exponent of the time\n{}'.format(exponents))
+
+    report = {
+        'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+        'machine': platform.platform(), 'cpus': os.cpu_count(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': args.repeat, 'format': args.format, 'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('\nwrote {} results to {}'.format(len(results), args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for result in slower:
+            print('REGRESSION {scale:g}x {stage}: {seconds:.3f} s vs {baseline_seconds:.3f} s ({ratio:.2f}x)'.format(
+                **result))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
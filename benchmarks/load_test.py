@@ -0,0 +1,104 @@
+"""
+Load test of a running forecast_service.py.
+
+`--concurrency` clients keep one connection each and send POST /forecast
+requests for random (STORE_NUM, UPC) series of the history, one after the
+other, until `--requests` requests are done or `--duration` seconds have
+passed. The client-side p50 / p99 latency and throughput are printed next
+to the /metrics of the service for the same run. `--series` limits the
+requests to a few series, so repeated questions can be answered from the
+forecast cache of the service.
+
+    python -m retail_demand forecast_service --history updated_train_data.csv --models segment_models.pkl &
+    python benchmarks/load_test.py --history updated_train_data.csv --concurrency 64 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+HOST = '127.0.0.1'
+PORT = 8080
+
+
+async def call(reader, writer, method, path, payload=None, host=HOST):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write('{} {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'.format(
+        method, path, host, len(body)).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length)) if length else None
+
+
+async def client(host, port, keys, items, deadline, remaining, latencies, statuses, seed):
+    rng = np.random.default_rng(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while remaining[0] > 0 and time.perf_counter() < deadline:
+            remaining[0] -= 1
+            picked = keys[rng.integers(len(keys), size=items)]
+            payload = [{'STORE_NUM': int(store), 'UPC': int(upc), 'FEATURE': int(rng.random() < 0.1),
+                        'DISPLAY': int(rng.random() < 0.1)} for store, upc in picked]
+            start = time.perf_counter()
+            status, _ = await call(reader, writer, 'POST', '/forecast', payload if items > 1 else payload[0], host)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run(args, keys):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    await call(reader, writer, 'POST', '/metrics/reset', host=args.host)
+
+    latencies, statuses, remaining = [], {}, [args.requests]
+    start = time.perf_counter()
+    await asyncio.gather(*[client(args.host, args.port, keys, args.items, start + args.duration, remaining,
+                                  latencies, statuses, seed) for seed in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    _, metrics = await call(reader, writer, 'GET', '/metrics', host=args.host)
+    writer.close()
+    return np.asarray(latencies), statuses, elapsed, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', default='updated_train_data.csv', help='CSV whose series are requested')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--concurrency', type=int, default=32, help='clients sending at the same time')
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds at most')
+    parser.add_argument('--items', type=int, default=1, help='series per request')
+    parser.add_argument('--series', type=int, help='only request this many series')
+    args = parser.parse_args()
+
+    keys = pd.read_csv(args.history, usecols=['STORE_NUM', 'UPC']).drop_duplicates().values
+    keys = keys[:args.series] if args.series else keys
+    latencies, statuses, elapsed, metrics = asyncio.run(run(args, keys))
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print('client : {:,} requests in {:.2f} s, {:,.0f} requests/s, p50 {:.2f} ms, p99 {:.2f} ms, status {}'.format(
+        len(latencies), elapsed, len(latencies) / elapsed, p50, p99, statuses))
+    print('service: {:,.0f} requests/s, p50 {:.2f} ms, p99 {:.2f} ms, {:,} batches of {:.1f} items on average'.format(
+        metrics['throughput_rps'], metrics['latency_p50_ms'], metrics['latency_p99_ms'], metrics['batches'],
+        metrics['mean_batch_size']))
+    if 'cache' in metrics:
+        print('cache  : hit rate {:.1%}, {:,} entries, {:,} bytes'.format(
+            metrics['cache']['hit_rate'], metrics['cache']['entries'], metrics['cache']['bytes']))
+
+
+if __name__ == '__main__':
+    main()
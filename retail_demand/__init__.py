@@ -0,0 +1,46 @@
+"""
+Retail demand prediction pipeline: loading, preprocessing, features, models,
+serving and the EDA figures.
+
+Submodules and the names below are imported on first access, so importing
+the package costs nothing and a command only pays for the modules it uses:
+
+    import retail_demand
+    train = retail_demand.read_train()            # imports retail_demand.loader
+    from retail_demand.transformer import PreprocessingTransformer
+
+The command line is `python -m retail_demand <command>`, see __main__.py.
+"""
+import importlib
+
+SUBMODULES = (
+    'baselines', 'cache', 'coverage', 'cube', 'downsample', 'forecast_cache', 'forecast_service', 'imputation',
+    'incremental', 'instrumentation', 'loader', 'outliers', 'preprocessing', 'product_size', 'profiling', 'report',
+    'segment_training', 'series_index', 'star', 'streaming', 'synthetic', 'temporal_features', 'transformer',
+)
+
+# name -> submodule it is imported from
+EXPORTS = {
+    'read_train': 'loader',
+    'read_product_data': 'loader',
+    'read_store_data': 'loader',
+    'impute_base_price': 'imputation',
+    'preprocess': 'preprocessing',
+    'PreprocessingTransformer': 'transformer',
+    'StageRecorder': 'instrumentation',
+    'StarSchema': 'star',
+}
+
+__all__ = list(SUBMODULES) + list(EXPORTS)
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name in EXPORTS:
+        return getattr(importlib.import_module('.' + EXPORTS[name], __name__), name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,53 @@
+"""
+Command line of the pipeline:
+
+    python -m retail_demand <command> [options]
+    python -m retail_demand preprocessing --data-dir dataset
+    python -m retail_demand report --out report
+    python -m retail_demand <command> --help
+
+Every command is the main() of the module of the same name, which is only
+imported when the command runs: `preprocessing` does not import the
+service, the figures or category_encoders before its encoding stages.
+"""
+import importlib
+import sys
+
+# command -> what it does; the module of the same name has the main()
+COMMANDS = {
+    'preprocessing': 'clean, encode and write the train, product and store tables',
+    'streaming': 'impute and filter the train data chunk by chunk',
+    'incremental': 'append a new week of train data to the outputs',
+    'temporal_features': 'lag, rolling and promotion features of every series',
+    'baselines': 'baseline forecasts of every series and their scores',
+    'segment_training': 'one model per segment, trained in a process pool',
+    'forecast_service': 'serve next-week forecasts over HTTP',
+    'report': 'render the EDA figures headless',
+    'synthetic': 'generate synthetic train, product and store tables',
+    'instrumentation': 'print the stage table of a pipeline run report',
+}
+
+
+def usage():
+    width = max(len(command) for command in COMMANDS)
+    lines = ['usage: python -m retail_demand <command> [options]', '', 'commands:']
+    lines += ['  {:<{}}  {}'.format(command, width, text) for command, text in COMMANDS.items()]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return
+    command = argv[0]
+    if command not in COMMANDS:
+        sys.exit('unknown command {!r}\n\n{}'.format(command, usage()))
+    module = importlib.import_module('.' + command, __package__)
+    # the module's argparse reads sys.argv and names itself after argv[0]
+    sys.argv = ['python -m retail_demand ' + command] + argv[1:]
+    module.main()
+
+
+if __name__ == '__main__':
+    main()
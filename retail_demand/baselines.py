@@ -0,0 +1,230 @@
+"""
+Baseline forecasts of every (STORE_NUM, UPC) series, fitted as matrix
+operations over the whole panel.
+
+The panel is the (series x week) matrix of `temporal_features.series_matrix`,
+one row per series and NaN for the weeks a series has no row. Every
+forecaster takes the matrix and returns a (series x horizon) matrix, fitting
+all series in one call. Recursive methods loop over the weeks once, never
+over the series:
+
+- naive: the last observed value;
+- seasonal naive: the value one season (52 weeks) earlier, the naive value
+  when that week has no row;
+- moving average: the mean of the last `window` observed values;
+- SES and Holt: exponential smoothing, with the smoothing parameters of
+  every series picked from a grid by the one-step-ahead squared error
+  (all grid points are run side by side);
+- Croston: for the intermittent series, with the weeks without a row taken
+  as weeks without demand, since the rows with UNITS == 0 are dropped.
+
+SES, Holt and the naive methods skip the weeks without a row.
+
+    forecasts = baseline_forecasts(data, horizon=4)   # one row per series and week ahead
+    errors = evaluate(data, holdout=4)                 # MAE / RMSE of every method on the last 4 weeks
+
+    python -m retail_demand baselines --input updated_train_data.csv --horizon 1 --output baseline_forecasts.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from .loader import DATE_FORMAT
+from .temporal_features import series_matrix
+
+SEASON = 52
+WINDOW = 4
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+BETAS = (0.01, 0.05, 0.1, 0.2, 0.3)
+CROSTON_ALPHA = 0.1
+# series forecast at once, keeps the smoothing grids of a block in cache
+BLOCK = 2048
+
+
+def last_observed(y):
+    """Last observed value of every series, NaN for series without any."""
+    observed = ~np.isnan(y)
+    last = np.where(observed, np.arange(y.shape[1]), -1).max(axis=1) if y.shape[1] else np.full(len(y), -1)
+    values = y[np.arange(len(y)), np.maximum(last, 0)] if y.shape[1] else np.full(len(y), np.nan)
+    return np.where(last >= 0, values, np.nan)
+
+
+def repeat(values, horizon):
+    return np.repeat(values[:, None], horizon, axis=1)
+
+
+def naive(y, horizon=1):
+    return repeat(last_observed(y), horizon)
+
+
+def seasonal_naive(y, horizon=1, season=SEASON):
+    n_weeks = y.shape[1]
+    fallback = last_observed(y)
+    forecast = np.empty((len(y), horizon))
+    for h in range(horizon):
+        # week n_weeks + h repeats week n_weeks + h - season, or the same week of an earlier season
+        week = n_weeks + h - season * ((h // season) + 1)
+        value = y[:, week] if 0 <= week < n_weeks else np.full(len(y), np.nan)
+        forecast[:, h] = np.where(np.isnan(value), fallback, value)
+    return forecast
+
+
+def moving_average(y, horizon=1, window=WINDOW):
+    observed = ~np.isnan(y)
+    # number of observed weeks from every week to the end
+    remaining = np.cumsum(observed[:, ::-1], axis=1)[:, ::-1]
+    used = observed & (remaining <= window)
+    count = used.sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        mean = np.where(used, y, 0).sum(axis=1) / count
+    return repeat(np.where(count > 0, mean, np.nan), horizon)
+
+
+def first_observed(y):
+    """Week and value of the first observation of every series; week n_weeks and value 0 for series without any."""
+    observed = ~np.isnan(y)
+    any_observed = observed.any(axis=1)
+    week = observed.argmax(axis=1)
+    value = np.where(any_observed, y[np.arange(len(y)), week], 0.0)
+    return np.where(any_observed, week, y.shape[1]), value
+
+
+def pick(values, errors):
+    """Per series, the value of the grid point with the smallest error, and its position in the grid."""
+    best = np.argmin(errors, axis=1)
+    return values[np.arange(len(values)), best], best
+
+
+def ses(y, horizon=1, alphas=ALPHAS):
+    """Simple exponential smoothing; a scalar or one-element `alphas` fixes the smoothing parameter."""
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=np.float64))
+    # every series starts at its first observation; later weeks with a row update the level
+    start, first = first_observed(y)
+    values = np.nan_to_num(y)
+    updates = ~np.isnan(y) & (np.arange(y.shape[1]) > start[:, None])
+    level = np.repeat(first[:, None], len(alphas), axis=1)
+    errors = np.zeros(level.shape)
+    for t in range(y.shape[1]):
+        error = (values[:, t, None] - level) * updates[:, t, None]
+        errors += error * error
+        level += alphas * error
+    level, _ = pick(level, errors)
+    return repeat(np.where(start < y.shape[1], level, np.nan), horizon)
+
+
+def holt(y, horizon=1, alphas=ALPHAS, betas=BETAS):
+    """
+    Holt's linear trend method. A week without a row advances the level by
+    the trend without updating either.
+    """
+    # the grid of (alpha, beta) pairs, flattened
+    alphas, betas = [grid.reshape(-1) for grid in np.meshgrid(np.atleast_1d(alphas).astype(np.float64),
+                                                               np.atleast_1d(betas).astype(np.float64),
+                                                               indexing='ij')]
+    start, first = first_observed(y)
+    values = np.nan_to_num(y)
+    updates = ~np.isnan(y) & (np.arange(y.shape[1]) > start[:, None])
+    # the level does not move before the first observation, where the trend is still 0
+    level = np.repeat(first[:, None], len(alphas), axis=1)
+    trend = np.zeros(level.shape)
+    errors = np.zeros(level.shape)
+    gain = alphas * betas
+    for t in range(y.shape[1]):
+        # with e the one-step error: level' = level + trend + alpha * e and
+        # trend' = beta * (level' - level) + (1 - beta) * trend = trend + alpha * beta * e
+        error = (values[:, t, None] - level - trend) * updates[:, t, None]
+        errors += error * error
+        level += trend + alphas * error
+        trend += gain * error
+    level, best = pick(level, errors)
+    trend = trend[np.arange(len(y)), best]
+    forecast = level[:, None] + trend[:, None] * np.arange(1, horizon + 1)
+    return np.where(start[:, None] < y.shape[1], forecast, np.nan)
+
+
+def croston(y, horizon=1, alpha=CROSTON_ALPHA):
+    """Croston's method: smoothed demand size over smoothed interval between demands."""
+    demand = np.nan_to_num(y, nan=0.0)
+    size = np.full(len(y), np.nan)
+    interval = np.full(len(y), np.nan)
+    weeks = np.zeros(len(y))
+    for t in range(y.shape[1]):
+        weeks += 1
+        value = demand[:, t]
+        positive = value > 0
+        first = positive & np.isnan(size)
+        later = positive & ~first
+        size = np.where(first, value, np.where(later, size + alpha * (value - size), size))
+        interval = np.where(first, weeks, np.where(later, interval + alpha * (weeks - interval), interval))
+        weeks = np.where(positive, 0, weeks)
+    return repeat(size / interval, horizon)
+
+
+BASELINES = {
+    'naive': naive,
+    'seasonal_naive': seasonal_naive,
+    'moving_average': moving_average,
+    'ses': ses,
+    'holt': holt,
+    'croston': croston,
+}
+
+
+def forecast_panel(y, horizon=1, methods=None):
+    """{method: (series x horizon) forecasts} of the panel `y`, `BLOCK` series at a time."""
+    forecasts = {}
+    for name in (methods or BASELINES):
+        blocks = [BASELINES[name](y[start:start + BLOCK], horizon) for start in range(0, len(y), BLOCK)]
+        forecasts[name] = np.concatenate(blocks) if blocks else np.empty((0, horizon))
+    return forecasts
+
+
+def baseline_forecasts(data, horizon=1, measure='UNITS', methods=None):
+    """
+    Forecasts of every method for the `horizon` weeks after the last week of
+    `data`, one row per (STORE_NUM, UPC, WEEK_END_DATE). WEEK_END_DATE is a
+    datetime; `main` writes it in the DATE_FORMAT of train.csv.
+    """
+    panel = series_matrix(data, (measure,))
+    forecasts = forecast_panel(panel.values[measure], horizon, methods)
+    last = panel.weeks[-1]
+    weeks = np.asarray([last + pd.Timedelta(weeks=h) for h in range(1, horizon + 1)])
+    frame = pd.DataFrame({'STORE_NUM': np.repeat(panel.stores, horizon), 'UPC': np.repeat(panel.upcs, horizon),
+                          'WEEK_END_DATE': np.tile(weeks, len(panel.stores))})
+    for name, forecast in forecasts.items():
+        frame[name] = forecast.reshape(-1)
+    return frame
+
+
+def evaluate(data, holdout=4, measure='UNITS', methods=None):
+    """
+    MAE and RMSE of every method forecasting the last `holdout` weeks of
+    `data` from the weeks before, over the held-out cells that have a row.
+    """
+    y = series_matrix(data, (measure,)).values[measure]
+    history, actual = y[:, :-holdout], y[:, -holdout:]
+    observed = ~np.isnan(actual)
+    rows = []
+    for name, forecast in forecast_panel(history, holdout, methods).items():
+        error = (forecast - actual)[observed & ~np.isnan(forecast)]
+        rows.append({'method': name, 'MAE': np.abs(error).mean(), 'RMSE': np.sqrt((error * error).mean()),
+                     'cells': len(error)})
+    return pd.DataFrame(rows).set_index('method')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', default='updated_train_data.csv')
+    parser.add_argument('--output', default='baseline_forecasts.csv')
+    parser.add_argument('--horizon', type=int, default=1, help='weeks ahead')
+    parser.add_argument('--holdout', type=int, default=4, help='weeks held out to compare the methods')
+    args = parser.parse_args()
+    data = pd.read_csv(args.input)
+    print(evaluate(data, args.holdout))
+    baseline_forecasts(data, args.horizon).to_csv(args.output, index=False, date_format=DATE_FORMAT)
+    print('wrote forecasts for {} weeks to {}'.format(args.horizon, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Content-hashed columnar cache in front of the raw CSV tables.
+
+The first read of a CSV writes a typed, uncompressed Feather (Arrow IPC) copy
+next to it in `<data_dir>/.cache`. Later reads memory-map that copy instead of
+parsing text. Copies are keyed by the content hash of the source file and by
+the schema used to read it, so an edited CSV or a changed schema misses the
+cache and replaces the stale copy.
+
+Hashing a large CSV is not free, so the manifest remembers the hash together
+with the file's size and mtime and the file is only rehashed when either of
+them changes.
+
+pyarrow is optional; without it `available()` is False and the loader reads
+the CSVs directly.
+"""
+import hashlib
+import json
+import os
+
+try:
+    from pyarrow import feather
+except ImportError:  # pragma: no cover - optional dependency
+    feather = None
+
+CACHE_DIR_NAME = '.cache'
+MANIFEST_NAME = 'manifest.json'
+BLOCK_SIZE = 1 << 20
+
+
+class CacheStats(object):
+    """Counters for the reads served by the cache."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        # CSV bytes that were not parsed because a cached copy was read instead
+        self.bytes_saved = 0
+        self.bytes_written = 0
+
+    def report(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'bytes_saved': self.bytes_saved,
+            'bytes_written': self.bytes_written,
+        }
+
+    def __str__(self):
+        report = self.report()
+        return ('cache hits: {hits}  misses: {misses}  hit rate: {hit_rate:.0%}  '
+                'bytes saved: {bytes_saved:,}  bytes written: {bytes_written:,}').format(**report)
+
+
+stats = CacheStats()
+
+
+def available():
+    return feather is not None
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def schema_key(schema):
+    """Short hash of a {column: dtype} schema."""
+    return hashlib.blake2b(json.dumps(schema, sort_keys=True).encode(), digest_size=4).hexdigest()
+
+
+def read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    partial = '{}.{}.tmp'.format(path, os.getpid())
+    with open(partial, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(partial, path)
+
+
+def source_digest(path, manifest):
+    """
+    Content hash of `path`, reusing the manifest entry while size and mtime
+    are unchanged. Returns the hash and whether the manifest was updated.
+    """
+    status = os.stat(path)
+    key = os.path.abspath(path)
+    entry = manifest.get(key)
+    if entry is not None and entry['size'] == status.st_size and entry['mtime_ns'] == status.st_mtime_ns:
+        return entry['digest'], False
+    manifest[key] = {'size': status.st_size, 'mtime_ns': status.st_mtime_ns, 'digest': file_digest(path)}
+    return manifest[key]['digest'], True
+
+
+def cached_read(path, read_csv, schema, columns=None, cache_dir=None):
+    """
+    Return the table at CSV `path`, read through the cache.
+
+    `read_csv()` parses the full CSV with `schema` and is only called on a
+    miss. `columns` selects the columns returned, the cached copy always
+    holds every column of the schema.
+    """
+    cache_dir = cache_dir or os.path.join(os.path.dirname(path), CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = read_manifest(cache_dir)
+    digest, updated = source_digest(path, manifest)
+
+    prefix = os.path.basename(path) + '.'
+    cached = os.path.join(cache_dir, '{}{}.{}.feather'.format(prefix, digest, schema_key(schema)))
+    if os.path.exists(cached):
+        if updated:
+            write_manifest(cache_dir, manifest)
+        stats.hits += 1
+        stats.bytes_saved += os.path.getsize(path)
+        return feather.read_feather(cached, columns=columns, memory_map=True)
+
+    stats.misses += 1
+    data = read_csv()
+    partial = '{}.{}.tmp'.format(cached, os.getpid())
+    feather.write_feather(data, partial, compression='uncompressed')
+    os.replace(partial, cached)
+    stats.bytes_written += os.path.getsize(cached)
+
+    # drop the copies of earlier versions of the file
+    for name in os.listdir(cache_dir):
+        stale = os.path.join(cache_dir, name)
+        if name.startswith(prefix) and name.endswith('.feather') and stale != cached:
+            os.remove(stale)
+    write_manifest(cache_dir, manifest)
+    return data if columns is None else data[list(columns)]
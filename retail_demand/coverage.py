@@ -0,0 +1,188 @@
+"""
+Bitset coverage index of the WEEK_END_DATE x STORE_NUM x UPC grid.
+
+Every (STORE_NUM, UPC) series owns one row of ceil(weeks / 8) bytes, and bit
+w of the row (little bit order, as `np.unpackbits(..., bitorder='little')`
+reads it) is set when the series has a row in week w: 18 bytes per series
+for 142 weeks, 41 kB for the whole grid of the extracts and about 400 MB
+with 100 times the stores and the UPCs. Coverage questions are answered
+with byte-wise ORs and a popcount table instead of drop_duplicates over the
+rows:
+
+    coverage = CoverageIndex.build(train, upcs=product_data['UPC'])
+    coverage.observed(['WEEK_END_DATE', 'STORE_NUM'])   # distinct (week, store) pairs
+    coverage.coverage()                                 # share of the grid with a row
+    coverage.missing_weeks(store, upc)                  # weeks without a row for one series
+    coverage.gaps('STORE_NUM')                          # cells without a row per store
+    coverage.missing_keys()                             # every empty cell
+"""
+import numpy as np
+import pandas as pd
+
+from .cube import AXES, axis_positions
+from .star import key_codes
+
+# number of set bits of every byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+# series unpacked at once, bounds the memory of the per-week counts and the missing keys
+BLOCK = 65536
+
+
+class CoverageIndex(object):
+
+    def __init__(self, weeks, stores, upcs):
+        self.weeks = np.asarray(weeks)
+        self.stores = np.asarray(stores)
+        self.upcs = np.asarray(upcs)
+        self.n_bytes = (len(self.weeks) + 7) // 8
+        self.bits = np.zeros((len(self.stores) * len(self.upcs), self.n_bytes), dtype=np.uint8)
+
+    @classmethod
+    def build(cls, data, weeks=None, stores=None, upcs=None):
+        """
+        Index the rows of `data` (WEEK_END_DATE, STORE_NUM, UPC). The axes are
+        the values observed in `data` unless given, e.g. the UPCs of the
+        product table; rows with keys outside given axes raise KeyError.
+        """
+        axes = [np.unique(data[name].values if axis is None else np.asarray(axis))
+                for name, axis in zip(AXES, (weeks, stores, upcs))]
+        return cls(*axes).update(data)
+
+    @property
+    def shape(self):
+        return len(self.weeks), len(self.stores), len(self.upcs)
+
+    @property
+    def axes(self):
+        return dict(zip(AXES, (self.weeks, self.stores, self.upcs)))
+
+    def series_positions(self, stores, upcs):
+        return (axis_positions(self.stores, stores, 'STORE_NUM') * len(self.upcs)
+                + axis_positions(self.upcs, upcs, 'UPC'))
+
+    def update(self, data):
+        """Set the cells of the rows of `data`."""
+        week = axis_positions(self.weeks, data['WEEK_END_DATE'].values, 'WEEK_END_DATE')
+        series = self.series_positions(data['STORE_NUM'].values, data['UPC'].values)
+        position = np.sort(series * (8 * self.n_bytes) + week)
+        if not len(position):
+            return self
+        byte = position >> 3
+        bit = np.left_shift(1, position & 7).astype(np.uint8)
+        # OR the bits of every byte together, duplicate rows included; sorted, each byte is one run
+        starts = np.flatnonzero(np.append(True, byte[1:] != byte[:-1]))
+        self.bits.reshape(-1)[byte[starts]] |= np.bitwise_or.reduceat(bit, starts)
+        return self
+
+    def has_rows(self, data):
+        """Boolean array marking the rows of `data` whose cell is set; keys outside the axes are unset."""
+        week = key_codes(self.weeks, data['WEEK_END_DATE'].values)
+        store = key_codes(self.stores, data['STORE_NUM'].values)
+        upc = key_codes(self.upcs, data['UPC'].values)
+        known = (week >= 0) & (store >= 0) & (upc >= 0)
+        series = store[known] * len(self.upcs) + upc[known]
+        found = np.zeros(len(week), dtype=bool)
+        found[known] = (self.bits[series, week[known] >> 3] >> (week[known] & 7)) & 1
+        return found
+
+    def series_weeks(self, store, upc):
+        """Boolean array of the weeks in which one (STORE_NUM, UPC) series has a row."""
+        row = self.bits[self.series_positions([store], [upc])[0]]
+        return np.unpackbits(row, count=len(self.weeks), bitorder='little').astype(bool)
+
+    def missing_weeks(self, store, upc):
+        """Weeks without a row for one (STORE_NUM, UPC) series."""
+        return self.weeks[~self.series_weeks(store, upc)]
+
+    def series_counts(self):
+        """Stores x UPCs DataFrame of the number of weeks with a row."""
+        counts = POPCOUNT[self.bits].sum(axis=1, dtype=np.int64)
+        return pd.DataFrame(counts.reshape(len(self.stores), len(self.upcs)),
+                            index=pd.Index(self.stores, name='STORE_NUM'), columns=pd.Index(self.upcs, name='UPC'))
+
+    def week_counts(self, by=None):
+        """
+        Cells with a row in every week: a Series, or a DataFrame of `by`
+        ('STORE_NUM' or 'UPC') x weeks, e.g. the UPCs sold by every store in
+        every week.
+        """
+        n_stores, n_upcs = len(self.stores), len(self.upcs)
+        store_weeks = np.zeros((n_stores, len(self.weeks)), dtype=np.int64)
+        upc_weeks = np.zeros((n_upcs, len(self.weeks)), dtype=np.int64)
+        step = max(1, BLOCK // max(n_upcs, 1))
+        for start in range(0, n_stores, step):
+            rows = self.bits[start * n_upcs:(start + step) * n_upcs]
+            cells = np.unpackbits(rows, axis=1, count=len(self.weeks), bitorder='little')
+            cells = cells.reshape(-1, n_upcs, len(self.weeks))
+            store_weeks[start:start + step] = cells.sum(axis=1, dtype=np.int64)
+            upc_weeks += cells.sum(axis=0, dtype=np.int64)
+
+        weeks = pd.Index(self.weeks, name='WEEK_END_DATE')
+        if by is None:
+            return pd.Series(store_weeks.sum(axis=0), index=weeks)
+        if by == 'STORE_NUM':
+            return pd.DataFrame(store_weeks, index=pd.Index(self.stores, name=by), columns=weeks)
+        if by == 'UPC':
+            return pd.DataFrame(upc_weeks, index=pd.Index(self.upcs, name=by), columns=weeks)
+        raise KeyError('cannot count weeks by {!r}'.format(by))
+
+    def gaps(self, by):
+        """Cells without a row for every value of axis `by` (one of AXES)."""
+        n_weeks, n_stores, n_upcs = self.shape
+        if by == 'WEEK_END_DATE':
+            return n_stores * n_upcs - self.week_counts()
+        counts = self.series_counts()
+        if by == 'STORE_NUM':
+            return n_weeks * n_upcs - counts.sum(axis=1)
+        if by == 'UPC':
+            return n_weeks * n_stores - counts.sum(axis=0)
+        raise KeyError('{!r} is not an axis of the grid'.format(by))
+
+    def cells(self, axes=AXES):
+        """Number of combinations of the values of `axes`."""
+        return int(np.prod([len(self.axes[name]) for name in axes]))
+
+    def observed(self, axes=AXES):
+        """
+        Number of distinct combinations of `axes` that have a row, the length
+        of train[axes].drop_duplicates().
+        """
+        unknown = [name for name in axes if name not in AXES]
+        if unknown:
+            raise KeyError('{} are not axes of the grid'.format(unknown))
+        bits = self.bits.reshape(len(self.stores), len(self.upcs), self.n_bytes)
+        # collapse the store and UPC axes not asked for; a week bit survives when any series has it
+        dropped = tuple(i for i, name in enumerate(AXES[1:]) if name not in axes)
+        if dropped:
+            bits = np.bitwise_or.reduce(bits, axis=dropped, keepdims=True)
+        if 'WEEK_END_DATE' in axes:
+            return int(POPCOUNT[bits].sum(dtype=np.int64))
+        return int(bits.any(axis=2).sum())
+
+    def coverage(self, axes=AXES):
+        """Share of the combinations of `axes` that have a row."""
+        cells = self.cells(axes)
+        return self.observed(axes) / cells if cells else float('nan')
+
+    def iter_missing_keys(self, block=BLOCK):
+        """DataFrames of the (WEEK_END_DATE, STORE_NUM, UPC) cells without a row, `block` series at a time."""
+        n_weeks = len(self.weeks)
+        counts = POPCOUNT[self.bits].sum(axis=1, dtype=np.int64)
+        for start in range(0, len(self.bits), block):
+            # only unpack the series that miss a week
+            rows = start + np.flatnonzero(counts[start:start + block] < n_weeks)
+            if not len(rows):
+                continue
+            cells = np.unpackbits(self.bits[rows], axis=1, count=n_weeks, bitorder='little')
+            row, week = np.nonzero(cells == 0)
+            series = rows[row]
+            yield pd.DataFrame({'WEEK_END_DATE': self.weeks[week],
+                                'STORE_NUM': self.stores[series // len(self.upcs)],
+                                'UPC': self.upcs[series % len(self.upcs)]})
+
+    def missing_keys(self, block=BLOCK):
+        """DataFrame of every (WEEK_END_DATE, STORE_NUM, UPC) cell without a row."""
+        frames = list(self.iter_missing_keys(block))
+        if not frames:
+            return pd.DataFrame({name: axis[:0] for name, axis in self.axes.items()})
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,177 @@
+"""
+Dense WEEK_END_DATE x STORE_NUM x UPC demand cube stored as .npy files.
+
+`build_cube` turns the long train table into one array per measure (UNITS,
+BASE_PRICE, FEATURE, DISPLAY) plus a PRESENT mask of the cells that have a
+row, and the three sorted axes. `DemandCube` opens the arrays with
+`np.memmap`, so a series, store slice or week slice is a zero-copy view and
+worker processes that open the same directory share the pages.
+
+    from retail_demand.cube import DemandCube
+    cube = DemandCube('cube')
+    units = cube.series(store, upc)                 # weekly UNITS of one store and UPC
+    prices = cube.store_slice(store, 'BASE_PRICE')  # weeks x UPCs
+
+The cells without a row hold 0 (NaN for BASE_PRICE), so aggregates over the
+cube go through `totals` and `means`, which only count the PRESENT cells and
+match a groupby over the rows:
+
+    avg_price = cube.means('BASE_PRICE', by=['STORE_NUM', 'UPC'])  # stores x UPCs
+    weekly_units = cube.means('UNITS', by=['WEEK_END_DATE'])
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .loader import DATA_DIR, iter_table
+
+AXES = ['WEEK_END_DATE', 'STORE_NUM', 'UPC']
+
+# measure -> (dtype, value of the cells without a row)
+MEASURES = {
+    'UNITS': (np.int32, 0),
+    'BASE_PRICE': (np.float32, np.nan),
+    'FEATURE': (np.uint8, 0),
+    'DISPLAY': (np.uint8, 0),
+}
+
+CHUNKSIZE = 500000
+
+
+def cube_file(path, name):
+    return os.path.join(path, name + '.npy')
+
+
+def axis_positions(axis, values, name):
+    """Positions of `values` on the sorted `axis`, raising KeyError for values not on it."""
+    values = np.asarray(values)
+    positions = np.searchsorted(axis, values)
+    found = positions < len(axis)
+    found[found] = axis[positions[found]] == values[found]
+    if not found.all():
+        raise KeyError('{} {} is not on the cube axis'.format(name, values[~found][:5]))
+    return positions
+
+
+def write_cube(path, axes, chunks):
+    """Create the cube files for `axes` and scatter the rows of every frame in `chunks` into them."""
+    os.makedirs(path, exist_ok=True)
+    for name, axis in zip(AXES, axes):
+        np.save(cube_file(path, name), axis)
+    shape = tuple(len(axis) for axis in axes)
+
+    arrays = {}
+    for name, (dtype, fill) in MEASURES.items():
+        arrays[name] = np.lib.format.open_memmap(cube_file(path, name), mode='w+', dtype=dtype, shape=shape)
+        arrays[name][...] = fill
+    arrays['PRESENT'] = np.lib.format.open_memmap(cube_file(path, 'PRESENT'), mode='w+', dtype=np.bool_,
+                                                  shape=shape)
+    arrays['PRESENT'][...] = False
+
+    for chunk in chunks:
+        cell = tuple(axis_positions(axis, chunk[name].values, name) for name, axis in zip(AXES, axes))
+        for name in MEASURES:
+            arrays[name][cell] = chunk[name].values
+        arrays['PRESENT'][cell] = True
+
+    for array in arrays.values():
+        array.flush()
+    return DemandCube(path)
+
+
+def build_cube(train, path):
+    """Write the cube of the in-memory train table `train` (WEEK_END_DATE parsed) to directory `path`."""
+    axes = [np.unique(train[name].values) for name in AXES]
+    return write_cube(path, axes, [train])
+
+
+def build_cube_from_csv(path, data_dir=DATA_DIR, chunksize=CHUNKSIZE):
+    """Write the cube of train.csv to directory `path` in two chunked passes over the file."""
+    keys = {name: [] for name in AXES}
+    for chunk in iter_table('train', chunksize, columns=AXES, data_dir=data_dir):
+        for name in AXES:
+            keys[name].append(pd.unique(chunk[name].values))
+    axes = [np.unique(np.concatenate(keys[name])) for name in AXES]
+    columns = AXES + list(MEASURES)
+    return write_cube(path, axes, iter_table('train', chunksize, columns=columns, data_dir=data_dir))
+
+
+class DemandCube(object):
+    """Read-only, memory-mapped view of a cube written by `build_cube`."""
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        self.weeks, self.stores, self.upcs = [np.load(cube_file(path, name)) for name in AXES]
+        self.arrays = {name: np.load(cube_file(path, name), mmap_mode=mode) for name in list(MEASURES) + ['PRESENT']}
+
+    # workers reopen the files instead of receiving a copy of the arrays
+    def __getstate__(self):
+        return {'path': self.path, 'mode': self.mode}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['mode'])
+
+    def __getitem__(self, measure):
+        return self.arrays[measure]
+
+    @property
+    def shape(self):
+        return self.arrays['PRESENT'].shape
+
+    def week_index(self, week):
+        return int(axis_positions(self.weeks, [np.datetime64(pd.Timestamp(week))], 'WEEK_END_DATE')[0])
+
+    def store_index(self, store):
+        return int(axis_positions(self.stores, [store], 'STORE_NUM')[0])
+
+    def upc_index(self, upc):
+        return int(axis_positions(self.upcs, [upc], 'UPC')[0])
+
+    def series(self, store, upc, measure='UNITS'):
+        """Weekly values of one (STORE_NUM, UPC) series."""
+        return self.arrays[measure][:, self.store_index(store), self.upc_index(upc)]
+
+    def store_slice(self, store, measure='UNITS'):
+        """Weeks x UPCs values of one store."""
+        return self.arrays[measure][:, self.store_index(store), :]
+
+    def upc_slice(self, upc, measure='UNITS'):
+        """Weeks x stores values of one UPC."""
+        return self.arrays[measure][:, :, self.upc_index(upc)]
+
+    def week_slice(self, week, measure='UNITS'):
+        """Stores x UPCs values of one week."""
+        return self.arrays[measure][self.week_index(week)]
+
+    def reduce(self, measure, by):
+        """Sums and counts of `measure` over the PRESENT cells, per cell of the `by` axes."""
+        keep = [AXES.index(name) for name in by]
+        axis = tuple(i - 1 for i in range(1, len(AXES)) if i not in keep)
+        shape = tuple(n for i, n in enumerate(self.shape) if i in keep)
+        sums, counts = np.zeros(shape), np.zeros(shape, dtype=np.int64)
+        # the week slices are read one at a time; without WEEK_END_DATE in `by` they are added into
+        # arrays of the shape of the result, with it each week fills its own row of the result
+        for week, (values, present) in enumerate(zip(self.arrays[measure], self.arrays['PRESENT'])):
+            if 0 in keep:
+                sums[week] = np.sum(values, axis=axis, dtype=np.float64, where=present)
+                counts[week] = present.sum(axis=axis, dtype=np.int64)
+            else:
+                sums += np.sum(values, axis=axis, dtype=np.float64, where=present)
+                counts += present.sum(axis=axis, dtype=np.int64)
+        return sums, counts
+
+    def totals(self, measure='UNITS', by=('WEEK_END_DATE',)):
+        """Sum of `measure` over the rows of every cell of the `by` axes, an array in the order of AXES."""
+        return self.reduce(measure, by)[0]
+
+    def means(self, measure='UNITS', by=('WEEK_END_DATE',)):
+        """Mean of `measure` over the rows of every cell of the `by` axes, NaN for the cells without rows."""
+        sums, counts = self.reduce(measure, by)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    def coverage(self):
+        """Share of the week x store x UPC cells that have a row."""
+        return float(self.arrays['PRESENT'].mean())
@@ -0,0 +1,138 @@
+"""
+Downsampling of full-population plots.
+
+The outlier checks plot every row: the sorted UNITS curve and the BASE_PRICE
+vs UNITS scatters. Both are reduced to a few thousand marks before drawing,
+without losing the tails the outlier analysis looks at:
+
+- the sorted curve keeps `tail` points at both ends exactly and samples the
+  body either at evenly spaced ranks (quantiles) or with LTTB
+  (Largest-Triangle-Three-Buckets), which keeps the points that shape the
+  curve;
+- a scatter becomes a 2-D histogram drawn as a log-scaled mesh. Points in
+  bins holding at most `sparse` rows are drawn as markers on top, so
+  isolated outliers stay visible as points.
+
+    plot_sorted(plt.gca(), train['UNITS'].values)
+    plot_density(plt.gca(), frame['BASE_PRICE'], frame['UNITS'])
+"""
+from collections import namedtuple
+
+import numpy as np
+
+SORTED_POINTS = 2000
+TAIL_POINTS = 100
+DENSITY_BINS = 200
+# bins with at most this many rows are drawn as individual points
+SPARSE_COUNT = 2
+# bound on the individual points of a density plot, the emptiest bins first
+MAX_POINTS = 5000
+
+Density = namedtuple('Density', ['counts', 'x_edges', 'y_edges', 'x', 'y'])
+
+
+def lttb(x, y, n_out):
+    """
+    Positions of the `n_out` points of (x, y) kept by Largest-Triangle-Three-
+    Buckets. The first and last points are always kept; every bucket in
+    between keeps the point forming the largest triangle with the point kept
+    before it and the mean of the next bucket.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (n_out - 2)
+    edges = (np.arange(n_out - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    # mean of every bucket and of the last point, the third vertex of the triangles
+    bounds = np.append(edges, n)
+    x_sum = np.append(0.0, np.cumsum(x))
+    y_sum = np.append(0.0, np.cumsum(y))
+    size = bounds[1:] - bounds[:-1]
+    x_mean = (x_sum[bounds[1:]] - x_sum[bounds[:-1]]) / size
+    y_mean = (y_sum[bounds[1:]] - y_sum[bounds[:-1]]) / size
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        area = np.abs((x[a] - x_mean[i + 1]) * (y[start:stop] - y[a])
+                      - (x[a] - x[start:stop]) * (y_mean[i + 1] - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def sorted_curve(values, n_points=SORTED_POINTS, tail=TAIL_POINTS, method='quantile'):
+    """
+    Ranks and values of the points drawn for the sorted `values`: the `tail`
+    smallest and largest values and `n_points` points of the body, picked
+    with `method` ('quantile' or 'lttb'). NaN values are dropped.
+    """
+    values = np.sort(np.asarray(values, dtype=np.float64))
+    values = values[~np.isnan(values)]
+    n = len(values)
+    if n <= n_points + 2 * tail:
+        return np.arange(n), values
+
+    if method == 'quantile':
+        body = np.linspace(0, n - 1, n_points).round().astype(np.int64)
+    elif method == 'lttb':
+        body = lttb(np.arange(n), values, n_points)
+    else:
+        raise ValueError('unknown method {!r}, expected quantile or lttb'.format(method))
+    index = np.unique(np.concatenate([np.arange(tail), body, np.arange(n - tail, n)]))
+    return index, values[index]
+
+
+def binned_density(x, y, bins=DENSITY_BINS, sparse=SPARSE_COUNT, max_points=MAX_POINTS):
+    """
+    2-D histogram of the finite (x, y) pairs. The rows of bins holding at most
+    `sparse` rows are returned as points instead of counts, at most
+    `max_points` of them, those of the emptiest bins first.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    x, y = x[finite], y[finite]
+    x_edges = np.histogram_bin_edges(x, bins)
+    y_edges = np.histogram_bin_edges(y, bins)
+
+    # bin of every point, the last edge belongs to the last bin as in np.histogram
+    i = np.clip(np.searchsorted(x_edges, x, side='right') - 1, 0, len(x_edges) - 2)
+    j = np.clip(np.searchsorted(y_edges, y, side='right') - 1, 0, len(y_edges) - 2)
+    cell = i * (len(y_edges) - 1) + j
+    counts = np.bincount(cell, minlength=(len(x_edges) - 1) * (len(y_edges) - 1))
+    count = counts[cell]
+    points = np.flatnonzero(count <= sparse)
+    points = points[np.argsort(count[points], kind='stable')[:max_points]]
+    counts -= np.bincount(cell[points], minlength=len(counts))
+    return Density(counts.reshape(len(x_edges) - 1, len(y_edges) - 1), x_edges, y_edges, x[points], y[points])
+
+
+def plot_sorted(ax, values, n_points=SORTED_POINTS, tail=TAIL_POINTS, method='quantile', s=4, **kwargs):
+    """Scatter the sorted `values` against their rank on `ax`, downsampled with `sorted_curve`."""
+    index, curve = sorted_curve(values, n_points, tail, method)
+    return ax.scatter(index, curve, s=s, **kwargs)
+
+
+def plot_density(ax, x, y, bins=DENSITY_BINS, sparse=SPARSE_COUNT, max_points=MAX_POINTS, cmap='Blues', s=4,
+                 **kwargs):
+    """Draw (x, y) on `ax` as a `binned_density` mesh with the sparse points on top."""
+    return draw_density(ax, binned_density(x, y, bins, sparse, max_points), cmap, s, **kwargs)
+
+
+def draw_density(ax, density, cmap='Blues', s=4, **kwargs):
+    """Draw a `Density` on `ax`; returns the mesh, None when every row is drawn as a point."""
+    from matplotlib.colors import LogNorm
+
+    mesh = None
+    if density.counts.any():
+        mesh = ax.pcolormesh(density.x_edges, density.y_edges, np.ma.masked_equal(density.counts.T, 0),
+                             norm=LogNorm(), cmap=cmap)
+    ax.scatter(density.x, density.y, s=s, **kwargs)
+    return mesh
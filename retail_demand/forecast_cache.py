@@ -0,0 +1,198 @@
+"""
+Two-tier cache of served forecasts, keyed by (STORE_NUM, UPC, WEEK_END_DATE,
+version, variant).
+
+`version` names everything a forecast was computed from: the models and
+their features, and the last week of the history. `variant` holds the
+planned inputs of the request (BASE_PRICE, FEATURE and DISPLAY), because
+the same series and week is forecast differently with and without a
+promotion. Values are stored as JSON bytes.
+
+- memory: an LRU bounded by `max_bytes`, counting each value's bytes plus
+  `ENTRY_OVERHEAD` for its key and bookkeeping;
+- disk (optional): a sqlite table every value is written through to, so
+  the cache survives restarts and memory evictions. A disk hit is promoted
+  back to memory.
+
+When a new week of train data arrives or the models change, the service gets a
+new version and `set_version` drops the entries of every other version from
+both tiers. `invalidate` drops entries by version, week, store or UPC.
+
+    cache = ForecastCache(max_bytes=64 << 20, path='forecast_cache.sqlite', version='3f2a9c:2012-01-11')
+    value = cache.get(key)          # None on a miss
+    cache.put(key, value)
+    cache.invalidate(week='2012-01-11')
+    cache.stats.report()            # hits, disk hits, misses, hit rate, evictions
+"""
+import json
+import sqlite3
+from collections import OrderedDict, namedtuple
+
+MAX_BYTES = 64 << 20
+# bytes of the key tuple, the dict slot and the linked-list node of an entry, measured with sys.getsizeof
+ENTRY_OVERHEAD = 400
+
+CacheKey = namedtuple('CacheKey', ['store', 'upc', 'week', 'version', 'variant'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecasts (
+    store INTEGER, upc INTEGER, week TEXT, version TEXT, variant TEXT, value BLOB,
+    PRIMARY KEY (store, upc, week, version, variant)
+)
+"""
+
+
+def request_variant(request, columns=('BASE_PRICE', 'FEATURE', 'DISPLAY')):
+    """The planned inputs of a request as a string, e.g. '3.49|1|0', with '' for inputs not given."""
+    return '|'.join('' if request.get(name) is None else str(request[name]) for name in columns)
+
+
+class ForecastCacheStats(object):
+    """Counters for the lookups served by the cache."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.evictions = 0
+        self.invalidated = 0
+
+    def report(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'memory_hit_rate': self.hits / lookups if lookups else 0.0,
+            'puts': self.puts,
+            'evictions': self.evictions,
+            'invalidated': self.invalidated,
+        }
+
+    def __str__(self):
+        return ('forecast cache hits: {hits}  disk hits: {disk_hits}  misses: {misses}  '
+                'hit rate: {hit_rate:.0%}  evictions: {evictions}').format(**self.report())
+
+
+class ForecastCache(object):
+
+    def __init__(self, max_bytes=MAX_BYTES, path=None, version=None):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.stats = ForecastCacheStats()
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute(SCHEMA)
+            self.db.commit()
+        self.version = None
+        if version is not None:
+            self.set_version(version)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def key(self, request, week):
+        """Cache key of a request for the series of `request` in `week`, under the current version."""
+        return CacheKey(int(request['STORE_NUM']), int(request['UPC']), week, self.version, request_variant(request))
+
+    def get(self, key):
+        """The cached value of `key`, or None. Memory hits move to the most recently used end."""
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+        if self.db is not None:
+            row = self.db.execute('SELECT value FROM forecasts WHERE store = ? AND upc = ? AND week = ? '
+                                  'AND version = ? AND variant = ?', tuple(key)).fetchone()
+            if row is not None:
+                self.stats.disk_hits += 1
+                self.remember(key, bytes(row[0]))
+                return bytes(row[0])
+        self.stats.misses += 1
+        return None
+
+    def get_json(self, key):
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def remember(self, key, value):
+        """Put `value` in the memory tier, evicting the least recently used entries over the budget."""
+        size = len(value) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old) + ENTRY_OVERHEAD
+        self.entries[key] = value
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= len(evicted) + ENTRY_OVERHEAD
+            self.stats.evictions += 1
+
+    def put_many(self, items):
+        """Cache (key, value) pairs, values as bytes or JSON-serializable objects, in one disk transaction."""
+        rows = []
+        for key, value in items:
+            value = value if isinstance(value, bytes) else json.dumps(value).encode()
+            self.remember(key, value)
+            rows.append(tuple(key) + (value,))
+        self.stats.puts += len(rows)
+        if self.db is not None and rows:
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def invalidate(self, version=None, week=None, store=None, upc=None):
+        """Drop the entries matching every given field from both tiers; returns the number of memory entries."""
+        fields = {name: value for name, value in (('version', version), ('week', week), ('store', store),
+                                                  ('upc', upc)) if value is not None}
+        stale = [key for key in self.entries if all(getattr(key, name) == value for name, value in fields.items())]
+        for key in stale:
+            self.bytes -= len(self.entries.pop(key)) + ENTRY_OVERHEAD
+        if self.db is not None:
+            where = ' AND '.join('{} = ?'.format(name) for name in fields) or '1'
+            with self.db:
+                self.db.execute('DELETE FROM forecasts WHERE ' + where, tuple(fields.values()))
+        self.stats.invalidated += len(stale)
+        return len(stale)
+
+    def set_version(self, version):
+        """Make `version` current and drop the entries of every other version."""
+        self.version = version
+        stale = [key for key in self.entries if key.version != version]
+        for key in stale:
+            self.bytes -= len(self.entries.pop(key)) + ENTRY_OVERHEAD
+        if self.db is not None:
+            with self.db:
+                self.db.execute('DELETE FROM forecasts WHERE version != ?', (version,))
+        self.stats.invalidated += len(stale)
+
+    def clear(self):
+        self.invalidate()
+
+    def report(self):
+        report = self.stats.report()
+        report.update(entries=len(self.entries), bytes=self.bytes, max_bytes=self.max_bytes, version=self.version,
+                      disk=self.db is not None)
+        return report
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,474 @@
+"""
+Local HTTP service for next-week demand forecasts of (STORE_NUM, UPC) series.
+
+At start-up the service reads the preprocessed history (updated_train_data.csv)
+once. It computes the `temporal_features` of the week after the last week of
+every series, the last observed BASE_PRICE of every series and the UPC and
+SUB_CATEGORY fallback prices. It also computes an SES baseline forecast,
+which is served for series whose segment has no model, or when no
+`segment_training.py` models are given.
+
+A request names the series and may give the planned BASE_PRICE, FEATURE and
+DISPLAY of the week. It is encoded as Preprocessing.py encodes the train
+rows: a missing BASE_PRICE falls back to the last observed price of the
+series, then to the UPC and the SUB_CATEGORY averages, and the flags are 0
+or 1.
+
+Concurrent requests are grouped into micro-batches by `MicroBatcher`. A batch
+is scored when it holds `max_batch` items or `window` seconds after its first
+item, with one vectorized predict per segment. The service runs on asyncio
+and the standard library only, and listens on localhost by default.
+
+Answers are kept in a `ForecastCache` keyed by series, week, version and the
+planned inputs, so repeated questions are not scored again. The version
+combines a digest of the models file with the forecast week, so a new
+history week or new models start a fresh cache generation, and the stale
+on-disk entries are dropped at start-up.
+
+    POST /forecast   {"STORE_NUM": 2277, "UPC": 1111009477, "FEATURE": 1}, or a list of such objects
+                  -> {"STORE_NUM": 2277, "UPC": 1111009477, "WEEK_END_DATE": "2012-01-11", "UNITS": 31.2,
+                      "model": "BAG SNACKS"}
+    GET  /metrics    request count, throughput, p50 / p99 latency, the mean batch size and the cache counters
+    POST /metrics/reset
+    GET  /cache      cache counters and size
+    POST /cache/invalidate   {"week": "2012-01-11"}, {"STORE_NUM": 2277}, {"UPC": ...}, {"version": ...} or {}
+    GET  /health
+
+    python -m retail_demand forecast_service --history updated_train_data.csv --models segment_models.pkl --port 8080
+    python -m retail_demand forecast_service --models segment_models.pkl --cache-mb 256 --cache-path cache.sqlite
+    python benchmarks/load_test.py --port 8080 --concurrency 64 --requests 20000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import pickle
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from .baselines import forecast_panel
+from .forecast_cache import MAX_BYTES, ForecastCache
+from .imputation import fallback_prices, last_observed_price, price_totals, series_key
+from .loader import DATA_DIR, read_product_data, read_store_data
+from .segment_training import add_segment_columns
+from .temporal_features import FLAGS, feature_matrices, series_matrix
+
+HOST = '127.0.0.1'
+PORT = 8080
+MAX_BATCH = 256
+# seconds a batch waits for more requests after its first one
+WINDOW = 0.002
+# latencies kept for the percentiles, and the span of the recent throughput
+LATENCY_SAMPLES = 100000
+THROUGHPUT_WINDOW = 10.0
+MAX_BODY = 1 << 20
+
+# columns a request may give, and their value when it does not
+REQUEST_COLUMNS = {'BASE_PRICE': np.nan, 'FEATURE': 0, 'DISPLAY': 0}
+BASELINE = 'ses'
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+class Forecaster(object):
+    """The history-derived state of the service, scoring a batch of requests at once."""
+
+    def __init__(self, history, models=None, product_data=None, store_data=None, sub_category=None):
+        models = models or {'segments': [], 'features': [], 'models': {}}
+        matrix = series_matrix(history, ('UNITS',) + FLAGS)
+        # one empty week after the history: its features only use the history
+        padded = {name: np.concatenate([values, np.full((len(values), 1), np.nan)], axis=1)
+                  for name, values in matrix.values.items()}
+        self.keys = series_key(matrix.stores, matrix.upcs)
+        self.week = (matrix.weeks[-1] + pd.Timedelta(weeks=1)).strftime('%Y-%m-%d')
+
+        self.features = list(models['features'])
+        temporal = [name for name in self.features if name not in REQUEST_COLUMNS]
+        computed = {name: feature[:, -1] for name, feature in feature_matrices(matrix._replace(values=padded), FLAGS)
+                    if name in temporal}
+        unknown = [name for name in temporal if name not in computed]
+        if unknown:
+            raise ValueError('the models use features the service cannot compute: {}'.format(unknown))
+        self.temporal = np.column_stack([computed[name] for name in temporal]) if temporal else None
+        self.temporal_names = temporal
+
+        self.last_price = last_observed_price(history)
+        self.fallback = fallback_prices(price_totals(history), sub_category)
+        self.baseline = forecast_panel(matrix.values['UNITS'], 1, [BASELINE])[BASELINE][:, 0]
+
+        # the segment of every series, as an index into self.models (-1 without a model)
+        segments = list(models['segments'])
+        self.segment_names = list(models['models'])
+        self.models = [models['models'][name] for name in self.segment_names]
+        self.codes = np.full(len(self.keys), -1)
+        if segments:
+            series = add_segment_columns(pd.DataFrame({'STORE_NUM': matrix.stores, 'UPC': matrix.upcs}), segments,
+                                         product_data, store_data)
+            labels = series[segments].itertuples(index=False)
+            position = {name: i for i, name in enumerate(self.segment_names)}
+            self.codes = np.array([position.get(tuple(label) if len(segments) > 1 else label[0], -1)
+                                   for label in labels], dtype=np.int64)
+
+    def encode(self, requests):
+        """Feature matrix of the requests, and the position of every request's series (-1 when unknown)."""
+        frame = pd.DataFrame(requests, columns=['STORE_NUM', 'UPC'] + list(REQUEST_COLUMNS))
+        key = series_key(frame['STORE_NUM'], frame['UPC'])
+        position = np.minimum(np.searchsorted(self.keys, key), max(len(self.keys) - 1, 0))
+        known = self.keys[position] == key if len(self.keys) else np.zeros(len(key), dtype=bool)
+
+        columns = {}
+        for name, default in REQUEST_COLUMNS.items():
+            columns[name] = pd.to_numeric(frame[name], errors='coerce').fillna(default).to_numpy(np.float64, copy=True)
+        # BASE_PRICE as Preprocessing.py imputes it: last price of the series, then the UPC and SUB_CATEGORY averages
+        price = columns['BASE_PRICE']
+        gap = np.isnan(price)
+        price[gap] = self.last_price.reindex(key[gap]).values
+        gap = np.isnan(price)
+        price[gap] = self.fallback.reindex(np.asarray(frame['UPC'])[gap]).values
+        for flag in ('FEATURE', 'DISPLAY'):
+            columns[flag] = (columns[flag] > 0).astype(np.float64)
+
+        X = np.empty((len(frame), len(self.features)))
+        for j, name in enumerate(self.features):
+            if name in columns:
+                X[:, j] = columns[name]
+            else:
+                X[:, j] = self.temporal[position, self.temporal_names.index(name)]
+        return X, np.where(known, position, -1)
+
+    def score(self, requests):
+        """One response dict per request."""
+        X, position = self.encode(requests)
+        known = position >= 0
+        forecast = np.full(len(requests), np.nan)
+        forecast[known] = self.baseline[position[known]]
+        codes = np.where(known, self.codes[np.maximum(position, 0)], -1)
+        for code in np.unique(codes[codes >= 0]):
+            rows = codes == code
+            forecast[rows] = self.models[code].predict(X[rows])
+        # a linear model can go below zero
+        forecast = np.maximum(forecast, 0)
+
+        responses = []
+        for i, request in enumerate(requests):
+            response = {'STORE_NUM': request.get('STORE_NUM'), 'UPC': request.get('UPC')}
+            if not known[i]:
+                response['error'] = 'unknown series'
+            else:
+                response.update(WEEK_END_DATE=self.week, UNITS=float(forecast[i]),
+                                model=str(self.segment_names[codes[i]]) if codes[i] >= 0 else BASELINE)
+            responses.append(response)
+        return responses
+
+
+class ServiceMetrics(object):
+    """Latencies of the last `size` requests and the counters behind /metrics."""
+
+    def __init__(self, size=LATENCY_SAMPLES):
+        self.latencies = np.zeros(size)
+        self.finished = np.zeros(size)
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.items = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.batch_sizes = deque(maxlen=1000)
+
+    def record(self, seconds, items=1, error=False):
+        slot = self.requests % len(self.latencies)
+        self.latencies[slot] = seconds
+        self.finished[slot] = time.perf_counter()
+        self.requests += 1
+        self.items += items
+        self.errors += bool(error)
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batched_items += size
+        self.batch_sizes.append(size)
+
+    def snapshot(self):
+        now = time.perf_counter()
+        uptime = now - self.started
+        latencies = self.latencies[:min(self.requests, len(self.latencies))]
+        finished = self.finished[:len(latencies)]
+        window = min(THROUGHPUT_WINDOW, uptime)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if len(latencies) else (float('nan'),) * 2
+        return {
+            'uptime_s': round(uptime, 3),
+            'requests': self.requests,
+            'items': self.items,
+            'errors': self.errors,
+            'throughput_rps': self.requests / uptime if uptime > 0 else 0.0,
+            'recent_throughput_rps': int((finished > now - window).sum()) / window if window > 0 else 0.0,
+            'latency_p50_ms': float(p50),
+            'latency_p99_ms': float(p99),
+            'batches': self.batches,
+            'mean_batch_size': self.batched_items / self.batches if self.batches else 0.0,
+            'recent_max_batch_size': max(self.batch_sizes) if self.batch_sizes else 0,
+        }
+
+
+class MicroBatcher(object):
+    """
+    Collects the items submitted by concurrent requests and scores them
+    together: a batch closes when it holds `max_batch` items or `window`
+    seconds after its first item arrived.
+    """
+
+    def __init__(self, score, max_batch=MAX_BATCH, window=WINDOW, metrics=None):
+        self.score = score
+        self.max_batch = max_batch
+        self.window = window
+        self.metrics = metrics
+        self.queue = asyncio.Queue()
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((item, future))
+        return await future
+
+    async def collect(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.window
+        while len(batch) < self.max_batch:
+            # take what is already queued, then wait for the rest of the window
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            remaining = deadline - asyncio.get_running_loop().time()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        while True:
+            batch = await self.collect()
+            try:
+                results = self.score([item for item, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            if self.metrics is not None:
+                self.metrics.record_batch(len(batch))
+
+
+class HttpError(Exception):
+
+    def __init__(self, status, message):
+        super(HttpError, self).__init__(message)
+        self.status = status
+
+
+async def read_request(reader):
+    """(method, path, headers, body) of the next request on the connection, None when it is closed."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HttpError(400, 'malformed request line')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0) or 0)
+    if length > MAX_BODY:
+        raise HttpError(413, 'request body over {} bytes'.format(MAX_BODY))
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?', 1)[0], headers, body
+
+
+def http_response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    head = 'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+        status, REASONS.get(status, ''), len(body), 'keep-alive' if keep_alive else 'close')
+    return head.encode('latin-1') + body
+
+
+class ForecastService(object):
+
+    def __init__(self, forecaster, max_batch=MAX_BATCH, window=WINDOW, cache=None):
+        self.forecaster = forecaster
+        self.metrics = ServiceMetrics()
+        self.batcher = MicroBatcher(forecaster.score, max_batch, window, self.metrics)
+        self.cache = cache
+
+    async def answer(self, items):
+        """Responses to `items`, from the cache where possible; the rest is scored and cached."""
+        if self.cache is None:
+            return await asyncio.gather(*[self.batcher.submit(item) for item in items])
+        keys = [self.cache.key(item, self.forecaster.week) for item in items]
+        results = [self.cache.get_json(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        scored = await asyncio.gather(*[self.batcher.submit(items[i]) for i in missing])
+        for i, result in zip(missing, scored):
+            results[i] = result
+        # unknown series are not cached, they may appear with the next history
+        self.cache.put_many([(keys[i], results[i]) for i in missing if 'error' not in results[i]])
+        return results
+
+    async def forecast(self, body):
+        try:
+            payload = json.loads(body or b'null')
+        except ValueError:
+            raise HttpError(400, 'body is not JSON')
+        items = payload if isinstance(payload, list) else [payload]
+        if not all(isinstance(item, dict) and 'STORE_NUM' in item and 'UPC' in item for item in items):
+            raise HttpError(400, 'every request needs STORE_NUM and UPC')
+        try:
+            for item in items:
+                item['STORE_NUM'], item['UPC'] = int(item['STORE_NUM']), int(item['UPC'])
+        except (TypeError, ValueError):
+            raise HttpError(400, 'STORE_NUM and UPC must be integers')
+        results = await self.answer(items)
+        if not isinstance(payload, list) and 'error' in results[0]:
+            return 404, results[0]
+        return 200, results if isinstance(payload, list) else results[0]
+
+    async def route(self, method, path, body):
+        if path == '/forecast':
+            if method != 'POST':
+                raise HttpError(405, 'use POST')
+            return await self.forecast(body)
+        if path == '/metrics' and method == 'GET':
+            snapshot = self.metrics.snapshot()
+            if self.cache is not None:
+                snapshot['cache'] = self.cache.report()
+            return 200, snapshot
+        if path.startswith('/cache'):
+            return self.cache_route(method, path, body)
+        if path == '/metrics/reset' and method == 'POST':
+            self.metrics.reset()
+            return 200, {'reset': True}
+        if path == '/health' and method == 'GET':
+            return 200, {'status': 'ok', 'series': len(self.forecaster.keys), 'week': self.forecaster.week}
+        raise HttpError(404, 'no route {} {}'.format(method, path))
+
+    def cache_route(self, method, path, body):
+        if self.cache is None:
+            raise HttpError(404, 'the cache is disabled')
+        if path == '/cache' and method == 'GET':
+            return 200, self.cache.report()
+        if path == '/cache/invalidate' and method == 'POST':
+            try:
+                fields = json.loads(body or b'{}')
+            except ValueError:
+                raise HttpError(400, 'body is not JSON')
+            if not isinstance(fields, dict):
+                raise HttpError(400, 'body must be a JSON object')
+            dropped = self.cache.invalidate(fields.get('version'), fields.get('week'), fields.get('STORE_NUM'),
+                                            fields.get('UPC'))
+            return 200, {'invalidated': dropped}
+        raise HttpError(404, 'no route {} {}'.format(method, path))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as error:
+                    writer.write(http_response(error.status, {'error': str(error)}, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                start = time.perf_counter()
+                try:
+                    status, payload = await self.route(method, path, body)
+                except HttpError as error:
+                    status, payload = error.status, {'error': str(error)}
+                except Exception as error:
+                    # a failed batch fails its requests, not the connection
+                    status, payload = 500, {'error': '{}: {}'.format(type(error).__name__, error)}
+                if path == '/forecast':
+                    self.metrics.record(time.perf_counter() - start, len(payload) if isinstance(payload, list) else 1,
+                                        status != 200)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(http_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        batcher = asyncio.ensure_future(self.batcher.run())
+        server = await asyncio.start_server(self.handle, host, port)
+        print('serving forecasts for week {} of {:,} series on http://{}:{}'.format(
+            self.forecaster.week, len(self.forecaster.keys), host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def load_models(path):
+    """The models saved by segment_training.py, and a digest of the file that versions their forecasts."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    return pickle.loads(content), hashlib.blake2b(content, digest_size=6).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', default='updated_train_data.csv')
+    parser.add_argument('--models', help='segment_training.py output; the SES baseline is served without it')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='raw product and store tables: SUB_CATEGORY, segments')
+    parser.add_argument('--product-data', help='product table CSV used instead of the raw one')
+    parser.add_argument('--store-data', help='store table CSV used instead of the raw one, e.g. with cluster labels')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='items scored together at most')
+    parser.add_argument('--window-ms', type=float, default=WINDOW * 1000,
+                        help='time a batch waits for more requests')
+    parser.add_argument('--cache-mb', type=float, default=MAX_BYTES / (1 << 20),
+                        help='memory budget of the forecast cache, 0 disables it')
+    parser.add_argument('--cache-path', help='sqlite file of the on-disk cache tier')
+    args = parser.parse_args()
+
+    # the raw tables: the updated ones have SUB_CATEGORY and the segment columns one-hot encoded
+    product_data = pd.read_csv(args.product_data) if args.product_data else read_product_data(data_dir=args.data_dir)
+    store_data = pd.read_csv(args.store_data) if args.store_data else read_store_data(data_dir=args.data_dir)
+    models, models_version = load_models(args.models) if args.models else (None, BASELINE)
+    forecaster = Forecaster(pd.read_csv(args.history), models, product_data, store_data,
+                            product_data.set_index('UPC')['SUB_CATEGORY'])
+    cache = None
+    if args.cache_mb > 0:
+        cache = ForecastCache(int(args.cache_mb * (1 << 20)), args.cache_path,
+                              '{}:{}'.format(models_version, forecaster.week))
+    service = ForecastService(forecaster, args.max_batch, args.window_ms / 1000, cache)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Vectorized BASE_PRICE imputation for the weekly sales data.
+
+Every missing price is filled in a single pass, falling back in order to
+
+    1. the last observed price of the same (STORE_NUM, UPC) series
+    2. the average price of the UPC across all stores
+    3. the average price of the UPC's SUB_CATEGORY
+
+Prices that none of the levels can fill are left as NaN.
+"""
+import numpy as np
+import pandas as pd
+
+from .loader import DATE_FORMAT
+
+# UPC codes have at most 12 digits, so STORE_NUM * UPC_SPAN + UPC is a unique
+# integer key for every (STORE_NUM, UPC) series
+UPC_SPAN = 10 ** 12
+
+
+def series_key(store_num, upc):
+    """Integer key of the (STORE_NUM, UPC) series each row belongs to."""
+    return np.asarray(store_num, dtype=np.int64) * UPC_SPAN + np.asarray(upc, dtype=np.int64)
+
+
+def week_order(weeks):
+    """Positions that sort the rows by WEEK_END_DATE, keeping file order for ties."""
+    if not pd.api.types.is_datetime64_any_dtype(weeks):
+        # parse each distinct date once
+        codes, uniques = pd.factorize(weeks)
+        weeks = np.asarray(pd.to_datetime(uniques, format=DATE_FORMAT))[codes]
+    return np.argsort(np.asarray(weeks), kind='stable')
+
+
+def price_totals(data):
+    """Sum and count of the observed BASE_PRICE of every UPC."""
+    return data.groupby('UPC', sort=False, observed=True)['BASE_PRICE'].agg(['sum', 'count'])
+
+
+def fallback_prices(totals, sub_category=None):
+    """
+    Price used for a UPC when its own series has no earlier observation.
+
+    `totals` holds the price sum and count of every UPC (see `price_totals`),
+    `sub_category` maps UPC to SUB_CATEGORY.
+    """
+    counts = totals['count'].where(totals['count'] > 0)
+    fallback = totals['sum'] / counts
+    if sub_category is not None:
+        groups = pd.Series(sub_category).reindex(totals.index).values
+        group_totals = totals.groupby(groups, dropna=True).sum()
+        group_mean = group_totals['sum'] / group_totals['count'].where(group_totals['count'] > 0)
+        fallback = fallback.fillna(pd.Series(group_mean.reindex(groups).values, index=totals.index))
+    return fallback
+
+
+def last_observed_price(data, last_price=None):
+    """
+    Latest observed BASE_PRICE of every series in `data`, indexed by
+    `series_key`, updating the prices in `last_price` seen before `data`.
+    """
+    observed = data[data['BASE_PRICE'].notna()]
+    order = week_order(observed['WEEK_END_DATE'])
+    key = series_key(observed['STORE_NUM'], observed['UPC'])[order]
+    latest = pd.Series(observed['BASE_PRICE'].values[order], index=key).groupby(level=0, sort=False).last()
+    if last_price is not None:
+        latest = latest.combine_first(last_price)
+    return latest
+
+
+def impute_base_price(data, sub_category=None, fallback=None, last_price=None):
+    """
+    Return BASE_PRICE with every missing value imputed.
+
+    `data` needs WEEK_END_DATE, STORE_NUM, UPC and BASE_PRICE. `fallback`
+    overrides the per-UPC fallback prices computed from `data` itself and
+    `last_price` (indexed by `series_key`) seeds the forward fill with prices
+    seen before `data`, which is how chunked callers carry state across chunks.
+    """
+    price = data['BASE_PRICE']
+    if not price.isna().any():
+        return price.copy()
+
+    order = week_order(data['WEEK_END_DATE'])
+    key = series_key(data['STORE_NUM'], data['UPC'])[order]
+
+    # forward fill within each (STORE_NUM, UPC) series
+    filled = pd.Series(price.values[order]).groupby(key, sort=False).ffill().to_numpy(copy=True)
+
+    gap = np.isnan(filled)
+    if last_price is not None and gap.any():
+        filled[gap] = last_price.reindex(key[gap]).values
+        gap = np.isnan(filled)
+
+    # UPC average, then SUB_CATEGORY average
+    if gap.any():
+        if fallback is None:
+            fallback = fallback_prices(price_totals(data), sub_category)
+        filled[gap] = fallback.reindex(np.asarray(data['UPC'])[order][gap]).values
+
+    result = np.empty_like(filled)
+    result[order] = filled
+    return pd.Series(result, index=data.index, name='BASE_PRICE')
@@ -0,0 +1,202 @@
+"""
+Weekly append mode for the running aggregates and the preprocessed train output.
+
+`WeeklyState` persists everything the weekly refresh needs from the history:
+
+- running sums and counts of UNITS, BASE_PRICE, FEATURE and DISPLAY per
+  (STORE_NUM, UPC) series, per store, per week and per (week, store), from
+  which the EDA aggregates are read (`avg_price`, `weekly_demand`,
+  `store_agg_data`, `grouped_weekly_sales`);
+- the last observed BASE_PRICE of every series and the UNITS sketch of every
+  series, the state `streaming.py` carries across chunks.
+
+A new week only touches its own rows. They are added to the aggregates and
+the sketch. Their BASE_PRICE is imputed from the carried prices, their
+UNITS outliers are flagged against the fences of their series, and the
+remaining rows are appended to the output. Rows written in earlier weeks
+are not re-flagged when the fences of their series move.
+
+    python -m retail_demand incremental init --data-dir dataset --state weekly_state.pkl
+    python -m retail_demand incremental apply new_week.csv --state weekly_state.pkl --output updated_train_data.csv
+"""
+import argparse
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .imputation import fallback_prices, impute_base_price, last_observed_price, series_key
+from .loader import DATA_DIR, iter_table, read_csv_typed, read_product_data, select_columns, week_dates
+from .outliers import FENCE, MIN_COUNT, UnitsSketch, flag_outliers
+
+MEASURES = ['UNITS', 'BASE_PRICE', 'FEATURE', 'DISPLAY']
+
+# level -> keys of its running aggregates
+LEVELS = {
+    'series': ['STORE_NUM', 'UPC'],
+    'store': ['STORE_NUM'],
+    'week': ['WEEK_END_DATE'],
+    'store_week': ['WEEK_END_DATE', 'STORE_NUM'],
+}
+
+STATE = 'weekly_state.pkl'
+CHUNKSIZE = 500000
+
+
+class RunningAggregates(object):
+    """Sums and counts of `MEASURES` per level, updated a batch of rows at a time."""
+
+    def __init__(self):
+        self.tables = {level: None for level in LEVELS}
+
+    def update(self, rows):
+        rows = rows.assign(WEEK_END_DATE=week_dates(rows['WEEK_END_DATE']))
+        for level, keys in LEVELS.items():
+            part = rows.groupby(keys, observed=True, sort=True)[MEASURES].agg(['sum', 'count'])
+            part.columns = ['{}_{}'.format(measure, stat) for measure, stat in part.columns]
+            self.tables[level] = self.accumulate(self.tables[level], part.astype(np.float64), 'WEEK_END_DATE' in keys)
+        return self
+
+    @staticmethod
+    def accumulate(table, part, by_week):
+        if table is None:
+            return part
+        # a new week only appends to the week levels; their size grows with the history
+        if by_week and len(table) and (part.index.get_level_values(0) > table.index.get_level_values(0)[-1]).all():
+            return pd.concat([table, part])
+        return table.add(part, fill_value=0)
+
+    def totals(self, level, measure='UNITS'):
+        return self.tables[level][measure + '_sum'].rename(measure)
+
+    def counts(self, level, measure='UNITS'):
+        return self.tables[level][measure + '_count'].rename(measure)
+
+    def means(self, level, measure='UNITS'):
+        table = self.tables[level]
+        count = table[measure + '_count']
+        return (table[measure + '_sum'] / count.where(count > 0)).rename(measure)
+
+    def price_totals(self):
+        """Sum and count of the observed BASE_PRICE of every UPC, as `imputation.price_totals` returns them."""
+        series = self.tables['series']
+        totals = series[['BASE_PRICE_sum', 'BASE_PRICE_count']].groupby(level='UPC').sum()
+        return totals.set_axis(['sum', 'count'], axis=1)
+
+    # the aggregates of the EDA
+    def avg_price(self):
+        return self.means('series', 'BASE_PRICE').reset_index()
+
+    def weekly_demand(self):
+        return self.totals('week')
+
+    def store_agg_data(self):
+        return self.totals('store')
+
+    def grouped_weekly_sales(self):
+        return self.totals('store_week').reset_index()
+
+
+class WeeklyState(object):
+
+    def __init__(self):
+        self.weeks = np.empty(0, dtype='datetime64[ns]')
+        self.aggregates = RunningAggregates()
+        self.sketch = UnitsSketch()
+        self.last_price = None
+
+    @classmethod
+    def build(cls, data_dir=DATA_DIR, chunksize=CHUNKSIZE):
+        """State of the whole history in train.csv, in one chunked pass."""
+        state = cls()
+        for chunk in iter_table('train', chunksize, data_dir=data_dir):
+            state.add_history(chunk)
+        return state
+
+    def add_history(self, rows):
+        """Add rows that are already in the outputs, e.g. the history the state is built from."""
+        weeks = week_dates(rows['WEEK_END_DATE'])
+        self.weeks = np.union1d(self.weeks, np.unique(weeks.values).astype(self.weeks.dtype))
+        self.aggregates.update(rows)
+        self.sketch.update(rows)
+        self.last_price = last_observed_price(rows, self.last_price)
+        return self
+
+    def apply_week(self, rows, output=None, sub_category=None, fence=FENCE, min_count=MIN_COUNT):
+        """
+        Add the rows of a new week and return them preprocessed: BASE_PRICE
+        imputed and UNITS outliers dropped. The result is appended to the
+        CSV `output` when given. Weeks that were already added raise
+        ValueError, so a week cannot be counted twice.
+        """
+        weeks = np.unique(week_dates(rows['WEEK_END_DATE']).values).astype(self.weeks.dtype)
+        seen = np.intersect1d(weeks, self.weeks)
+        if len(seen):
+            raise ValueError('week(s) {} are already in the state'.format([str(week)[:10] for week in seen]))
+
+        last_price = self.last_price
+        self.add_history(rows)
+        fallback = fallback_prices(self.aggregates.price_totals(), sub_category)
+        rows = rows.assign(BASE_PRICE=impute_base_price(rows, fallback=fallback, last_price=last_price))
+        # only the fences of the series of this week are computed
+        sketch = self.sketch.subset(series_key(rows['STORE_NUM'], rows['UPC']))
+        rows = rows[~flag_outliers(rows, sketch, fence, min_count)]
+
+        if output is not None:
+            rows.to_csv(output, mode='a', header=not os.path.exists(output), index=False)
+        return rows
+
+    def save(self, path=STATE):
+        # write next to the old state and swap, so an interrupted save keeps the previous week
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path=STATE):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def read_week(path):
+    """Read a file of new train rows with the train schema, WEEK_END_DATE as in the file."""
+    return read_csv_typed('train', path, select_columns('train'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    init = commands.add_parser('init', help='build the state from the history in train.csv')
+    init.add_argument('--data-dir', default=DATA_DIR)
+    init.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    init.add_argument('--state', default=STATE)
+    apply = commands.add_parser('apply', help='add the rows of a new week and append them to the output')
+    apply.add_argument('rows', help='CSV of the new week, with the columns of train.csv')
+    apply.add_argument('--data-dir', default=DATA_DIR, help='directory of product_data.csv')
+    apply.add_argument('--state', default=STATE)
+    apply.add_argument('--output', default='updated_train_data.csv')
+    apply.add_argument('--fence', type=float, default=FENCE, help='width of the UNITS fences in IQRs')
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        state = WeeklyState.build(args.data_dir, args.chunksize)
+        state.save(args.state)
+        print('state of {} weeks written to {}'.format(len(state.weeks), args.state))
+        return
+
+    state = WeeklyState.load(args.state)
+    sub_category = read_product_data(columns=['UPC', 'SUB_CATEGORY'], data_dir=args.data_dir)
+    try:
+        rows = state.apply_week(read_week(args.rows), args.output, sub_category.set_index('UPC')['SUB_CATEGORY'],
+                                args.fence)
+    except ValueError as error:
+        parser.exit(1, '{}\n'.format(error))
+    state.save(args.state)
+    print('appended {:,} rows to {}'.format(len(rows), args.output))
+
+
+if __name__ == '__main__':
+    # run the importable module's main, so the pickled state refers to retail_demand.incremental.WeeklyState
+    from retail_demand.incremental import main
+    main()
@@ -0,0 +1,350 @@
+"""
+Per-stage timing and memory instrumentation of the preprocessing pipeline.
+
+Every stage of Preprocessing.py and of its headless version,
+`retail_demand.preprocessing`, runs inside `recorder.stage(name, frame)`,
+where `frame` is the DataFrame the stage works on (None for the reads):
+
+    recorder = StageRecorder.from_env()
+    with recorder.stage('impute_base_price', data) as stage:
+        data['BASE_PRICE'] = impute_base_price(data, sub_category=upc_sub_category)
+        stage.output(data)
+
+A stage records its wall and CPU time, the rows in and out, the memory of
+the DataFrame before and after (memory_usage(deep=True), measured outside
+the timed window) and the change of the process RSS, and with tracing on
+the peak memory traced by tracemalloc. The records are appended to a JSONL report as each stage
+ends, after one line describing the run; a report path ending in .json gets
+the whole run as one document when the recorder is closed instead.
+
+`from_env` reads the environment, so a nightly run is instrumented without
+editing the notebook:
+
+    PIPELINE_REPORT=preprocessing.jsonl python -m retail_demand preprocessing
+    PIPELINE_REPORT=preprocessing.jsonl PIPELINE_PROFILE=impute_base_price python -m retail_demand preprocessing
+    python -m retail_demand instrumentation preprocessing.jsonl     # stage table of the last run
+
+- PIPELINE_REPORT: path of the JSON or JSONL report;
+- PIPELINE_PROFILE: comma-separated stages to profile, or 'all';
+- PIPELINE_PROFILER: 'cprofile' (default, a .prof file for pstats or
+  snakeviz) or 'sampling' (an HTML report of pyinstrument);
+- PIPELINE_PROFILE_DIR: where the profiles go, next to the report by default;
+- PIPELINE_TRACEMALLOC=1: trace the peak memory of every stage with
+  tracemalloc. It is off by default: it slows down the stages that allocate
+  many Python objects, csv_write several times over, so the timings of a
+  traced run are not comparable with an untraced one. The run line records
+  whether the run was traced.
+
+Without PIPELINE_REPORT and PIPELINE_PROFILE the recorder is disabled and
+`stage` returns a shared no-op context, so instrumented stages cost a method
+call and nothing is measured.
+
+numpy and pandas buffers are traced by tracemalloc, pyarrow's are not; they
+show up in the RSS delta. The RSS is read with psutil when it is installed,
+from /proc/self/statm otherwise. Stages are not meant to be nested.
+"""
+import argparse
+import cProfile
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import uuid
+
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - optional dependency
+    psutil = None
+
+try:
+    import pyinstrument
+except ImportError:  # pragma: no cover - optional dependency
+    pyinstrument = None
+
+PROFILERS = ('cprofile', 'sampling')
+NUMERIC = ['wall_s', 'cpu_s', 'rows_in', 'rows_out', 'frame_mb_in', 'frame_mb_out', 'traced_peak_mb', 'rss_delta_mb']
+MB = 2 ** 20
+
+
+def rss():
+    """Resident set size of the process in bytes, or None where it cannot be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def frame_bytes(frame):
+    """Deep memory footprint of a DataFrame or Series, or of a list or tuple of them; None for anything else."""
+    if isinstance(frame, (list, tuple)):
+        sizes = [frame_bytes(item) for item in frame]
+        return None if any(size is None for size in sizes) else sum(sizes)
+    if isinstance(frame, pd.DataFrame):
+        return int(frame.memory_usage(index=True, deep=True).sum())
+    if isinstance(frame, pd.Series):
+        return int(frame.memory_usage(index=True, deep=True))
+    return None
+
+
+def frame_rows(frame):
+    if isinstance(frame, (list, tuple)):
+        return sum(len(item) for item in frame)
+    return None if frame is None else len(frame)
+
+
+def megabytes(size):
+    return None if size is None else size / MB
+
+
+class NullStage(object):
+    """The stage handed out by a disabled recorder: does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def output(self, frame=None, rows=None):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage(object):
+    """One instrumented run of a stage; `output` records what it produced."""
+
+    def __init__(self, recorder, name, frame):
+        self.recorder = recorder
+        self.name = name
+        self.rows_in = frame_rows(frame)
+        self.frame_bytes_in = frame_bytes(frame)
+        self.rows_out = None
+        self.output_frame = None
+        self.profiler = None
+        self.started_tracing = False
+
+    def output(self, frame=None, rows=None):
+        """Record the rows and the memory of the stage's output, `frame` or just a number of `rows`."""
+        self.output_frame = frame
+        self.rows_out = frame_rows(frame) if rows is None else rows
+
+    def __enter__(self):
+        recorder = self.recorder
+        if recorder.trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            tracemalloc.reset_peak()
+            self.traced_before = tracemalloc.get_traced_memory()[0]
+        self.rss_before = rss()
+        if self.name in recorder.profile or 'all' in recorder.profile:
+            self.profiler = recorder.make_profiler()
+        self.started = time.time()
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+        if self.profiler is not None:
+            if recorder.profiler == 'sampling':
+                self.profiler.start()
+            else:
+                self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        recorder = self.recorder
+        profile_path = None
+        if self.profiler is not None:
+            if recorder.profiler == 'sampling':
+                self.profiler.stop()
+            else:
+                self.profiler.disable()
+            profile_path = recorder.dump_profile(self.name, self.profiler)
+        rss_after = rss()
+        traced_peak = None
+        if recorder.trace:
+            traced_peak = tracemalloc.get_traced_memory()[1] - self.traced_before
+            if self.started_tracing:
+                tracemalloc.stop()
+        # measured after the clocks stopped, deep memory_usage walks every string
+        frame_bytes_out = frame_bytes(self.output_frame)
+        self.output_frame = None
+        recorder.add({
+            'type': 'stage',
+            'run_id': recorder.run_id,
+            'stage': self.name,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'frame_mb_in': megabytes(self.frame_bytes_in),
+            'frame_mb_out': megabytes(frame_bytes_out),
+            'traced_peak_mb': megabytes(traced_peak),
+            'rss_mb_before': megabytes(self.rss_before),
+            'rss_mb_after': megabytes(rss_after),
+            'rss_delta_mb': (None if self.rss_before is None or rss_after is None
+                             else megabytes(rss_after - self.rss_before)),
+            'profile': profile_path,
+            'error': None if exc_type is None else '{}: {}'.format(exc_type.__name__, exc),
+        })
+        return False
+
+
+class StageRecorder(object):
+
+    def __init__(self, enabled=True, report=None, profile=(), profiler='cprofile', profile_dir=None, trace=False,
+                 run_id=None):
+        if profiler not in PROFILERS:
+            raise ValueError('profiler must be one of {}, not {!r}'.format(PROFILERS, profiler))
+        if enabled and profile and profiler == 'sampling' and pyinstrument is None:
+            raise ImportError('the sampling profiler needs pyinstrument')
+        self.enabled = enabled
+        self.report = report
+        self.profile = set(profile)
+        self.profiler = profiler
+        self.profile_dir = profile_dir or (os.path.dirname(os.path.abspath(report)) if report else os.getcwd())
+        self.trace = trace
+        self.run_id = run_id or '{}-{}'.format(time.strftime('%Y%m%dT%H%M%S'), uuid.uuid4().hex[:6])
+        self.records = []
+        self.run = {
+            'type': 'run',
+            'run_id': self.run_id,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'argv': sys.argv,
+            'pid': os.getpid(),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'tracemalloc': trace,
+        }
+        if self.enabled and self.report is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.report)), exist_ok=True)
+        if self.enabled and self.jsonl:
+            self.write_line(self.run)
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """A recorder configured by the PIPELINE_* variables, disabled when none of them asks for anything."""
+        environ = os.environ if environ is None else environ
+        report = environ.get('PIPELINE_REPORT') or None
+        profile = [name.strip() for name in environ.get('PIPELINE_PROFILE', '').split(',') if name.strip()]
+        return cls(enabled=bool(report or profile), report=report, profile=profile,
+                   profiler=environ.get('PIPELINE_PROFILER', 'cprofile'),
+                   profile_dir=environ.get('PIPELINE_PROFILE_DIR') or None,
+                   trace=environ.get('PIPELINE_TRACEMALLOC', '0') not in ('', '0'))
+
+    @property
+    def jsonl(self):
+        return self.report is not None and not self.report.endswith('.json')
+
+    def stage(self, name, frame=None):
+        """Context manager instrumenting stage `name`, which works on `frame`."""
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name, frame)
+
+    def make_profiler(self):
+        if self.profiler == 'sampling':
+            return pyinstrument.Profiler()
+        return cProfile.Profile()
+
+    def dump_profile(self, name, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, '{}-{}.{}'.format(
+            self.run_id, name, 'html' if self.profiler == 'sampling' else 'prof'))
+        if self.profiler == 'sampling':
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.dump_stats(path)
+        return path
+
+    def write_line(self, record):
+        with open(self.report, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def add(self, record):
+        self.records.append(record)
+        if self.jsonl:
+            self.write_line(record)
+
+    def to_frame(self):
+        """The stage records of this run, one row per stage."""
+        return pd.DataFrame(self.records)
+
+    def close(self):
+        """Write the .json report; a .jsonl report is already complete."""
+        if self.enabled and self.report is not None and not self.jsonl:
+            with open(self.report, 'w') as f:
+                json.dump({'run': self.run, 'stages': self.records}, f, indent=1)
+
+    def __str__(self):
+        if not self.records:
+            return 'no stages recorded'
+        return summary(self.to_frame()).to_string(float_format='{:.3f}'.format)
+
+
+def read_report(path):
+    """Stage records of a JSON or JSONL report, one row per stage, with the run_id of every row."""
+    with open(path) as f:
+        if path.endswith('.json'):
+            return pd.DataFrame(json.load(f)['stages'])
+        records = [json.loads(line) for line in f if line.strip()]
+    return pd.DataFrame([record for record in records if record.get('type') == 'stage'])
+
+
+def summary(stages):
+    """
+    The main columns of stage records, one row per stage in the order the
+    stages first ran. A stage that ran more than once gets its times and RSS
+    deltas summed, its largest traced peak, the rows and memory going into
+    its first run and out of its last, and the number of times it ran.
+    """
+    stages = stages.astype({name: 'float64' for name in NUMERIC if name in stages})
+    grouped = stages.groupby('stage', sort=False)
+    table = pd.DataFrame({
+        'runs': grouped.size(),
+        'wall_s': grouped['wall_s'].sum(),
+        'cpu_s': grouped['cpu_s'].sum(),
+        'rows_in': grouped['rows_in'].first(),
+        'rows_out': grouped['rows_out'].last(),
+        'frame_mb_in': grouped['frame_mb_in'].first(),
+        'frame_mb_out': grouped['frame_mb_out'].last(),
+        'traced_peak_mb': grouped['traced_peak_mb'].max(),
+        'rss_delta_mb': grouped['rss_delta_mb'].sum(min_count=1),
+    })
+    return table.astype({'rows_in': 'Int64', 'rows_out': 'Int64'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('report', help='JSON or JSONL report')
+    parser.add_argument('--run', help='run_id to show, the last run of the report by default')
+    args = parser.parse_args()
+
+    stages = read_report(args.report)
+    if not len(stages):
+        sys.exit('no stages in {}'.format(args.report))
+    run_id = args.run or stages['run_id'].iloc[-1]
+    run = stages[stages['run_id'] == run_id]
+    with pd.option_context('display.width', 200, 'display.max_columns', None, 'display.float_format', '{:.3f}'.format):
+        table = summary(run)
+        print('run {}: {} stages, {} stage runs, {:.3f} s\n{}'.format(run_id, len(table), len(run), run['wall_s'].sum(),
+                                                                     table))
+    errors = run[run['error'].notna()]
+    for _, stage in errors.iterrows():
+        print('FAILED {}: {}'.format(stage['stage'], stage['error']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Typed loaders for the weekly sales (train), product and store tables.
+
+Every table has a declared schema so pandas does not fall back to int64,
+float64 and object columns: flags are uint8, store keys int32, prices float32
+and the low-cardinality strings are categories. `columns` restricts the read
+to the columns a stage needs. Reads go through the columnar cache in
+`cache.py` when pyarrow is installed.
+
+A table without its CSV is read from the parquet shards written by
+`synthetic.py --format parquet`, <data_dir>/train/part-*.parquet, with the
+same schema (pyarrow is needed for those).
+
+    from retail_demand.loader import read_train
+    train = read_train(columns=['WEEK_END_DATE', 'STORE_NUM', 'UPC', 'UNITS'])
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import cache
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pq = None
+
+DATA_DIR = 'dataset'
+# format of WEEK_END_DATE in train.csv, e.g. 14-Jan-09
+DATE_FORMAT = '%d-%b-%y'
+
+TRAIN_SCHEMA = {
+    'WEEK_END_DATE': 'category',
+    'STORE_NUM': 'int32',
+    'UPC': 'int64',
+    'BASE_PRICE': 'float32',
+    'FEATURE': 'uint8',
+    'DISPLAY': 'uint8',
+    'UNITS': 'int32',
+}
+
+PRODUCT_SCHEMA = {
+    'UPC': 'int64',
+    'DESCRIPTION': 'category',
+    'MANUFACTURER': 'category',
+    'CATEGORY': 'category',
+    'SUB_CATEGORY': 'category',
+    'PRODUCT_SIZE': 'category',
+}
+
+STORE_SCHEMA = {
+    'STORE_ID': 'int32',
+    'STORE_NAME': 'category',
+    'ADDRESS_CITY_NAME': 'category',
+    'ADDRESS_STATE_PROV_CODE': 'category',
+    'MSA_CODE': 'category',
+    'SEG_VALUE_NAME': 'category',
+    'PARKING_SPACE_QTY': 'float32',
+    'SALES_AREA_SIZE_NUM': 'int32',
+    'AVG_WEEKLY_BASKETS': 'int32',
+}
+
+# table name -> (file name, schema)
+TABLES = {
+    'train': ('train.csv', TRAIN_SCHEMA),
+    'product_data': ('product_data.csv', PRODUCT_SCHEMA),
+    'store_data': ('store_data.csv', STORE_SCHEMA),
+}
+
+
+def table_path(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, TABLES[name][0])
+
+
+def parquet_parts(name, data_dir=DATA_DIR):
+    """Parquet shards of table `name`, when it has no CSV in `data_dir`; an empty list otherwise."""
+    if os.path.exists(table_path(name, data_dir)):
+        return []
+    parts = sorted(glob.glob(os.path.join(data_dir, os.path.splitext(TABLES[name][0])[0], 'part-*.parquet')))
+    if parts and pq is None:
+        raise ImportError('reading the parquet shards of {} needs pyarrow'.format(name))
+    return parts
+
+
+def select_columns(name, columns=None):
+    """Validate `columns` against the schema of table `name`."""
+    schema = TABLES[name][1]
+    if columns is None:
+        return list(schema)
+    unknown = [column for column in columns if column not in schema]
+    if unknown:
+        raise KeyError('{} has no column(s) {}'.format(name, unknown))
+    return list(columns)
+
+
+def parse_weeks(weeks):
+    """Convert a WEEK_END_DATE category column to datetime, parsing each date once."""
+    weeks = weeks.astype('category')
+    dates = pd.to_datetime(weeks.cat.categories, format=DATE_FORMAT)
+    codes = weeks.cat.codes.values
+    values = np.where(codes >= 0, np.asarray(dates)[codes], np.datetime64('NaT'))
+    return pd.Series(values, index=weeks.index, name=weeks.name)
+
+
+def week_dates(weeks):
+    """WEEK_END_DATE as datetime, whether or not it was parsed on read."""
+    if pd.api.types.is_datetime64_any_dtype(weeks):
+        return weeks
+    return parse_weeks(weeks)
+
+
+def read_csv_typed(name, path, usecols):
+    schema = TABLES[name][1]
+    data = pd.read_csv(path, usecols=usecols, dtype={column: schema[column] for column in usecols})
+    # usecols does not keep the requested order
+    return data[usecols]
+
+
+def typed_frame(name, table, usecols):
+    """The pyarrow `table` of table `name` as a DataFrame with its declared schema."""
+    schema = TABLES[name][1]
+    return table.to_pandas().astype({column: schema[column] for column in usecols})[usecols]
+
+
+def read_parquet_typed(name, paths, usecols):
+    frames = [typed_frame(name, pq.read_table(path, columns=usecols), usecols) for path in paths]
+    data = pd.concat(frames, ignore_index=True)
+    # the shards have categories of their own
+    categories = [column for column in usecols if TABLES[name][1][column] == 'category']
+    return data.astype({column: 'category' for column in categories})
+
+
+def read_table(name, columns=None, data_dir=DATA_DIR, parse_dates=True, use_cache=True):
+    """
+    Read table `name` ('train', 'product_data' or 'store_data') with its declared schema.
+
+    Only `columns` are read when given. WEEK_END_DATE is returned as datetime
+    unless `parse_dates` is False, in which case it stays a category.
+    `use_cache=False` always parses the CSV. Parquet shards are columnar
+    already and are read without the cache.
+    """
+    path = table_path(name, data_dir)
+    usecols = select_columns(name, columns)
+    parts = parquet_parts(name, data_dir)
+    if parts:
+        data = read_parquet_typed(name, parts, usecols)
+    elif use_cache and cache.available():
+        data = cache.cached_read(path, lambda: read_csv_typed(name, path, list(TABLES[name][1])),
+                                 TABLES[name][1], columns=usecols)
+    else:
+        data = read_csv_typed(name, path, usecols)
+    if parse_dates and 'WEEK_END_DATE' in data:
+        data = data.assign(WEEK_END_DATE=parse_weeks(data['WEEK_END_DATE']))
+    return data
+
+
+def iter_table(name, chunksize, columns=None, data_dir=DATA_DIR, parse_dates=True):
+    """
+    Read table `name` in chunks of `chunksize` rows with its declared schema.
+
+    Chunks are parsed straight from the CSV, or read as row batches of the
+    parquet shards; the columnar cache only serves whole-table reads.
+    """
+    for chunk in iter_chunks(name, chunksize, select_columns(name, columns), data_dir):
+        if parse_dates and 'WEEK_END_DATE' in chunk:
+            chunk = chunk.assign(WEEK_END_DATE=parse_weeks(chunk['WEEK_END_DATE']))
+        yield chunk
+
+
+def iter_chunks(name, chunksize, usecols, data_dir=DATA_DIR):
+    parts = parquet_parts(name, data_dir)
+    if parts:
+        for path in parts:
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=usecols):
+                yield typed_frame(name, batch, usecols)
+        return
+    schema = TABLES[name][1]
+    reader = pd.read_csv(table_path(name, data_dir), usecols=usecols,
+                         dtype={column: schema[column] for column in usecols}, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            yield chunk[usecols]
+
+
+def read_train(columns=None, **kwargs):
+    return read_table('train', columns, **kwargs)
+
+
+def read_product_data(columns=None, **kwargs):
+    return read_table('product_data', columns, **kwargs)
+
+
+def read_store_data(columns=None, **kwargs):
+    return read_table('store_data', columns, **kwargs)
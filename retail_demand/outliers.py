@@ -0,0 +1,213 @@
+"""
+Per-series UNITS outlier detection with mergeable quantile sketches.
+
+Every (STORE_NUM, UPC) series keeps a log-bucketed histogram of its UNITS
+(the DDSketch layout): bucket i counts the values in (gamma^(i-1), gamma^i],
+so a quantile read from it is within `relative_accuracy` of the exact one.
+Only the occupied buckets are kept, as sorted (series, bucket, count)
+entries, so a series costs a few bytes per distinct UNITS magnitude rather
+than a row of every bucket. A chunk is aggregated with a few vectorized
+operations and queued; the queue is merged into the sorted entries when it
+outgrows them, so the copies stay proportional to the entries. Two sketches
+merge by adding counts. A train file can therefore be sketched in one streaming pass,
+sharded by store and merged at the end, without sorting any group.
+
+A row is an outlier when its UNITS lies outside the Tukey fences of its
+series, computed on log(1 + UNITS) because demand spikes are multiplicative:
+
+    log1p(Q1) - k * IQR  <=  log1p(UNITS)  <=  log1p(Q3) + k * IQR
+"""
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .imputation import series_key
+from .loader import DATA_DIR, iter_table
+
+RELATIVE_ACCURACY = 0.01
+MAX_UNITS = 1e6
+FENCE = 3.0
+# series with fewer rows than this are never flagged
+MIN_COUNT = 10
+CHUNKSIZE = 500000
+
+
+def aggregate(keys, buckets, counts):
+    """Sum the counts of equal (key, bucket) pairs; the pairs come back sorted by key, then bucket."""
+    order = np.lexsort((buckets, keys))
+    keys, buckets, counts = keys[order], buckets[order], counts[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = (keys[1:] != keys[:-1]) | (buckets[1:] != buckets[:-1])
+    starts = np.flatnonzero(first)
+    totals = np.add.reduceat(counts, starts) if len(starts) else counts[:0]
+    return keys[starts], buckets[starts], totals.astype(np.uint32)
+
+
+class UnitsSketch(object):
+    """Quantile sketches of the UNITS of every (STORE_NUM, UPC) series."""
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, max_units=MAX_UNITS):
+        self.relative_accuracy = relative_accuracy
+        self.max_units = max_units
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        # bucket 0 holds UNITS <= 0, bucket 1 holds (0, 1], the last bucket everything above max_units
+        self.n_buckets = int(math.ceil(math.log(max_units) / math.log(self.gamma))) + 2
+        # the occupied buckets only, sorted by series and bucket: series key, bucket and count of each
+        self.entry_keys = np.empty(0, dtype=np.int64)
+        self.entry_buckets = np.empty(0, dtype=np.int32)
+        self.entry_counts = np.empty(0, dtype=np.uint32)
+        # entries added since the last compaction, merged in once they outnumber the compacted ones
+        self.pending = []
+        self.pending_size = 0
+        self.index()
+
+    def index(self):
+        """The sorted series keys and the first entry of every series."""
+        first = np.ones(len(self.entry_keys), dtype=bool)
+        first[1:] = self.entry_keys[1:] != self.entry_keys[:-1]
+        self.starts = np.flatnonzero(first)
+        self._keys = self.entry_keys[self.starts]
+
+    def add(self, keys, buckets, counts):
+        self.pending.append(aggregate(keys, buckets, counts))
+        self.pending_size += len(self.pending[-1][0])
+        # compacting only when the pending entries outgrow the compacted ones keeps the copies amortized
+        if self.pending_size > len(self.entry_keys):
+            self.compact()
+
+    def compact(self):
+        """Merge the pending entries into the sorted ones."""
+        if not self.pending:
+            return
+        parts = [(self.entry_keys, self.entry_buckets, self.entry_counts)] + self.pending
+        self.entry_keys, self.entry_buckets, self.entry_counts = aggregate(*[np.concatenate(part)
+                                                                            for part in zip(*parts)])
+        self.pending = []
+        self.pending_size = 0
+        self.index()
+
+    @property
+    def keys(self):
+        """Sorted keys of the sketched series."""
+        self.compact()
+        return self._keys
+
+    def totals(self):
+        """Number of rows of every series, in the order of `self.keys`."""
+        self.compact()
+        if not len(self.starts):
+            return np.zeros(0, dtype=np.int64)
+        return np.add.reduceat(self.entry_counts.astype(np.int64), self.starts)
+
+    def bucket(self, units):
+        units = np.asarray(units, dtype=np.float64)
+        positive = units > 0
+        index = np.zeros(len(units), dtype=np.int64)
+        index[positive] = 1 + np.clip(np.ceil(np.log(units[positive]) / math.log(self.gamma)), 0,
+                                      self.n_buckets - 2)
+        return index
+
+    def bucket_values(self):
+        """Value every bucket stands for, within `relative_accuracy` of its members."""
+        exponent = np.arange(self.n_buckets - 1)
+        return np.append(0.0, 2 * self.gamma ** exponent / (self.gamma + 1))
+
+    def update(self, data):
+        """Add the UNITS of the rows of `data` (STORE_NUM, UPC, UNITS) to their series."""
+        key = np.asarray(series_key(data['STORE_NUM'], data['UPC']), dtype=np.int64)
+        self.add(key, self.bucket(data['UNITS']).astype(np.int32), np.ones(len(key), dtype=np.uint32))
+        return self
+
+    def merge(self, other):
+        """Add the counts of `other`, a sketch with the same accuracy, to this one."""
+        if other.n_buckets != self.n_buckets or other.gamma != self.gamma:
+            raise ValueError('cannot merge sketches with different accuracy')
+        other.compact()
+        self.add(other.entry_keys, other.entry_buckets, other.entry_counts)
+        return self
+
+    def subset(self, keys):
+        """Sketch of the series of `keys` that this one holds, e.g. to compute the fences of one week's rows."""
+        self.compact()
+        keep = np.isin(self.entry_keys, np.unique(keys))
+        sketch = UnitsSketch(self.relative_accuracy, self.max_units)
+        sketch.entry_keys = self.entry_keys[keep]
+        sketch.entry_buckets = self.entry_buckets[keep]
+        sketch.entry_counts = self.entry_counts[keep]
+        sketch.index()
+        return sketch
+
+    def quantiles(self, q):
+        """(series x len(q)) quantiles of every series, in the order of `self.keys`."""
+        self.compact()
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        values = self.bucket_values()
+        result = np.empty((len(self.starts), len(q)))
+        if not len(self.starts):
+            return result
+        # the counts summed across all series: a series' own cumulative counts are offset by the rows before it
+        cumulative = np.cumsum(self.entry_counts, dtype=np.int64)
+        before = np.where(self.starts > 0, cumulative[self.starts - 1], 0)
+        totals = np.append(before[1:], cumulative[-1]) - before
+        for j in range(len(q)):
+            # first bucket of the series whose cumulative count exceeds the rank
+            entry = np.searchsorted(cumulative, before + q[j] * (totals - 1), side='right')
+            result[:, j] = values[self.entry_buckets[entry]]
+        return result
+
+    def fences(self, k=FENCE, min_count=MIN_COUNT):
+        """Lower and upper UNITS bounds of every series, infinite for series with too few rows."""
+        q1, q3 = np.log1p(self.quantiles([0.25, 0.75])).T
+        iqr = q3 - q1
+        lower = np.expm1(q1 - k * iqr)
+        upper = np.expm1(q3 + k * iqr)
+        few = self.totals() < min_count
+        lower[few] = -np.inf
+        upper[few] = np.inf
+        return lower, upper
+
+    def __getstate__(self):
+        self.compact()
+        return self.__dict__.copy()
+
+
+def flag_outliers(data, sketch, k=FENCE, min_count=MIN_COUNT, fences=None):
+    """
+    Boolean array marking the rows of `data` whose UNITS lie outside the
+    fences of their series. Rows of series missing from `sketch` are kept.
+    `fences` reuses bounds already computed with `sketch.fences`.
+    """
+    lower, upper = fences if fences is not None else sketch.fences(k, min_count)
+    key = series_key(data['STORE_NUM'], data['UPC'])
+    position = np.minimum(np.searchsorted(sketch.keys, key), max(len(sketch.keys) - 1, 0))
+    known = sketch.keys[position] == key if len(sketch.keys) else np.zeros(len(key), dtype=bool)
+    units = np.asarray(data['UNITS'], dtype=np.float64)
+    flagged = np.zeros(len(key), dtype=bool)
+    flagged[known] = (units[known] < lower[position[known]]) | (units[known] > upper[position[known]])
+    return flagged
+
+
+def sketch_train(data_dir=DATA_DIR, chunksize=CHUNKSIZE, shard=None, relative_accuracy=RELATIVE_ACCURACY):
+    """
+    Sketch train.csv in one streaming pass. `shard=(i, n)` only sketches the
+    stores with STORE_NUM % n == i, so n processes can split the work.
+    """
+    sketch = UnitsSketch(relative_accuracy)
+    for chunk in iter_table('train', chunksize, columns=['STORE_NUM', 'UPC', 'UNITS'], data_dir=data_dir):
+        if shard is not None:
+            chunk = chunk[chunk.STORE_NUM.values % shard[1] == shard[0]]
+        sketch.update(chunk)
+    return sketch
+
+
+def sketch_train_parallel(n_shards, data_dir=DATA_DIR, chunksize=CHUNKSIZE, relative_accuracy=RELATIVE_ACCURACY):
+    """Sketch train.csv in `n_shards` processes sharded by store and merge the results."""
+    with ProcessPoolExecutor(n_shards) as pool:
+        futures = [pool.submit(sketch_train, data_dir, chunksize, (i, n_shards), relative_accuracy)
+                   for i in range(n_shards)]
+        sketches = [future.result() for future in futures]
+    sketch = sketches[0]
+    for other in sketches[1:]:
+        sketch.merge(other)
+    return sketch
@@ -0,0 +1,161 @@
+"""
+Headless run of the Preprocessing.py steps, from the raw tables to
+updated_train_data.csv, updated_product_data.csv, updated_store_data.csv
+and the fitted preprocessing_transformer.pkl.
+
+- product data: DESCRIPTION dropped, PRODUCT_SIZE binned per category,
+  MANUFACTURER, CATEGORY and SUB_CATEGORY one-hot encoded;
+- store data: STORE_NAME, ADDRESS_CITY_NAME and PARKING_SPACE_QTY dropped,
+  SEG_VALUE_NAME mapped to 1-3, ADDRESS_STATE_PROV_CODE and MSA_CODE
+  one-hot encoded;
+- train data: BASE_PRICE imputed, UNITS outliers of every (STORE_NUM, UPC)
+  series removed.
+
+Every step runs as a stage of a `StageRecorder`, with the names used in
+Preprocessing.py, so `PIPELINE_REPORT` and `PIPELINE_PROFILE` instrument a
+run here as they do in the notebook.
+
+    python -m retail_demand preprocessing --data-dir dataset --output-dir .
+    python -m retail_demand preprocessing --output-dir out    # out/preprocessing_transformer.pkl
+    PIPELINE_REPORT=preprocessing.jsonl python -m retail_demand preprocessing --no-transformer
+
+category_encoders takes longer to import than pandas, so it is imported by
+the encoding stages when they run, and nothing here imports matplotlib.
+"""
+import argparse
+import os
+
+from .imputation import impute_base_price
+from .instrumentation import StageRecorder
+from .loader import DATA_DIR, read_product_data, read_store_data, read_train
+from .outliers import UnitsSketch, flag_outliers
+from .product_size import bin_product_size, parse_product_size
+from .transformer import PRODUCT_ONE_HOT, SEG_VALUE_NAME_MAP, STORE_ONE_HOT, PreprocessingTransformer
+
+PRODUCT_DROPPED = ['DESCRIPTION']
+STORE_DROPPED = ['STORE_NAME', 'ADDRESS_CITY_NAME']
+# dropped last, it is highly correlated with SALES_AREA_SIZE_NUM
+STORE_CORRELATED = ['PARKING_SPACE_QTY']
+
+OUTPUTS = {
+    'train': 'updated_train_data.csv',
+    'product_data': 'updated_product_data.csv',
+    'store_data': 'updated_store_data.csv',
+}
+TRANSFORMER = 'preprocessing_transformer.pkl'
+
+
+def one_hot_encode(frame, columns):
+    """The ce.OneHotEncoder of Preprocessing.py, fitted on and applied to `frame`."""
+    import category_encoders as ce
+
+    return ce.OneHotEncoder(cols=columns).fit_transform(frame)
+
+
+def preprocess_product_data(product_data, recorder):
+    """The encoded product data, and the SUB_CATEGORY of every UPC for the BASE_PRICE imputation."""
+    product_data = product_data.drop(columns=PRODUCT_DROPPED)
+    product_sizes = parse_product_size(product_data.PRODUCT_SIZE)
+    with recorder.stage('product_size_binning', product_data) as stage:
+        product_data['PRODUCT_SIZE'], _ = bin_product_size(product_data.CATEGORY, product_sizes.SIZE)
+        stage.output(product_data)
+    sub_category = product_data.set_index('UPC')['SUB_CATEGORY']
+    with recorder.stage('product_one_hot_encoding', product_data) as stage:
+        product_data = one_hot_encode(product_data, PRODUCT_ONE_HOT)
+        stage.output(product_data)
+    return product_data, sub_category
+
+
+def preprocess_store_data(store_data, recorder):
+    store_data = store_data.drop(columns=STORE_DROPPED)
+    store_data['SEG_VALUE_NAME'] = store_data.SEG_VALUE_NAME.map(SEG_VALUE_NAME_MAP)
+    with recorder.stage('store_one_hot_encoding', store_data) as stage:
+        store_data = one_hot_encode(store_data, STORE_ONE_HOT)
+        stage.output(store_data)
+    return store_data.drop(columns=STORE_CORRELATED)
+
+
+def preprocess_train(data, sub_category, recorder):
+    with recorder.stage('impute_base_price', data) as stage:
+        data['BASE_PRICE'] = impute_base_price(data, sub_category=sub_category)
+        stage.output(data)
+    with recorder.stage('units_sketch', data):
+        sketch = UnitsSketch().update(data)
+    with recorder.stage('flag_outliers', data) as stage:
+        outliers = flag_outliers(data, sketch)
+        stage.output(rows=int(outliers.sum()))
+    with recorder.stage('outlier_filtering', data) as stage:
+        data = data[~outliers]
+        stage.output(data)
+    return data
+
+
+def preprocess(data_dir=DATA_DIR, output_dir='.', transformer=TRANSFORMER, recorder=None):
+    """
+    Run every step and write the three tables to `output_dir`, and the fitted
+    `PreprocessingTransformer` to `transformer` unless it is None. A relative
+    `transformer` is taken in `output_dir`, next to the tables. Returns the
+    tables as a dict keyed like `OUTPUTS`.
+    """
+    recorder = StageRecorder(enabled=False) if recorder is None else recorder
+    with recorder.stage('read_train') as stage:
+        # WEEK_END_DATE is kept as it is in the file, it is only passed through to the output
+        data = read_train(data_dir=data_dir, parse_dates=False)
+        stage.output(data)
+    with recorder.stage('read_product_data') as stage:
+        product_data = read_product_data(data_dir=data_dir)
+        stage.output(product_data)
+    with recorder.stage('read_store_data') as stage:
+        store_data = read_store_data(data_dir=data_dir)
+        stage.output(store_data)
+
+    product_data, sub_category = preprocess_product_data(product_data, recorder)
+    store_data = preprocess_store_data(store_data, recorder)
+    tables = {'train': preprocess_train(data, sub_category, recorder), 'product_data': product_data,
+              'store_data': store_data}
+
+    os.makedirs(output_dir, exist_ok=True)
+    with recorder.stage('csv_write', list(tables.values())) as stage:
+        for name, table in tables.items():
+            table.to_csv(os.path.join(output_dir, OUTPUTS[name]), index=False)
+        stage.output(rows=sum(len(table) for table in tables.values()))
+
+    if transformer is not None:
+        with recorder.stage('fit_transformer'):
+            fitted = PreprocessingTransformer().fit(read_train(data_dir=data_dir), read_product_data(data_dir=data_dir),
+                                                    read_store_data(data_dir=data_dir))
+            fitted.save(os.path.join(output_dir, transformer))
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--transformer', default=TRANSFORMER,
+                        help='where the fitted transformer is saved, relative to --output-dir')
+    parser.add_argument('--no-transformer', action='store_true', help='do not fit the transformer')
+    parser.add_argument('--report', help='JSON or JSONL stage report, PIPELINE_REPORT by default')
+    parser.add_argument('--profile', nargs='+', default=[], help='stages to profile, PIPELINE_PROFILE by default')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='trace the peak memory of every stage, slower; PIPELINE_TRACEMALLOC=1 by default')
+    args = parser.parse_args()
+
+    environ = dict(os.environ)
+    if args.report:
+        environ['PIPELINE_REPORT'] = args.report
+    if args.profile:
+        environ['PIPELINE_PROFILE'] = ','.join(args.profile)
+    if args.tracemalloc:
+        environ['PIPELINE_TRACEMALLOC'] = '1'
+    recorder = StageRecorder.from_env(environ)
+    tables = preprocess(args.data_dir, args.output_dir, None if args.no_transformer else args.transformer, recorder)
+    recorder.close()
+    for name, table in tables.items():
+        print('wrote {:,} rows to {}'.format(len(table), os.path.join(args.output_dir, OUTPUTS[name])))
+    if recorder.records:
+        print(recorder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Table-driven PRODUCT_SIZE parsing and per-category binning.
+
+The bin edges of every CATEGORY live in one table, PRODUCT_SIZE_BINS, or in
+a JSON file with the same layout read by `load_size_bins`. All categories
+are binned with a single `np.digitize` call, so a new category costs one
+line of configuration and no extra pass over the data. Sizes that cannot be
+binned are returned in a report instead of silently becoming NaN.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+# PRODUCT_SIZE bin edges of every CATEGORY, a size in (edges[i-1], edges[i]] gets bin i
+PRODUCT_SIZE_BINS = {
+    'COLD CEREAL': [10, 13, 16, 21],
+    'ORAL HYGIENE PRODUCTS': [0, 501, 1001],
+    'FROZEN PIZZA': [20, 25, 30, 35],
+    'BAG SNACKS': [9, 14, 20],
+}
+
+SIZE_PATTERN = r'^\s*([0-9]*\.?[0-9]+)\s*(.*?)\s*$'
+
+
+def load_size_bins(path):
+    """Read a {CATEGORY: [edges]} table from a JSON file."""
+    with open(path) as f:
+        return {category: [float(edge) for edge in edges] for category, edges in json.load(f).items()}
+
+
+def parse_product_size(sizes):
+    """
+    Split PRODUCT_SIZE values such as '15 OZ' or '1.5 LT' into a float SIZE
+    and an upper-case UNIT. Each distinct value is parsed once.
+    """
+    sizes = pd.Series(sizes)
+    codes, uniques = pd.factorize(sizes)
+    parts = pd.Series(np.asarray(uniques, dtype=object)).astype(str).str.extract(SIZE_PATTERN)
+    size = np.append(pd.to_numeric(parts[0]).values.astype(float), np.nan)
+    unit = np.append(parts[1].str.upper().replace('', np.nan).values, np.nan)
+    # code -1 marks missing values and picks the trailing NaN
+    return pd.DataFrame({'SIZE': size[codes], 'UNIT': unit[codes]}, index=sizes.index)
+
+
+def bin_product_size(categories, sizes, bins=PRODUCT_SIZE_BINS):
+    """
+    Bin the numeric `sizes` with the edges of their category in `bins`.
+
+    Returns the bins (float, NaN where a size could not be binned) and a
+    report of those rows with their CATEGORY, SIZE and REASON.
+    """
+    categories = pd.Series(categories)
+    size = np.asarray(sizes, dtype=float)
+    names = list(bins)
+    edges = [np.asarray(bins[name], dtype=float) for name in names]
+    category = pd.Categorical(np.asarray(categories, dtype=object), categories=names).codes
+
+    # shift the sizes and edges of every category onto its own stretch of the
+    # number line, so one digitize call bins all the categories at once
+    observed = size[~np.isnan(size)]
+    values = np.concatenate(edges + [observed])
+    span = values.max() - values.min() + 1
+    offsets = np.arange(len(names)) * span
+    starts = np.cumsum([0] + [len(e) for e in edges])[:-1]
+    n_bins = np.array([len(e) - 1 for e in edges])
+    shifted_edges = np.concatenate([e + offset for e, offset in zip(edges, offsets)])
+
+    known = category >= 0
+    label = np.zeros(len(size), dtype=np.int64)
+    label[known] = (np.digitize(size[known] + offsets[category[known]], shifted_edges, right=True)
+                    - starts[category[known]])
+    binned = known & ~np.isnan(size) & (label >= 1) & (label <= np.where(known, n_bins[category], 0))
+
+    reason = np.where(~known, 'unknown category',
+                      np.where(np.isnan(size), 'size not parsed', 'size outside the bin edges'))
+    report = pd.DataFrame({'CATEGORY': categories.values, 'SIZE': size, 'REASON': reason},
+                          index=categories.index)[~binned]
+    return pd.Series(np.where(binned, label, np.nan), index=categories.index, name='PRODUCT_SIZE'), report
@@ -0,0 +1,220 @@
+"""
+Single-scan column profiles of the train, product and store tables.
+
+Every statistic the EDA looks at column by column (null counts, cardinality,
+min/max, describe(), value_counts() and the dtype) is derived from one value
+count per column. A table is profiled by counting the values of every column
+of every chunk once and merging the counts, so profiling train.csv costs
+about one read of it instead of one pass per statistic:
+
+    profile = profile_table('train')
+    profile.summary()
+    profile['UNITS'].describe()
+    profile['FEATURE'].top(normalize=True)
+
+Memory is bounded by the number of distinct values of every column, which is
+small for these tables (weeks, stores, UPCs, prices and unit counts).
+"""
+import numpy as np
+import pandas as pd
+
+from .loader import DATA_DIR, iter_table
+
+CHUNKSIZE = 500000
+QUANTILES = (0.25, 0.5, 0.75)
+TOP = 5
+
+
+def observed_counts(values):
+    """value_counts of `values` without NaN and, for categories, without unused categories."""
+    counts = values.value_counts(sort=False)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        counts = counts[counts.values > 0]
+        counts.index = pd.Index(np.asarray(counts.index), dtype=values.dtype.categories.dtype)
+    return counts
+
+
+class ColumnProfile(object):
+    """Merged value counts of one column and the statistics derived from them."""
+
+    def __init__(self, name, dtype):
+        self.name = name
+        self.dtype = dtype
+        self.rows = 0
+        self.counts = pd.Series(dtype=np.int64)
+
+    def update(self, values):
+        """Add the values of one chunk of the column."""
+        self.rows += len(values)
+        counts = observed_counts(values)
+        self.counts = counts if not len(self.counts) else self.counts.add(counts, fill_value=0)
+        return self
+
+    def merge(self, other):
+        """Add the counts of `other`, a profile of the same column."""
+        self.rows += other.rows
+        self.counts = other.counts if not len(self.counts) else self.counts.add(other.counts, fill_value=0)
+        return self
+
+    def sorted_counts(self):
+        counts = self.counts.astype(np.int64)
+        return counts.sort_index()
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def nulls(self):
+        return self.rows - self.count
+
+    @property
+    def distinct(self):
+        return len(self.counts)
+
+    @property
+    def numeric(self):
+        return pd.api.types.is_numeric_dtype(self.counts.index) and not pd.api.types.is_bool_dtype(self.counts.index)
+
+    @property
+    def minimum(self):
+        return self.counts.index.min() if self.distinct else np.nan
+
+    @property
+    def maximum(self):
+        return self.counts.index.max() if self.distinct else np.nan
+
+    def moments(self):
+        """Mean and sample standard deviation of a numeric column."""
+        counts = self.sorted_counts()
+        values = counts.index.values.astype(np.float64)
+        weights = counts.values
+        n = weights.sum()
+        if not n:
+            return np.nan, np.nan
+        mean = (values * weights).sum() / n
+        std = np.sqrt((weights * (values - mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan
+        return mean, std
+
+    def quantiles(self, q=QUANTILES):
+        """Quantiles of a numeric column, interpolated linearly as in Series.quantile."""
+        counts = self.sorted_counts()
+        values = counts.index.values.astype(np.float64)
+        cumulative = np.cumsum(counts.values)
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if not len(values):
+            return pd.Series(np.nan, index=q)
+        rank = q * (cumulative[-1] - 1)
+        lower = values[np.searchsorted(cumulative, np.floor(rank), side='right')]
+        upper = values[np.searchsorted(cumulative, np.ceil(rank), side='right')]
+        return pd.Series(lower + (upper - lower) * (rank - np.floor(rank)), index=q)
+
+    def top(self, k=None, normalize=False):
+        """The `k` most frequent values (all by default) with their counts, as value_counts returns them."""
+        counts = self.counts.astype(np.int64).sort_values(ascending=False, kind='stable')
+        counts = counts if k is None else counts.iloc[:k]
+        counts = counts / self.count if normalize else counts
+        return counts.rename(self.name)
+
+    def describe(self):
+        """Series.describe() of the column."""
+        if not self.numeric:
+            top = self.top(1)
+            return pd.Series([self.count, self.distinct, top.index[0] if len(top) else np.nan,
+                              top.iloc[0] if len(top) else np.nan],
+                             index=['count', 'unique', 'top', 'freq'], name=self.name)
+        mean, std = self.moments()
+        quantiles = self.quantiles()
+        return pd.Series([self.count, mean, std, self.minimum] + list(quantiles.values) + [self.maximum],
+                         index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'], name=self.name)
+
+    @property
+    def inferred_type(self):
+        """
+        'empty', 'constant', 'boolean', 'identifier', 'integer', 'float',
+        'datetime', 'categorical' or 'text'.
+        """
+        if not self.distinct:
+            return 'empty'
+        if self.distinct == 1:
+            return 'constant'
+        index = self.counts.index
+        if pd.api.types.is_datetime64_any_dtype(index):
+            return 'datetime'
+        if self.numeric:
+            values = index.values.astype(np.float64)
+            if self.distinct == 2 and set(values) == {0.0, 1.0}:
+                return 'boolean'
+            if not np.all(values == np.round(values)):
+                return 'float'
+            return 'identifier' if self.distinct == self.count else 'integer'
+        if self.distinct == self.count:
+            return 'identifier'
+        # strings repeated on average at least twice are treated as categories
+        return 'categorical' if self.distinct * 2 <= self.count else 'text'
+
+
+class TableProfile(object):
+    """Column profiles of a table, built chunk by chunk."""
+
+    def __init__(self):
+        self.columns = {}
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    @property
+    def rows(self):
+        return next(iter(self.columns.values())).rows if self.columns else 0
+
+    @property
+    def shape(self):
+        return self.rows, len(self.columns)
+
+    def update(self, frame):
+        """Add the rows of `frame`, one chunk of the table."""
+        for name in frame.columns:
+            if name not in self.columns:
+                self.columns[name] = ColumnProfile(name, frame[name].dtype)
+            self.columns[name].update(frame[name])
+        return self
+
+    def merge(self, other):
+        for name, column in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(column)
+            else:
+                self.columns[name] = column
+        return self
+
+    def summary(self, columns=None, top=TOP):
+        """One row per column: dtype, inferred type, nulls, cardinality, range, quartiles and top values."""
+        rows = []
+        for name in (self.columns if columns is None else columns):
+            column = self.columns[name]
+            row = {'dtype': column.dtype, 'inferred_type': column.inferred_type, 'count': column.count,
+                   'nulls': column.nulls, 'distinct': column.distinct,
+                   'min': column.minimum, 'max': column.maximum}
+            if column.numeric:
+                row.update(zip(['25%', '50%', '75%'], column.quantiles().values))
+            row['top'] = list(column.top(top).items())
+            rows.append(row)
+        summary = pd.DataFrame(rows, index=pd.Index(list(self.columns if columns is None else columns)))
+        return summary.reindex(columns=['dtype', 'inferred_type', 'count', 'nulls', 'distinct', 'min', '25%',
+                                        '50%', '75%', 'max', 'top'])
+
+
+def profile_frame(frame):
+    """Profile an in-memory table."""
+    return TableProfile().update(frame)
+
+
+def profile_table(name, columns=None, data_dir=DATA_DIR, chunksize=CHUNKSIZE, parse_dates=True):
+    """Profile table `name` ('train', 'product_data' or 'store_data') in one chunked pass over its CSV."""
+    profile = TableProfile()
+    for chunk in iter_table(name, chunksize, columns=columns, data_dir=data_dir, parse_dates=parse_dates):
+        profile.update(chunk)
+    return profile
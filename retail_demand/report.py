@@ -0,0 +1,245 @@
+"""
+Headless, parallel rendering of the EDA figures.
+
+The figures of the EDA notebook are described as specs: a module-level draw
+function plus the compact numpy arrays it needs. The data is prepared once
+in the parent process; the specs are rendered in a process pool on the Agg
+backend and written as PNG files to the output directory. Workers never see
+a DataFrame, and the full-population plots (the sorted UNITS curve and the
+BASE_PRICE vs UNITS scatters) are reduced with `downsample` before they are
+sent to them.
+
+    python -m retail_demand report --data-dir dataset --out report --workers 4
+    python -m retail_demand report --category 'BAG SNACKS' --dpi 100 --figure-dpi weekly_units_BAG_SNACKS=300
+    python -m retail_demand report --state TX --out report_tx
+"""
+import argparse
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .downsample import binned_density, draw_density, sorted_curve
+from .loader import DATA_DIR, read_product_data, read_store_data, read_train
+from .series_index import SeriesIndex
+from .star import StarSchema
+
+DPI = 100
+
+FigureSpec = namedtuple('FigureSpec', ['name', 'draw', 'data', 'figsize', 'dpi'])
+
+
+def use_agg():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def draw_histogram(fig, data):
+    ax = fig.add_subplot()
+    ax.hist(data['values'], bins=int(data['bins']))
+    ax.set_xlabel(str(data['xlabel']), fontsize=12)
+
+
+def draw_bars(fig, data):
+    ax = fig.add_subplot()
+    ax.bar([str(label) for label in data['labels']], data['heights'])
+    ax.set_xlabel(str(data['xlabel']), fontsize=12)
+
+
+def draw_sorted(fig, data):
+    ax = fig.add_subplot()
+    ax.scatter(data['index'], data['values'], s=4)
+    ax.set_xlabel('Index', fontsize=12)
+    ax.set_ylabel(str(data['ylabel']), fontsize=12)
+
+
+def draw_scatter(fig, data):
+    ax = fig.add_subplot()
+    ax.scatter(data['x'], data['y'], s=4)
+    ax.set_xlabel(str(data['xlabel']), fontsize=12)
+    ax.set_ylabel(str(data['ylabel']), fontsize=12)
+
+
+def draw_price_density(fig, data):
+    ax = fig.add_subplot()
+    mesh = draw_density(ax, data['density'])
+    if mesh is not None:
+        fig.colorbar(mesh, ax=ax, label='rows')
+    ax.set_xlabel(str(data['xlabel']), fontsize=12)
+    ax.set_ylabel(str(data['ylabel']), fontsize=12)
+
+
+def draw_line(fig, data):
+    ax = fig.add_subplot()
+    ax.plot(data['weeks'], data['values'])
+    ax.set_ylabel(str(data['ylabel']), fontsize=12)
+
+
+def draw_series_grid(fig, data):
+    # one row per series, each with one or more lines (e.g. UNITS and 1000 * FEATURE)
+    lines = data['lines']
+    axs = fig.subplots(lines.shape[1], 1, squeeze=False)[:, 0]
+    for j, ax in enumerate(axs):
+        for line in lines[:, j]:
+            ax.plot(data['weeks'], line)
+        ax.set_title(str(data['titles'][j]), y=0.75, fontsize=16)
+    fig.tight_layout()
+
+
+def draw_boxes(fig, data):
+    ax = fig.add_subplot()
+    groups = np.split(data['values'], data['splits'])
+    ax.boxplot(groups)
+    ax.set_xticks(np.arange(1, len(groups) + 1))
+    ax.set_xticklabels([str(label) for label in data['labels']], rotation=45)
+    ax.set_ylabel(str(data['ylabel']), fontsize=12)
+
+
+def render(spec, out_dir):
+    """Draw one spec and write it to `out_dir`; runs in the worker processes."""
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    fig = plt.figure(figsize=spec.figsize)
+    spec.draw(fig, spec.data)
+    path = os.path.join(out_dir, spec.name + '.png')
+    fig.savefig(path, dpi=spec.dpi)
+    plt.close(fig)
+    return path, time.perf_counter() - start
+
+
+def slug(text):
+    return re.sub(r'[^0-9A-Za-z]+', '_', str(text)).strip('_')
+
+
+def grouped_values(values, groups):
+    """`values` ordered by `groups` with the split points and labels `draw_boxes` expects."""
+    order = np.argsort(groups, kind='stable')
+    labels, starts = np.unique(np.asarray(groups)[order], return_index=True)
+    return {'values': np.asarray(values)[order], 'splits': starts[1:], 'labels': labels}
+
+
+def build_specs(train, product_data, store_data, dpi=DPI, figure_dpi=None):
+    """Figure specs of the EDA report for the given (possibly filtered) tables."""
+    figure_dpi = figure_dpi or {}
+    specs = []
+
+    def add(name, draw, data, figsize=(8, 6)):
+        specs.append(FigureSpec(name, draw, data, figsize, figure_dpi.get(name, dpi)))
+
+    units = train['UNITS'].values
+    add('base_price_distribution', draw_histogram,
+        {'values': train['BASE_PRICE'].dropna().values, 'bins': 20, 'xlabel': 'Price Distribution'})
+    index, curve = sorted_curve(units)
+    add('units_sorted', draw_sorted, {'index': index, 'values': curve, 'ylabel': 'Units Sold'})
+    add('units_distribution', draw_histogram, {'values': units, 'bins': 25, 'xlabel': 'Units Sold'})
+    add('log_units_distribution', draw_histogram,
+        {'values': np.log(units[units > 0]), 'bins': 25, 'xlabel': 'Log Units Sold'})
+    for flag in ('FEATURE', 'DISPLAY'):
+        share = train[flag].value_counts(normalize=True).sort_index()
+        add(flag.lower() + '_share', draw_bars, {'labels': share.index.values, 'heights': share.values,
+                                                 'xlabel': flag})
+
+    weekly = train.groupby('WEEK_END_DATE')['UNITS'].sum()
+    add('weekly_demand', draw_line, {'weeks': weekly.index.values, 'values': weekly.values, 'ylabel': 'UNITS'},
+        figsize=(30, 10))
+
+    products = SeriesIndex.build(train, by='UPC', metadata=product_data)
+    star = StarSchema(train, product_data, store_data)
+    for category in product_data['CATEGORY'].dropna().unique():
+        upcs = [upc for upc in product_data.loc[product_data['CATEGORY'] == category, 'UPC'] if upc in products]
+        if not upcs:
+            continue
+        titles = np.array([products.title(upc, ['MANUFACTURER', 'DESCRIPTION']) for upc in upcs])
+        sales = np.stack([products.array(upc, 'UNITS') for upc in upcs])
+        featured = 1000 * np.stack([products.array(upc, 'FEATURE') for upc in upcs])
+        displayed = 1000 * np.stack([products.array(upc, 'DISPLAY') for upc in upcs])
+        weeks = products.weeks.values
+        name = slug(category)
+        add('weekly_units_' + name, draw_series_grid,
+            {'weeks': weeks, 'lines': sales[None], 'titles': titles}, figsize=(20, 20))
+        add('featured_' + name, draw_series_grid,
+            {'weeks': weeks, 'lines': np.stack([featured, sales]), 'titles': titles}, figsize=(20, 20))
+        add('displayed_' + name, draw_series_grid,
+            {'weeks': weeks, 'lines': np.stack([sales, displayed]), 'titles': titles}, figsize=(20, 20))
+
+        rows = star.rows_where('CATEGORY', [category])
+        density = binned_density(star.column('BASE_PRICE', rows).values, star.column('UNITS', rows).values)
+        add('price_vs_units_' + name, draw_price_density,
+            {'density': density, 'xlabel': 'BASE_PRICE', 'ylabel': 'UNITS'})
+        data = grouped_values(star.column('UNITS', rows).values,
+                              np.asarray(star.column('MANUFACTURER', rows).values, dtype=object).astype(str))
+        add('manufacturer_units_' + name, draw_boxes, dict(data, ylabel='UNITS'), figsize=(20, 6))
+
+    weekly_store = train.groupby(['WEEK_END_DATE', 'STORE_NUM'], observed=True)['UNITS'].sum().reset_index()
+    weekly_store = star.lookup(weekly_store, ['ADDRESS_STATE_PROV_CODE'], by='STORE_NUM')
+    labels = (weekly_store['ADDRESS_STATE_PROV_CODE'].astype(str) + ' ' + weekly_store['STORE_NUM'].astype(str)).values
+    add('store_weekly_units_by_state', draw_boxes,
+        dict(grouped_values(weekly_store['UNITS'].values, labels), ylabel='UNITS'), figsize=(50, 15))
+
+    totals = star.totals('UNITS', by='STORE_NUM')
+    stores = star.dimensions['store']
+    add('store_size_vs_units', draw_scatter,
+        {'x': stores['SALES_AREA_SIZE_NUM'].values, 'y': totals.values,
+         'xlabel': 'SALES_AREA_SIZE_NUM', 'ylabel': 'UNITS'})
+    return specs
+
+
+def filter_tables(train, product_data, store_data, category=None, state=None):
+    """Restrict the tables to one product CATEGORY and/or one store state."""
+    if category is not None:
+        product_data = product_data[product_data['CATEGORY'] == category]
+        train = train[train['UPC'].isin(product_data['UPC'])]
+    if state is not None:
+        store_data = store_data[store_data['ADDRESS_STATE_PROV_CODE'] == state]
+        train = train[train['STORE_NUM'].isin(store_data['STORE_ID'])]
+    return train, product_data, store_data
+
+
+def render_report(specs, out_dir, workers=None):
+    """Render `specs` into `out_dir` in a pool of `workers` processes; returns {path: seconds}."""
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(workers, initializer=use_agg) as pool:
+        futures = [pool.submit(render, spec, out_dir) for spec in specs]
+        return dict(future.result() for future in futures)
+
+
+def parse_figure_dpi(values):
+    figure_dpi = {}
+    for value in values:
+        name, _, dpi = value.partition('=')
+        figure_dpi[name] = int(dpi)
+    return figure_dpi
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--out', default='report')
+    parser.add_argument('--workers', type=int, default=None, help='processes, all cores by default')
+    parser.add_argument('--dpi', type=int, default=DPI, help='resolution of every figure')
+    parser.add_argument('--figure-dpi', action='append', default=[], metavar='NAME=DPI',
+                        help='resolution of one figure, can be repeated')
+    parser.add_argument('--category', help='only the products of this CATEGORY')
+    parser.add_argument('--state', help='only the stores of this ADDRESS_STATE_PROV_CODE')
+    args = parser.parse_args()
+
+    train = read_train(data_dir=args.data_dir)
+    # the EDA drops the single row with no units sold
+    train = train[train['UNITS'] != 0]
+    tables = filter_tables(train, read_product_data(data_dir=args.data_dir), read_store_data(data_dir=args.data_dir),
+                           args.category, args.state)
+    specs = build_specs(*tables, dpi=args.dpi, figure_dpi=parse_figure_dpi(args.figure_dpi))
+
+    start = time.perf_counter()
+    timings = render_report(specs, args.out, args.workers)
+    for path, seconds in sorted(timings.items()):
+        print('{:8.2f} s  {}'.format(seconds, path))
+    print('rendered {} figures in {:.2f} s'.format(len(timings), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
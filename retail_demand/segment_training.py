@@ -0,0 +1,247 @@
+"""
+Per-segment demand models trained in a process pool over one shared feature matrix.
+
+The rows of the feature table (the `temporal_features.py` output, or any
+preprocessed train table) are sorted by segment, e.g. CATEGORY,
+SEG_VALUE_NAME or a store cluster label, and written once into shared memory
+as a float64 feature matrix and a target vector. Every segment is a
+contiguous block of rows. Pool workers attach to the shared blocks when they
+start, and a task only names a segment and its row range, so the matrix is
+never pickled to the workers. The largest segments are submitted first.
+
+Segments are the values of any column of the feature table, the product table
+(joined on UPC) or the store table (joined on STORE_NUM); several columns
+segment by their combinations. The product and store tables are the raw
+ones of `--data-dir`, where CATEGORY, SEG_VALUE_NAME and the other
+attributes are still labels rather than one-hot or mapped codes. A store
+cluster is a column of a store table given with `--store-data`.
+
+    results = train_segments(features, 'CATEGORY', workers=4)   # one SegmentResult per segment
+    predictions = predict_segments(features, 'CATEGORY', {r.segment: r.model for r in results})
+
+    python -m retail_demand segment_training --segment CATEGORY --workers 4
+    python -m retail_demand segment_training --segment SEG_VALUE_NAME --segment CATEGORY --alpha 10 --output models.pkl
+"""
+import argparse
+import pickle
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from .loader import DATA_DIR, read_product_data, read_store_data
+
+TARGET = 'UNITS'
+# keys of the rows
+EXCLUDED = ('WEEK_END_DATE', 'STORE_NUM', 'UPC')
+ALPHA = 1.0
+# rows filled and multiplied at once by the ridge model
+BLOCK = 65536
+
+SegmentResult = namedtuple('SegmentResult', ['segment', 'model', 'rows', 'seconds', 'rmse'])
+
+
+class RidgeModel(object):
+    """
+    Ridge regression on standardized features, solved in closed form. NaN
+    features (e.g. the lags of the first weeks of a series) are replaced by
+    the training mean of their column; constant columns get no weight.
+    """
+
+    def __init__(self, alpha=ALPHA):
+        self.alpha = alpha
+
+    def fit(self, X, y):
+        n_rows, n_features = X.shape
+        totals = np.zeros(n_features)
+        counts = np.zeros(n_features)
+        for start in range(0, n_rows, BLOCK):
+            block = X[start:start + BLOCK]
+            observed = ~np.isnan(block)
+            totals += np.where(observed, block, 0).sum(axis=0)
+            counts += observed.sum(axis=0)
+        self.means = np.divide(totals, counts, out=np.zeros(n_features), where=counts > 0)
+
+        # Gram matrix of the centered features, a block of filled rows at a time
+        y = np.asarray(y, dtype=np.float64)
+        y_mean = y.mean() if n_rows else 0.0
+        gram = np.zeros((n_features, n_features))
+        moments = np.zeros(n_features)
+        for start in range(0, n_rows, BLOCK):
+            block = self.fill(X[start:start + BLOCK]) - self.means
+            gram += block.T @ block
+            moments += block.T @ (y[start:start + BLOCK] - y_mean)
+        # ridge on the standardized features is ridge on the raw ones with each penalty scaled by the variance
+        variance = np.diag(gram) / max(n_rows, 1)
+        penalty = self.alpha * np.where(variance > 0, variance, 1.0)
+        self.coef = np.linalg.solve(gram + np.diag(penalty), moments)
+        self.intercept = y_mean - self.means @ self.coef
+        return self
+
+    def fill(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return np.where(np.isnan(X), self.means, X)
+
+    def predict(self, X):
+        return np.concatenate([self.fill(X[start:start + BLOCK]) @ self.coef + self.intercept
+                               for start in range(0, len(X), BLOCK)] or [np.empty(0)])
+
+
+class SharedArray(object):
+    """
+    A numpy array in a shared memory block. It pickles as the name of the
+    block, so a process that receives it attaches instead of copying.
+    """
+
+    def __init__(self, shape, dtype=np.float64, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.block = SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.block.buf)
+
+    def __getstate__(self):
+        return {'shape': self.shape, 'dtype': self.dtype.str, 'name': self.block.name}
+
+    def __setstate__(self, state):
+        self.__init__(state['shape'], state['dtype'], state['name'])
+
+    def close(self):
+        """Detach; the process that created the block also frees it."""
+        self.array = None
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
+
+
+# the shared feature matrix and target of a worker, attached once by `attach`
+_shared = {}
+
+
+def attach(X, y):
+    _shared['X'], _shared['y'] = X, y
+
+
+def train_segment(segment, start, stop, model):
+    """Fit a copy of `model` on rows start..stop of the shared matrix."""
+    X = _shared['X'].array[start:stop]
+    y = _shared['y'].array[start:stop]
+    began = time.perf_counter()
+    fitted = pickle.loads(pickle.dumps(model)).fit(X, y)
+    seconds = time.perf_counter() - began
+    error = fitted.predict(X) - y
+    return SegmentResult(segment, fitted, stop - start, seconds, float(np.sqrt(np.mean(error * error))))
+
+
+def feature_columns(data, segments=(), target=TARGET):
+    """The numeric columns of `data` used as features: all but the keys, the target and the segment columns."""
+    skip = set(EXCLUDED) | {target} | set(segments)
+    return [name for name in data.columns if name not in skip and pd.api.types.is_numeric_dtype(data[name])]
+
+
+def add_segment_columns(data, segments, product_data=None, store_data=None):
+    """`data` with the `segments` columns it lacks, looked up in the product and store tables."""
+    for name in segments:
+        if name in data:
+            continue
+        if product_data is not None and name in product_data:
+            data = data.assign(**{name: data['UPC'].map(product_data.set_index('UPC')[name])})
+        elif store_data is not None and name in store_data:
+            data = data.assign(**{name: data['STORE_NUM'].map(store_data.set_index('STORE_ID')[name])})
+        else:
+            raise KeyError('segment column {!r} is not in the feature, product or store table'.format(name))
+    return data
+
+
+def segment_rows(data, segments):
+    """Row order that groups the segments, and (segment, start, stop) of every segment in that order."""
+    codes = data.groupby(list(segments), sort=True, dropna=False).ngroup().values
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(codes.max() + 2 if len(codes) else 1))
+    labels = data.iloc[order[bounds[:-1]]][list(segments)] if len(codes) else data[list(segments)].iloc[:0]
+    ranges = [(tuple(label) if len(segments) > 1 else label[0], int(start), int(stop))
+              for label, start, stop in zip(labels.itertuples(index=False), bounds[:-1], bounds[1:])]
+    return order, ranges
+
+
+def train_segments(data, segments, model=None, workers=None, features=None, target=TARGET):
+    """
+    Train one copy of `model` (any object with fit(X, y) and predict(X),
+    RidgeModel() by default) per segment of `data` in a pool of `workers`
+    processes. Returns a SegmentResult per segment, largest segments first.
+    """
+    segments = [segments] if isinstance(segments, str) else list(segments)
+    model = RidgeModel() if model is None else model
+    features = feature_columns(data, segments, target) if features is None else list(features)
+    order, ranges = segment_rows(data, segments)
+
+    X = SharedArray((len(data), len(features)))
+    y = SharedArray((len(data),))
+    try:
+        # filled column by column, so the sorted matrix is the only copy of the features
+        for j, name in enumerate(features):
+            X.array[:, j] = data[name].values[order]
+        y.array[:] = data[target].values[order]
+        ranges.sort(key=lambda segment: segment[1] - segment[2])
+        with ProcessPoolExecutor(workers, initializer=attach, initargs=(X, y)) as pool:
+            futures = [pool.submit(train_segment, segment, start, stop, model) for segment, start, stop in ranges]
+            return [future.result() for future in futures]
+    finally:
+        X.close()
+        y.close()
+
+
+def predict_segments(data, segments, models, features=None, target=TARGET):
+    """Predictions of the model of every row's segment, NaN for segments without a model."""
+    segments = [segments] if isinstance(segments, str) else list(segments)
+    features = feature_columns(data, segments, target) if features is None else list(features)
+    order, ranges = segment_rows(data, segments)
+    X = data[features].to_numpy(np.float64)
+    predictions = np.full(len(data), np.nan)
+    for segment, start, stop in ranges:
+        if segment in models:
+            rows = order[start:stop]
+            predictions[rows] = models[segment].predict(X[rows])
+    return pd.Series(predictions, index=data.index, name=target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', default='train_features.csv')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='raw product and store tables the segments come from')
+    parser.add_argument('--product-data', help='product table CSV used instead of the raw one')
+    parser.add_argument('--store-data', help='store table CSV used instead of the raw one, e.g. with cluster labels')
+    parser.add_argument('--segment', action='append', default=[], help='segment column, can be repeated')
+    parser.add_argument('--workers', type=int, default=None, help='processes, all cores by default')
+    parser.add_argument('--alpha', type=float, default=ALPHA, help='ridge penalty on the standardized features')
+    parser.add_argument('--output', default='segment_models.pkl')
+    args = parser.parse_args()
+    segments = args.segment or ['CATEGORY']
+
+    product_data = pd.read_csv(args.product_data) if args.product_data else read_product_data(data_dir=args.data_dir)
+    store_data = pd.read_csv(args.store_data) if args.store_data else read_store_data(data_dir=args.data_dir)
+    data = add_segment_columns(pd.read_csv(args.input), segments, product_data, store_data)
+    features = feature_columns(data, segments)
+    start = time.perf_counter()
+    results = train_segments(data, segments, RidgeModel(args.alpha), args.workers, features)
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        print('{:8.2f} s  {:>10,} rows  RMSE {:8.3f}  {}'.format(result.seconds, result.rows, result.rmse,
+                                                                 result.segment))
+    with open(args.output, 'wb') as f:
+        pickle.dump({'segments': segments, 'features': features,
+                     'models': {result.segment: result.model for result in results}}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    print('trained {} models in {:.2f} s ({:.2f} s of fitting), written to {}'.format(
+        len(results), elapsed, sum(result.seconds for result in results), args.output))
+
+
+if __name__ == '__main__':
+    # run the importable module's main, so the pickled models refer to retail_demand.segment_training.RidgeModel
+    from retail_demand.segment_training import main
+    main()
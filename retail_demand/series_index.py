@@ -0,0 +1,85 @@
+"""
+Weekly series of every UPC or every store, built with one groupby.
+
+`SeriesIndex.build` aggregates the train rows by (key, WEEK_END_DATE) once
+and scatters the result into one contiguous (keys x weeks) array per
+measure, so looking up the weekly series of a key is a row of an array
+instead of another boolean scan of the train table:
+
+    products = SeriesIndex.build(train, by='UPC', metadata=product_data)
+    units = products.series(upc, 'UNITS')
+    title = products.title(upc, ['MANUFACTURER', 'DESCRIPTION'])
+
+Weeks without rows for a key are NaN, and looking up a key without any
+train rows, e.g. a store of store_data that is not in train, raises a
+KeyError naming the key.
+"""
+import numpy as np
+import pandas as pd
+
+# measure -> aggregation over the rows of a key and week
+AGGREGATIONS = {
+    'UNITS': 'sum',
+    'FEATURE': 'mean',
+    'DISPLAY': 'mean',
+    'BASE_PRICE': 'mean',
+}
+
+# column of the metadata table that holds the key
+METADATA_KEYS = {'UPC': 'UPC', 'STORE_NUM': 'STORE_ID'}
+
+
+class SeriesIndex(object):
+
+    def __init__(self, by, keys, weeks, values, metadata=None):
+        self.by = by
+        self.keys = keys
+        self.weeks = weeks
+        self.values = values
+        self.metadata = metadata
+        self.position = {key: i for i, key in enumerate(keys.tolist())}
+
+    @classmethod
+    def build(cls, train, by='UPC', measures=('UNITS', 'FEATURE', 'DISPLAY'), metadata=None):
+        """Index the weekly `measures` of every `by` key ('UPC' or 'STORE_NUM') of `train`."""
+        grouped = train.groupby([by, 'WEEK_END_DATE'], observed=True, sort=False).agg(
+            **{name: (name, AGGREGATIONS[name]) for name in measures})
+        key_codes, keys = pd.factorize(grouped.index.get_level_values(0), sort=True)
+        week_codes, weeks = pd.factorize(grouped.index.get_level_values(1), sort=True)
+
+        values = {}
+        for name in measures:
+            matrix = np.full((len(keys), len(weeks)), np.nan)
+            matrix[key_codes, week_codes] = grouped[name].values
+            values[name] = matrix
+
+        if metadata is not None:
+            metadata = metadata.set_index(METADATA_KEYS[by])
+        return cls(by, np.asarray(keys), pd.Index(weeks, name='WEEK_END_DATE'), values, metadata)
+
+    def __contains__(self, key):
+        return key in self.position
+
+    def row(self, key):
+        """Row of `key` in the index arrays."""
+        try:
+            return self.position[key]
+        except KeyError:
+            raise KeyError('{} {!r} has no train rows'.format(self.by, key)) from None
+
+    def array(self, key, measure='UNITS'):
+        """Weekly values of `key` as a view of the index arrays."""
+        return self.values[measure][self.row(key)]
+
+    def series(self, key, measure='UNITS'):
+        """Weekly values of `key` as a Series indexed by WEEK_END_DATE."""
+        return pd.Series(self.array(key, measure), index=self.weeks, name=measure)
+
+    def meta(self, key):
+        """Metadata row of `key`."""
+        return self.metadata.loc[key]
+
+    def title(self, key, columns):
+        """The metadata `columns` of `key` joined with spaces, e.g. for plot titles."""
+        row = self.meta(key)
+        return ' '.join(str(row[column]) for column in columns)
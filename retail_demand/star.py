@@ -0,0 +1,107 @@
+"""
+Star-schema view of the train, product and store tables.
+
+The weekly sales rows stay a narrow fact table with integer codes into the
+product and store dimension tables, instead of being left-merged with every
+product and store column. Attributes are gathered from the small dimension
+tables on demand and only the requested columns are materialized:
+
+    star = StarSchema(train, product_data, store_data)
+    cereal = star.frame(['BASE_PRICE', 'UNITS'], rows=star.rows_where('CATEGORY', ['COLD CEREAL']))
+
+Rows whose UPC or STORE_NUM is missing from a dimension get NaN attributes,
+as with the left merges they replace.
+"""
+import numpy as np
+import pandas as pd
+
+# fact key -> (dimension, dimension key)
+DIMENSIONS = {
+    'UPC': ('product', 'UPC'),
+    'STORE_NUM': ('store', 'STORE_ID'),
+}
+
+
+def key_codes(keys, values):
+    """Positions of `values` in the sorted `keys`, -1 where a value is missing."""
+    values = np.asarray(values)
+    positions = np.minimum(np.searchsorted(keys, values), max(len(keys) - 1, 0))
+    found = keys[positions] == values if len(keys) else np.zeros(len(values), dtype=bool)
+    return np.where(found, positions, -1)
+
+
+class StarSchema(object):
+
+    def __init__(self, train, product_data, store_data):
+        self.fact = train.reset_index(drop=True)
+        self.dimensions = {
+            'product': product_data.sort_values('UPC').reset_index(drop=True),
+            'store': store_data.sort_values('STORE_ID').reset_index(drop=True),
+        }
+        self.codes = {}
+        for fact_key, (dimension, key) in DIMENSIONS.items():
+            table = self.dimensions[dimension]
+            self.codes[dimension] = key_codes(table[key].values, self.fact[fact_key].values)
+
+        # where every column comes from, in the column order of the merged frame
+        self.sources = {column: None for column in self.fact.columns}
+        for dimension in ('product', 'store'):
+            for column in self.dimensions[dimension].columns:
+                self.sources.setdefault(column, dimension)
+
+    @property
+    def columns(self):
+        return list(self.sources)
+
+    @property
+    def shape(self):
+        return len(self.fact), len(self.sources)
+
+    def __len__(self):
+        return len(self.fact)
+
+    def column(self, name, rows=None):
+        """Column `name` of the fact rows selected by `rows` (a boolean mask or positions)."""
+        dimension = self.sources[name]
+        if dimension is None:
+            values = self.fact[name]
+            return values if rows is None else values[rows].reset_index(drop=True)
+        codes = self.codes[dimension] if rows is None else self.codes[dimension][rows]
+        values = pd.api.extensions.take(self.dimensions[dimension][name].array, codes, allow_fill=True)
+        return pd.Series(values, name=name)
+
+    def frame(self, columns=None, rows=None):
+        """DataFrame of `columns` (all by default) for the fact rows selected by `rows`."""
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({name: self.column(name, rows).values for name in columns})
+
+    def rows_where(self, name, values):
+        """Boolean mask of the fact rows whose column `name` is in `values`."""
+        dimension = self.sources[name]
+        if dimension is None:
+            return self.fact[name].isin(values).values
+        # evaluate the condition on the small dimension table, then gather it
+        matches = np.append(self.dimensions[dimension][name].isin(values).values, False)
+        return matches[self.codes[dimension]]
+
+    def totals(self, value, by='STORE_NUM'):
+        """
+        Sum of the fact column `value` for every row of the dimension of `by`
+        ('STORE_NUM' or 'UPC'), NaN for dimension rows without facts.
+        """
+        dimension, key = DIMENSIONS[by]
+        codes = self.codes[dimension]
+        known = codes >= 0
+        size = len(self.dimensions[dimension])
+        total = np.bincount(codes[known], weights=self.fact[value].values[known], minlength=size)
+        count = np.bincount(codes[known], minlength=size)
+        return pd.Series(np.where(count > 0, total, np.nan), index=self.dimensions[dimension][key].values,
+                         name=value)
+
+    def lookup(self, frame, columns, by='STORE_NUM'):
+        """Add the dimension `columns` of the `by` key of every row of `frame` to it."""
+        dimension, key = DIMENSIONS[by]
+        table = self.dimensions[dimension]
+        codes = key_codes(table[key].values, frame[by].values)
+        attributes = {name: pd.api.extensions.take(table[name].array, codes, allow_fill=True) for name in columns}
+        return frame.assign(**attributes)
@@ -0,0 +1,76 @@
+"""
+Chunked streaming version of the train data steps of Preprocessing.py, for
+train files that do not fit in memory.
+
+The first pass sums the observed prices of every UPC and builds the UNITS
+quantile sketch of every (STORE_NUM, UPC) series. The second pass imputes
+BASE_PRICE chunk by chunk, carrying the last observed price of every series
+from one chunk to the next, removes the rows outside the UNITS fences of
+their series and appends each chunk to the output. Memory is bounded by the
+chunk size and the number of series, not by the number of rows.
+
+The forward fill follows file order, so train.csv is expected to be ordered
+by WEEK_END_DATE, as the extracts are.
+
+    python -m retail_demand streaming --data-dir dataset --output updated_train_data.csv
+"""
+import argparse
+
+from .imputation import fallback_prices, impute_base_price, last_observed_price, price_totals
+from .loader import DATA_DIR, iter_table, read_product_data
+from .outliers import FENCE, UnitsSketch, flag_outliers
+
+CHUNKSIZE = 500000
+
+
+def train_statistics(data_dir=DATA_DIR, chunksize=CHUNKSIZE):
+    """
+    Sum and count of the observed BASE_PRICE of every UPC and the UNITS
+    sketch of every series, in one pass over train.csv.
+    """
+    totals = None
+    sketch = UnitsSketch()
+    columns = ['STORE_NUM', 'UPC', 'BASE_PRICE', 'UNITS']
+    for chunk in iter_table('train', chunksize, columns=columns, data_dir=data_dir):
+        part = price_totals(chunk)
+        totals = part if totals is None else totals.add(part, fill_value=0)
+        sketch.update(chunk)
+    return totals, sketch
+
+
+def preprocess_train(output='updated_train_data.csv', data_dir=DATA_DIR, chunksize=CHUNKSIZE, fence=FENCE):
+    """
+    Impute BASE_PRICE and drop the UNITS outliers of train.csv chunk by chunk,
+    writing the result to `output`. Returns the number of rows written.
+    """
+    totals, sketch = train_statistics(data_dir, chunksize)
+    sub_category = read_product_data(columns=['UPC', 'SUB_CATEGORY'], data_dir=data_dir)
+    fallback = fallback_prices(totals, sub_category.set_index('UPC')['SUB_CATEGORY'])
+    fences = sketch.fences(fence)
+
+    last_price = None
+    written = 0
+    # WEEK_END_DATE is passed through to the output as it is in the file
+    for i, chunk in enumerate(iter_table('train', chunksize, data_dir=data_dir, parse_dates=False)):
+        base_price = impute_base_price(chunk, fallback=fallback, last_price=last_price)
+        last_price = last_observed_price(chunk, last_price)
+        chunk = chunk.assign(BASE_PRICE=base_price)
+        chunk = chunk[~flag_outliers(chunk, sketch, fences=fences)]
+        chunk.to_csv(output, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        written += len(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--output', default='updated_train_data.csv')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    parser.add_argument('--fence', type=float, default=FENCE, help='width of the UNITS fences in IQRs')
+    args = parser.parse_args()
+    written = preprocess_train(args.output, args.data_dir, args.chunksize, args.fence)
+    print('wrote {:,} rows to {}'.format(written, args.output))
+
+
+if __name__ == '__main__':
+    main()
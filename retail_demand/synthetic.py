@@ -0,0 +1,328 @@
+"""
+Synthetic train, product_data and store_data tables with the schema of the
+extracts, at any scale.
+
+Products and stores get the attributes the notebooks and scripts use.
+Products have a CATEGORY, SUB_CATEGORY, MANUFACTURER and a PRODUCT_SIZE
+inside the `product_size` bins of its category. Stores have a state, MSA, SEG_VALUE_NAME, a
+sales area and baskets, and PARKING_SPACE_QTY correlated with the area and
+sometimes missing. Every (STORE_NUM, UPC) series has weekly rows with
+BASE_PRICE, FEATURE, DISPLAY and UNITS, where UNITS is a gamma-Poisson draw
+around
+
+    base demand x store size x yearly season x trend
+        x (BASE_PRICE / list price) ** elasticity x FEATURE lift x DISPLAY lift
+
+The UPC's list price scales with the store segment. BASE_PRICE moves away
+from it at price changes every `PRICE_EPOCH` weeks. Each UPC has its own
+elasticity and promotion lifts. A share of the series is not carried
+(`assortment`), and a share of the weeks of a carried series has no row
+(`sparsity`). Weeks without sales have no row either, and `missing_price`
+of the prices are left empty.
+
+train is written in `shards` files of consecutive weeks by a process pool.
+The rows stay in WEEK_END_DATE order, which `streaming.py` expects. Every
+week is drawn from its own seed, so the data does not depend on the number
+of shards or workers. CSV shards are concatenated into train.csv unless
+`--keep-shards` is given. Parquet shards (pyarrow) stay as train/part-*.parquet,
+which the loader reads when there is no train.csv.
+
+    python -m retail_demand synthetic --out synthetic --scale 100 --workers 8      # ~100 times the extract
+    python -m retail_demand synthetic --out synthetic --stores 1000 --upcs 1000 --weeks 142 --format parquet
+    python -m retail_demand synthetic --out synthetic --sparsity 0.2 --missing-price 0.01 --feature-rate 0.1
+"""
+import argparse
+import os
+import shutil
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pa_csv = pq = None
+
+from .loader import DATE_FORMAT, PRODUCT_SCHEMA, STORE_SCHEMA, TRAIN_SCHEMA
+
+FIRST_WEEK = '2009-01-14'
+# weeks between the price changes of a series
+PRICE_EPOCH = 13
+# shape of the gamma mixing of the Poisson demand, lower is noisier
+DISPERSION = 4.0
+
+# CATEGORY -> (SUB_CATEGORY values, PRODUCT_SIZE values, list price range, mean weekly units, elasticity range)
+CATEGORIES = {
+    'BAG SNACKS': (['PRETZELS'], ['10 OZ', '12 OZ', '15 OZ', '16 OZ'], (1.0, 4.0), 18.0, (-2.5, -1.0)),
+    'COLD CEREAL': (['ALL FAMILY CEREAL', 'ADULT CEREAL', 'KIDS CEREAL'],
+                    ['12 OZ', '12.2 OZ', '15 OZ', '18 OZ', '20 OZ'], (2.5, 5.5), 30.0, (-2.0, -0.8)),
+    'FROZEN PIZZA': (['PIZZA/PREMIUM'], ['22.7 OZ', '28.3 OZ', '29.6 OZ', '30.5 OZ', '32.7 OZ'], (4.0, 8.0),
+                     15.0, (-3.0, -1.2)),
+    'ORAL HYGIENE PRODUCTS': (['MOUTHWASHES (ANTISEPTIC)', 'MOUTHWASH/RINSES AND SPRAYS'],
+                              ['250 ML', '500 ML', '1000 ML'], (2.5, 7.0), 6.0, (-1.8, -0.6)),
+}
+MANUFACTURERS = ['PRIVATE LABEL', 'KELLOGG', 'GENERAL MI', 'QUAKER', 'TOMBSTONE', 'TONYS', 'SNYDER S', 'P & G',
+                 'WARNER', 'POST FOODS']
+STATES = ['OH', 'TX', 'KY', 'IN']
+# SEG_VALUE_NAME -> (share of the stores, price level)
+SEGMENTS = {'VALUE': (0.3, 0.92), 'MAINSTREAM': (0.5, 1.0), 'UPSCALE': (0.2, 1.1)}
+
+Config = namedtuple('Config', ['stores', 'upcs', 'weeks', 'assortment', 'sparsity', 'missing_price', 'feature_rate',
+                               'display_rate', 'seed'])
+Config.__new__.__defaults__ = (76, 30, 142, 0.8, 0.03, 0.001, 0.1, 0.12, 0)
+
+
+def scaled(scale, **kwargs):
+    """Config with about `scale` times the rows of the default one: stores and UPCs grow by sqrt(scale) each."""
+    factor = np.sqrt(scale)
+    return Config(stores=int(round(Config().stores * factor)), upcs=int(round(Config().upcs * factor)), **kwargs)
+
+
+def week_labels(weeks):
+    return pd.date_range(FIRST_WEEK, periods=weeks, freq='7D').strftime(DATE_FORMAT)
+
+
+def make_product_data(config):
+    rng = np.random.default_rng([config.seed, 0])
+    n = config.upcs
+    categories = np.array(list(CATEGORIES))[np.arange(n) % len(CATEGORIES)]
+    rng.shuffle(categories)
+    sub_categories, sizes = [], []
+    for category in categories:
+        subs, category_sizes = CATEGORIES[category][:2]
+        sub_categories.append(subs[rng.integers(len(subs))])
+        sizes.append(category_sizes[rng.integers(len(category_sizes))])
+    upcs = 1111009477 + np.cumsum(rng.integers(1, 3000000, n))
+    manufacturers = np.array(MANUFACTURERS)[rng.integers(len(MANUFACTURERS), size=n)]
+    return pd.DataFrame({
+        'UPC': upcs,
+        'DESCRIPTION': ['{} {} {}'.format(maker, sub, size)
+                        for maker, sub, size in zip(manufacturers, sub_categories, sizes)],
+        'MANUFACTURER': manufacturers,
+        'CATEGORY': categories,
+        'SUB_CATEGORY': sub_categories,
+        'PRODUCT_SIZE': sizes,
+    })[list(PRODUCT_SCHEMA)]
+
+
+def make_store_data(config):
+    rng = np.random.default_rng([config.seed, 1])
+    n = config.stores
+    store_ids = np.sort(rng.choice(np.arange(100, 100 + 40 * max(n, 1)), n, replace=False))
+    shares = np.array([share for share, _ in SEGMENTS.values()])
+    area = rng.lognormal(np.log(50000), 0.35, n).astype(np.int64)
+    parking = np.round(area / 250 * rng.lognormal(0, 0.15, n))
+    parking[rng.random(n) < 0.6] = np.nan
+    msa = np.array([17140, 13140, 26420, 19100, 19380, 47540])
+    cities = rng.integers(max(n * 2 // 3, 1), size=n)
+    return pd.DataFrame({
+        'STORE_ID': store_ids,
+        'STORE_NAME': ['STORE {}'.format(i) for i in store_ids],
+        'ADDRESS_CITY_NAME': ['CITY {}'.format(i) for i in cities],
+        'ADDRESS_STATE_PROV_CODE': np.array(STATES)[rng.integers(len(STATES), size=n)],
+        'MSA_CODE': msa[rng.integers(len(msa), size=n)],
+        'SEG_VALUE_NAME': np.array(list(SEGMENTS))[rng.choice(len(SEGMENTS), n, p=shares / shares.sum())],
+        'PARKING_SPACE_QTY': parking,
+        'SALES_AREA_SIZE_NUM': area,
+        'AVG_WEEKLY_BASKETS': (area * 0.4 * rng.lognormal(0, 0.2, n)).astype(np.int64),
+    })[list(STORE_SCHEMA)]
+
+
+class SeriesParameters(object):
+    """
+    The per-series demand and price parameters of the carried series. They
+    are derived from the seed, so every worker rebuilds the same ones
+    instead of receiving them.
+    """
+
+    def __init__(self, config):
+        rng = np.random.default_rng([config.seed, 2])
+        products = make_product_data(config)
+        stores = make_store_data(config)
+        n_upcs = len(products)
+
+        category = products['CATEGORY'].values
+        price_low = np.array([CATEGORIES[c][2][0] for c in category])
+        price_high = np.array([CATEGORIES[c][2][1] for c in category])
+        list_price = rng.uniform(price_low, price_high)
+        demand = np.array([CATEGORIES[c][3] for c in category]) * rng.lognormal(0, 0.8, n_upcs)
+        elasticity = rng.uniform([CATEGORIES[c][4][0] for c in category], [CATEGORIES[c][4][1] for c in category])
+        feature_lift = np.exp(rng.normal(np.log(1.7), 0.15, n_upcs))
+        display_lift = np.exp(rng.normal(np.log(1.4), 0.1, n_upcs))
+        growth = rng.normal(0, 0.08, n_upcs) / 52
+        categories, category_codes = np.unique(category, return_inverse=True)
+        season_amplitude = rng.uniform(0.05, 0.25, len(categories))[category_codes]
+        season_phase = rng.uniform(0, 52, len(categories))[category_codes]
+
+        store_scale = stores['AVG_WEEKLY_BASKETS'].values / stores['AVG_WEEKLY_BASKETS'].mean()
+        price_level = np.array([SEGMENTS[s][1] for s in stores['SEG_VALUE_NAME']])
+
+        carried = np.flatnonzero(rng.random(len(stores) * n_upcs) < config.assortment)
+        store, upc = carried // n_upcs, carried % n_upcs
+        self.store_num = stores['STORE_ID'].values[store]
+        self.upc = products['UPC'].values[upc]
+        self.list_price = list_price[upc] * price_level[store]
+        self.demand = demand[upc] * store_scale[store] * rng.lognormal(0, 0.3, len(carried))
+        self.elasticity = elasticity[upc]
+        self.feature_lift = feature_lift[upc]
+        self.display_lift = display_lift[upc]
+        self.growth = growth[upc]
+        self.season_amplitude = season_amplitude[upc]
+        self.season_phase = season_phase[upc]
+        # weeks of the series' first price change, so the price changes of the series are spread out
+        self.price_phase = rng.integers(PRICE_EPOCH, size=len(carried))
+
+    def __len__(self):
+        return len(self.store_num)
+
+    def prices(self, week, seed):
+        """BASE_PRICE of every series in `week`: the list price times the multiplier of its price epoch."""
+        epoch = (week + self.price_phase) // PRICE_EPOCH
+        first = week // PRICE_EPOCH
+        # an epoch's multipliers are drawn from its own seed, the same for every week and worker
+        multipliers = [np.exp(0.07 * np.random.default_rng([seed, 3, e]).standard_normal(len(self)))
+                       for e in (first, first + 1)]
+        return np.round(self.list_price * np.where(epoch == first, *multipliers), 2)
+
+
+def make_week(parameters, config, week, label):
+    """The train rows of one week."""
+    rng = np.random.default_rng([config.seed, 4, week])
+    n = len(parameters)
+    present = rng.random(n) >= config.sparsity
+    price = parameters.prices(week, config.seed)
+    feature = rng.random(n) < config.feature_rate
+    # displays are more likely in the weeks a product is featured
+    display = rng.random(n) < np.where(feature, np.minimum(3 * config.display_rate, 1), config.display_rate)
+
+    season = 1 + parameters.season_amplitude * np.sin(2 * np.pi * (week + parameters.season_phase) / 52)
+    mean = (parameters.demand * season * np.exp(parameters.growth * week)
+            * (price / parameters.list_price) ** parameters.elasticity
+            * np.where(feature, parameters.feature_lift, 1) * np.where(display, parameters.display_lift, 1))
+    units = rng.poisson(mean * rng.gamma(DISPERSION, 1 / DISPERSION, n))
+    keep = present & (units > 0)
+
+    base_price = price[keep].astype(np.float64)
+    base_price[rng.random(len(base_price)) < config.missing_price] = np.nan
+    return pd.DataFrame({
+        'WEEK_END_DATE': label,
+        'STORE_NUM': parameters.store_num[keep],
+        'UPC': parameters.upc[keep],
+        'BASE_PRICE': base_price,
+        'FEATURE': feature[keep].astype(np.uint8),
+        'DISPLAY': display[keep].astype(np.uint8),
+        'UNITS': units[keep].astype(np.int64),
+    })[list(TRAIN_SCHEMA)]
+
+
+def shard_path(out_dir, shard, file_format):
+    return os.path.join(out_dir, 'train', 'part-{:05d}.{}'.format(shard, file_format))
+
+
+def write_shard(config, shard, weeks, out_dir, file_format='csv'):
+    """Write the train rows of `weeks` to one shard file; returns (path, rows)."""
+    parameters = SeriesParameters(config)
+    labels = week_labels(config.weeks)
+    path = shard_path(out_dir, shard, file_format)
+    frames = (make_week(parameters, config, week, labels[week]) for week in weeks)
+    rows = 0
+    if file_format == 'parquet':
+        writer = None
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            writer = writer or pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            rows += len(frame)
+        if writer is not None:
+            writer.close()
+        return path, rows
+    with open(path, 'wb') as f:
+        for i, frame in enumerate(frames):
+            if pa_csv is not None:
+                # several times faster than to_csv; NaN prices become empty fields either way
+                if not i:
+                    f.write((','.join(frame.columns) + '\n').encode())
+                options = pa_csv.WriteOptions(include_header=False, quoting_style='none')
+                pa_csv.write_csv(pa.Table.from_pandas(frame, preserve_index=False), f, options)
+            else:
+                frame.to_csv(f, header=not i, index=False)
+            rows += len(frame)
+    return path, rows
+
+
+def concatenate_csv(paths, output):
+    """Concatenate CSV shards into `output`, keeping the header of the first one."""
+    with open(output, 'wb') as out:
+        for i, path in enumerate(paths):
+            with open(path, 'rb') as f:
+                if i:
+                    f.readline()
+                shutil.copyfileobj(f, out, 1 << 24)
+
+
+def generate(out_dir, config=Config(), shards=None, workers=None, file_format='csv', keep_shards=False):
+    """
+    Write product_data.csv, store_data.csv and the train rows of `config`
+    into `out_dir`; returns the number of train rows.
+    """
+    if file_format == 'parquet' and pq is None:
+        raise ImportError('writing parquet needs pyarrow')
+    os.makedirs(os.path.join(out_dir, 'train'), exist_ok=True)
+    make_product_data(config).to_csv(os.path.join(out_dir, 'product_data.csv'), index=False)
+    make_store_data(config).to_csv(os.path.join(out_dir, 'store_data.csv'), index=False)
+
+    shards = min(shards or 4 * (workers or os.cpu_count() or 1), config.weeks)
+    weeks = np.array_split(np.arange(config.weeks), shards)
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(write_shard, config, shard, list(shard_weeks), out_dir, file_format)
+                   for shard, shard_weeks in enumerate(weeks)]
+        written = [future.result() for future in futures]
+
+    if file_format == 'csv' and not keep_shards:
+        paths = [path for path, _ in written]
+        concatenate_csv(paths, os.path.join(out_dir, 'train.csv'))
+        shutil.rmtree(os.path.join(out_dir, 'train'))
+    return sum(rows for _, rows in written)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = Config()
+    parser.add_argument('--out', default='synthetic', help='directory of the generated tables')
+    parser.add_argument('--scale', type=float, help='about this many times the rows of the extract, '
+                                                    'overrides --stores and --upcs')
+    parser.add_argument('--stores', type=int, default=defaults.stores)
+    parser.add_argument('--upcs', type=int, default=defaults.upcs)
+    parser.add_argument('--weeks', type=int, default=defaults.weeks)
+    parser.add_argument('--assortment', type=float, default=defaults.assortment,
+                        help='share of the store x UPC series carried')
+    parser.add_argument('--sparsity', type=float, default=defaults.sparsity,
+                        help='share of the weeks of a carried series without a row')
+    parser.add_argument('--missing-price', type=float, default=defaults.missing_price,
+                        help='share of the rows without BASE_PRICE')
+    parser.add_argument('--feature-rate', type=float, default=defaults.feature_rate)
+    parser.add_argument('--display-rate', type=float, default=defaults.display_rate)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--shards', type=int, help='train files written in parallel, 4 per worker by default')
+    parser.add_argument('--workers', type=int, default=None, help='processes, all cores by default')
+    parser.add_argument('--keep-shards', action='store_true', help='do not concatenate the CSV shards')
+    args = parser.parse_args()
+
+    options = dict(weeks=args.weeks, assortment=args.assortment, sparsity=args.sparsity,
+                   missing_price=args.missing_price, feature_rate=args.feature_rate, display_rate=args.display_rate,
+                   seed=args.seed)
+    config = scaled(args.scale, **options) if args.scale else Config(args.stores, args.upcs, **options)
+    start = time.perf_counter()
+    rows = generate(args.out, config, args.shards, args.workers, args.format, args.keep_shards)
+    print('wrote {:,} train rows of {} stores x {} UPCs x {} weeks to {} in {:.1f} s'.format(
+        rows, config.stores, config.upcs, config.weeks, args.out, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Lag and rolling-window features of every (STORE_NUM, UPC) series for
+next-week demand forecasting.
+
+The long train rows are scattered once into a (series x week) matrix, with
+one column per calendar week and NaN for the weeks a series has no row.
+Every feature is then computed for all series at once with array kernels
+along the week axis, and gathered back to the rows:
+
+    features = temporal_features(data)          # aligned with data.index
+    data = pd.concat([data, features], axis=1)
+
+A feature of week t only uses weeks before t, so it can be computed for the
+week being forecast: lags are calendar lags (lag 1 is the previous week),
+rolling statistics and EWMAs skip the weeks without a row, and
+weeks_since_<FLAG> counts the weeks since the last earlier week with the
+flag set. Rows without enough history get NaN.
+
+    python -m retail_demand temporal_features --input updated_train_data.csv --output train_features.csv
+"""
+import argparse
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .imputation import UPC_SPAN, series_key
+from .loader import week_dates
+
+LAGS = tuple(range(1, 17))
+WINDOWS = (4, 8, 13, 26, 52)
+STATS = ('mean', 'median', 'std', 'min', 'max')
+SPANS = (2, 4, 8, 13, 26)
+FLAGS = ('FEATURE', 'DISPLAY')
+# series whose rolling windows are materialized at once
+BLOCK = 4096
+
+SeriesMatrix = namedtuple('SeriesMatrix', ['stores', 'upcs', 'weeks', 'rows', 'columns', 'values'])
+
+
+def series_matrix(data, measures=('UNITS',)):
+    """
+    Scatter the `measures` of the rows of `data` into (series x week)
+    matrices. `rows` and `columns` are the cell of every row of `data`;
+    series are sorted by (STORE_NUM, UPC) and weeks run from the first to the
+    last week of `data`, one column per calendar week.
+    """
+    rows, keys = pd.factorize(series_key(data['STORE_NUM'], data['UPC']), sort=True)
+    dates = np.asarray(week_dates(data['WEEK_END_DATE'])).astype('datetime64[D]')
+    first = dates.min() if len(dates) else np.datetime64('NaT', 'D')
+    columns = ((dates - first) // np.timedelta64(7, 'D')).astype(np.int64)
+    n_weeks = int(columns.max()) + 1 if len(columns) else 0
+    weeks = first + 7 * np.arange(n_weeks).astype('timedelta64[D]')
+
+    values = {}
+    for name in measures:
+        matrix = np.full((len(keys), n_weeks), np.nan)
+        matrix[rows, columns] = data[name].values
+        values[name] = matrix
+    return SeriesMatrix(keys // UPC_SPAN, keys % UPC_SPAN, pd.Index(weeks, name='WEEK_END_DATE'),
+                        rows, columns, values)
+
+
+def shift(matrix, k):
+    """`matrix` moved `k` weeks later along the week axis."""
+    shifted = np.full(matrix.shape, np.nan)
+    if k < matrix.shape[1]:
+        shifted[:, k:] = matrix[:, :matrix.shape[1] - k]
+    return shifted
+
+
+def window_sums(matrix, window):
+    """Sum, count of observed weeks and sum of squares over the `window` weeks before every week."""
+    observed = ~np.isnan(matrix)
+    filled = np.where(observed, matrix, 0.0)
+    sums = []
+    for values in (filled, observed.astype(np.float64), filled * filled):
+        cumulative = np.zeros((matrix.shape[0], matrix.shape[1] + 1))
+        np.cumsum(values, axis=1, out=cumulative[:, 1:])
+        end = np.arange(matrix.shape[1])
+        start = np.maximum(end - window, 0)
+        sums.append(cumulative[:, end] - cumulative[:, start])
+    return sums
+
+
+def rolling_moments(matrix, window):
+    """Mean and sample standard deviation over the `window` weeks before every week."""
+    total, count, squares = window_sums(matrix, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+        variance = np.where(count > 1, (squares - count * mean * mean) / (count - 1), np.nan)
+    return mean, np.sqrt(np.maximum(variance, 0))
+
+
+def rolling_order_stats(matrix, window, stats=('median', 'min', 'max')):
+    """Median, min and/or max over the `window` weeks before every week."""
+    result = {name: np.empty(matrix.shape) for name in stats}
+    padded = np.concatenate([np.full((matrix.shape[0], window), np.nan), matrix], axis=1)
+    for start in range(0, matrix.shape[0], BLOCK):
+        # window t holds weeks t - window .. t - 1; sorting puts the weeks without a row last
+        windows = np.lib.stride_tricks.sliding_window_view(padded[start:start + BLOCK], window, axis=1)
+        ordered = np.sort(windows[:, :matrix.shape[1]], axis=2)
+        count = (~np.isnan(ordered)).sum(axis=2)
+
+        def nth(position):
+            position = np.clip(position, 0, window - 1)[:, :, None]
+            return np.where(count > 0, np.take_along_axis(ordered, position, axis=2)[:, :, 0], np.nan)
+
+        block = slice(start, start + BLOCK)
+        if 'median' in stats:
+            result['median'][block] = (nth((count - 1) // 2) + nth(count // 2)) / 2
+        if 'min' in stats:
+            result['min'][block] = nth(np.zeros_like(count))
+        if 'max' in stats:
+            result['max'][block] = nth(count - 1)
+    return result
+
+
+def ewma(matrix, span):
+    """
+    Exponentially weighted mean with alpha = 2 / (span + 1) of the weeks
+    before every week, skipping the weeks without a row.
+    """
+    alpha = 2.0 / (span + 1)
+    result = np.full(matrix.shape, np.nan)
+    current = np.full(matrix.shape[0], np.nan)
+    for t in range(1, matrix.shape[1]):
+        value = matrix[:, t - 1]
+        observed = ~np.isnan(value)
+        current = np.where(observed, np.where(np.isnan(current), value, alpha * value + (1 - alpha) * current),
+                           current)
+        result[:, t] = current
+    return result
+
+
+def weeks_since(flags):
+    """Weeks since the last earlier week with the flag set, NaN when there is none."""
+    week = np.arange(flags.shape[1])
+    last = np.maximum.accumulate(np.where(flags > 0, week, -1), axis=1)
+    previous = np.full(flags.shape, -1)
+    previous[:, 1:] = last[:, :-1]
+    return np.where(previous >= 0, week - previous, np.nan)
+
+
+def feature_matrices(matrix, flags, measure='UNITS', lags=LAGS, windows=WINDOWS, stats=STATS, spans=SPANS):
+    """Yield (name, series x week matrix) for every feature."""
+    values = matrix.values[measure]
+    for k in lags:
+        yield '{}_lag_{}'.format(measure, k), shift(values, k)
+    for window in windows:
+        computed = {}
+        if 'mean' in stats or 'std' in stats:
+            computed['mean'], computed['std'] = rolling_moments(values, window)
+        order_stats = [name for name in stats if name in ('median', 'min', 'max')]
+        if order_stats:
+            computed.update(rolling_order_stats(values, window, order_stats))
+        for name in stats:
+            yield '{}_{}_{}'.format(measure, name, window), computed[name]
+    for span in spans:
+        yield '{}_ewm_{}'.format(measure, span), ewma(values, span)
+    for flag in flags:
+        yield 'weeks_since_{}'.format(flag), weeks_since(matrix.values[flag])
+
+
+def temporal_features(data, measure='UNITS', lags=LAGS, windows=WINDOWS, stats=STATS, spans=SPANS, flags=FLAGS):
+    """
+    DataFrame of the lag, rolling, EWMA and weeks-since features of every
+    row of `data` (WEEK_END_DATE, STORE_NUM, UPC, `measure` and `flags`),
+    aligned with its index. Rows must be unique per series and week.
+    """
+    matrix = series_matrix(data, (measure,) + tuple(flags))
+    features = {name: feature[matrix.rows, matrix.columns]
+                for name, feature in feature_matrices(matrix, flags, measure, lags, windows, stats, spans)}
+    return pd.DataFrame(features, index=data.index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', default='updated_train_data.csv')
+    parser.add_argument('--output', default='train_features.csv')
+    args = parser.parse_args()
+    data = pd.read_csv(args.input)
+    features = temporal_features(data)
+    pd.concat([data, features], axis=1).to_csv(args.output, index=False)
+    print('wrote {} features of {:,} rows to {}'.format(features.shape[1], len(features), args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Fitted version of the Preprocessing.py encodings for batch and single-row
+scoring.
+
+`PreprocessingTransformer.fit` learns everything Preprocessing.py computes
+on each run: the PRODUCT_SIZE bins, the one-hot levels of the product and
+store attributes, the SEG_VALUE_NAME mapping and the prices used to impute
+BASE_PRICE. All of it is compiled into one feature row per UPC and per store,
+so `transform` is two array gathers and `transform_row` two dict lookups.
+
+    transformer = PreprocessingTransformer().fit(train, product_data, store_data)
+    transformer.save('preprocessing_transformer.pkl')
+
+    transformer = PreprocessingTransformer.load('preprocessing_transformer.pkl')
+    X = transformer.transform(rows)  # rows with STORE_NUM, UPC, FEATURE, DISPLAY[, BASE_PRICE]
+
+`transform(rows, sparse=True)` returns a scipy.sparse CSR matrix instead,
+gathered from CSR copies of the product and store rows so the one-hot
+columns are never densified. scipy is only needed for the sparse output.
+"""
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from .cube import axis_positions
+from .imputation import UPC_SPAN, fallback_prices, last_observed_price, price_totals, series_key
+from .product_size import PRODUCT_SIZE_BINS, bin_product_size, parse_product_size
+
+SEG_VALUE_NAME_MAP = {'VALUE': 1, 'MAINSTREAM': 2, 'UPSCALE': 3}
+
+PRODUCT_ONE_HOT = ['MANUFACTURER', 'CATEGORY', 'SUB_CATEGORY']
+STORE_ONE_HOT = ['ADDRESS_STATE_PROV_CODE', 'MSA_CODE']
+STORE_NUMERIC = ['SEG_VALUE_NAME', 'SALES_AREA_SIZE_NUM', 'AVG_WEEKLY_BASKETS']
+ROW_COLUMNS = ['BASE_PRICE', 'FEATURE', 'DISPLAY']
+
+
+def one_hot(values, name):
+    """
+    One-hot encode `values` the way ce.OneHotEncoder does: one column per
+    level in order of appearance, named <name>_1, <name>_2, ...
+    """
+    codes, levels = pd.factorize(np.asarray(values, dtype=object))
+    matrix = np.zeros((len(codes), len(levels)), dtype=np.float32)
+    matrix[np.arange(len(codes)), codes] = 1
+    return list(levels), ['{}_{}'.format(name, i + 1) for i in range(len(levels))], matrix
+
+
+class PreprocessingTransformer(object):
+
+    def __init__(self, size_bins=PRODUCT_SIZE_BINS):
+        self.size_bins = size_bins
+
+    def fit(self, train, product_data, store_data):
+        """Learn the encodings from the raw train, product and store tables."""
+        # one row of product features per UPC, in the column order of updated_product_data.csv; the levels are
+        # numbered in the order of the rows, as ce.OneHotEncoder numbers them, and the rows are sorted afterwards
+        self.levels = {}
+        blocks, self.product_columns = [], []
+        for column in PRODUCT_ONE_HOT:
+            self.levels[column], names, matrix = one_hot(product_data[column], column)
+            blocks.append(matrix)
+            self.product_columns += names
+        size = parse_product_size(product_data.PRODUCT_SIZE).SIZE
+        product_size, self.unbinned_sizes = bin_product_size(product_data.CATEGORY, size, self.size_bins)
+        blocks.append(product_size.values[:, None])
+        self.product_columns.append('PRODUCT_SIZE')
+        upcs = product_data.UPC.values.astype(np.int64)
+        order = np.argsort(upcs, kind='stable')
+        self.upcs = upcs[order]
+        self.product_matrix = np.hstack(blocks).astype(np.float32)[order]
+
+        # one row of store features per STORE_ID
+        blocks, self.store_columns = [], []
+        for column in STORE_ONE_HOT:
+            self.levels[column], names, matrix = one_hot(store_data[column], column)
+            blocks.append(matrix)
+            self.store_columns += names
+        numeric = store_data[STORE_NUMERIC].astype({'SEG_VALUE_NAME': object})
+        numeric['SEG_VALUE_NAME'] = numeric.SEG_VALUE_NAME.map(SEG_VALUE_NAME_MAP)
+        blocks.append(numeric.values.astype(np.float32))
+        self.store_columns += STORE_NUMERIC
+        stores = store_data.STORE_ID.values.astype(np.int64)
+        order = np.argsort(stores, kind='stable')
+        self.stores = stores[order]
+        self.store_matrix = np.hstack(blocks).astype(np.float32)[order]
+
+        # BASE_PRICE imputation: latest price of the series, then the UPC and SUB_CATEGORY averages
+        sub_category = product_data.set_index('UPC')['SUB_CATEGORY']
+        fallback = fallback_prices(price_totals(train), sub_category).reindex(self.upcs)
+        self.fallback_price = fallback.values.astype(np.float32)
+        last_price = last_observed_price(train).sort_index()
+        self.series_keys = last_price.index.values
+        self.last_price = last_price.values.astype(np.float32)
+
+        self.compile()
+        return self
+
+    def compile(self):
+        """Build the dict lookups used by `transform_row`."""
+        self.upc_position = {upc: i for i, upc in enumerate(self.upcs.tolist())}
+        self.store_position = {store: i for i, store in enumerate(self.stores.tolist())}
+        self.last_price_lookup = dict(zip(self.series_keys.tolist(), self.last_price.tolist()))
+        self.columns = ROW_COLUMNS + self.product_columns + self.store_columns
+        self.store_offset = len(ROW_COLUMNS) + len(self.product_columns)
+        # CSR copies of the product and store rows, built on the first sparse transform
+        self.sparse_matrices = None
+
+    def impute_price(self, store_num, upc, upc_position):
+        """Latest observed BASE_PRICE of each (store_num, upc) series, or its fallback price."""
+        key = series_key(store_num, upc)
+        price = self.fallback_price[upc_position].copy()
+        if len(self.series_keys):
+            position = np.minimum(np.searchsorted(self.series_keys, key), len(self.series_keys) - 1)
+            found = self.series_keys[position] == key
+            price[found] = self.last_price[position[found]]
+        return price
+
+    def transform(self, rows, sparse=False):
+        """
+        Feature matrix of `rows` (a DataFrame or dict of arrays with STORE_NUM,
+        UPC, FEATURE, DISPLAY and optionally BASE_PRICE), one row per input row,
+        columns as in `self.columns`. Unknown stores or UPCs raise KeyError.
+
+        With `sparse=True` the matrix is a scipy.sparse CSR matrix.
+        """
+        store_num = np.asarray(rows['STORE_NUM'], dtype=np.int64)
+        upc = np.asarray(rows['UPC'], dtype=np.int64)
+        s = axis_positions(self.stores, store_num, 'STORE_NUM')
+        u = axis_positions(self.upcs, upc, 'UPC')
+
+        if 'BASE_PRICE' in rows:
+            price = np.asarray(rows['BASE_PRICE'], dtype=np.float32).copy()
+        else:
+            price = np.full(len(upc), np.nan, dtype=np.float32)
+        missing = np.isnan(price)
+        if missing.any():
+            price[missing] = self.impute_price(store_num[missing], upc[missing], u[missing])
+
+        if sparse:
+            return self.sparse_features(price, rows, u, s)
+
+        features = np.empty((len(upc), len(self.columns)), dtype=np.float32)
+        features[:, 0] = price
+        features[:, 1] = np.asarray(rows['FEATURE'])
+        features[:, 2] = np.asarray(rows['DISPLAY'])
+        features[:, 3:self.store_offset] = self.product_matrix[u]
+        features[:, self.store_offset:] = self.store_matrix[s]
+        return features
+
+    def sparse_features(self, price, rows, u, s):
+        from scipy import sparse
+
+        if self.sparse_matrices is None:
+            self.sparse_matrices = (sparse.csr_matrix(self.product_matrix), sparse.csr_matrix(self.store_matrix))
+        product_matrix, store_matrix = self.sparse_matrices
+        row_columns = np.column_stack([price, np.asarray(rows['FEATURE']), np.asarray(rows['DISPLAY'])])
+        features = sparse.hstack([sparse.csr_matrix(row_columns.astype(np.float32)), product_matrix[u],
+                                  store_matrix[s]], format='csr')
+        features.eliminate_zeros()
+        return features
+
+    def transform_row(self, store_num, upc, feature, display, base_price=None):
+        """Feature vector of a single store-UPC-week row."""
+        u = self.upc_position[upc]
+        if base_price is None or base_price != base_price:
+            base_price = self.last_price_lookup.get(store_num * UPC_SPAN + upc, self.fallback_price[u])
+        row = np.empty(len(self.columns), dtype=np.float32)
+        row[0] = base_price
+        row[1] = feature
+        row[2] = display
+        row[3:self.store_offset] = self.product_matrix[u]
+        row[self.store_offset:] = self.store_matrix[self.store_position[store_num]]
+        return row
+
+    # the dict lookups are rebuilt on load instead of being pickled
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('upc_position', 'store_position', 'last_price_lookup', 'columns', 'store_offset',
+                     'sparse_matrices'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.compile()
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retail_demand.synthetic import Config, generate  # noqa: E402
+
+CONFIG = Config(stores=8, upcs=12, weeks=40, seed=1)
+
+
+@pytest.fixture(scope='session')
+def data_dir(tmp_path_factory):
+    """Raw train, product and store tables of a small synthetic chain."""
+    path = str(tmp_path_factory.mktemp('dataset'))
+    generate(path, CONFIG, shards=2, workers=1)
+    return path
@@ -0,0 +1,19 @@
+import sys
+
+import pandas as pd
+
+from retail_demand.baselines import main
+from retail_demand.loader import parse_weeks, read_train
+
+
+def test_main_writes_weeks_in_the_train_format(data_dir, tmp_path, monkeypatch):
+    train = read_train(data_dir=data_dir, parse_dates=False)
+    train.to_csv(tmp_path / 'train.csv', index=False)
+    output = tmp_path / 'forecasts.csv'
+    monkeypatch.setattr(sys, 'argv', ['baselines', '--input', str(tmp_path / 'train.csv'), '--output', str(output),
+                                      '--horizon', '2'])
+    main()
+
+    weeks = pd.read_csv(output).WEEK_END_DATE
+    last = parse_weeks(train.WEEK_END_DATE).max()
+    assert list(parse_weeks(weeks).drop_duplicates()) == [last + pd.Timedelta(weeks=h) for h in (1, 2)]
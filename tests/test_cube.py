@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from retail_demand.cube import build_cube
+
+
+def test_means_skip_cells_without_rows(tmp_path):
+    train = pd.DataFrame({
+        'WEEK_END_DATE': pd.to_datetime(['2009-01-14', '2009-01-14', '2009-01-21', '2009-01-21', '2009-01-28']),
+        'STORE_NUM': [1, 2, 1, 1, 2],
+        'UPC': [10, 20, 10, 20, 20],
+        'UNITS': [3, 5, 7, 9, 11],
+        'BASE_PRICE': [1.5, 2.0, 1.0, 3.0, 2.5],
+        'FEATURE': [1, 0, 0, 1, 1],
+        'DISPLAY': [0, 0, 1, 1, 0],
+    })
+    cube = build_cube(train, str(tmp_path))
+
+    weekly = train.groupby('WEEK_END_DATE').UNITS.mean()
+    np.testing.assert_allclose(cube.means('UNITS', by=['WEEK_END_DATE']), weekly.values)
+    np.testing.assert_array_equal(cube.totals('UNITS', by=['WEEK_END_DATE']),
+                                  train.groupby('WEEK_END_DATE').UNITS.sum().values)
+
+    avg_price = train.groupby(['STORE_NUM', 'UPC']).BASE_PRICE.mean().unstack()
+    np.testing.assert_allclose(cube.means('BASE_PRICE', by=['STORE_NUM', 'UPC']), avg_price.values)
+    # store 2 never sold UPC 10
+    assert np.isnan(cube.means('FEATURE', by=['STORE_NUM', 'UPC'])[1, 0])
+
+
+def test_totals_by_week_and_series_match_the_cells(tmp_path):
+    train = pd.DataFrame({
+        'WEEK_END_DATE': pd.to_datetime(['2009-01-14', '2009-01-21', '2009-01-21']),
+        'STORE_NUM': [1, 1, 2],
+        'UPC': [10, 10, 20],
+        'UNITS': [3, 4, 5],
+        'BASE_PRICE': [1.0, 1.0, 2.0],
+        'FEATURE': [0, 1, 0],
+        'DISPLAY': [0, 0, 1],
+    })
+    cube = build_cube(train, str(tmp_path))
+    np.testing.assert_array_equal(cube.totals('UNITS', by=['WEEK_END_DATE', 'STORE_NUM', 'UPC']), cube['UNITS'])
+    np.testing.assert_array_equal(cube.totals('UNITS', by=['WEEK_END_DATE', 'UPC']), [[3, 0], [4, 5]])
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import pickle
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from retail_demand.forecast_service import BASELINE, Forecaster, ForecastService, HttpError
+from retail_demand.loader import read_product_data, read_store_data, read_train
+from retail_demand.segment_training import train_segments
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEATURES = ['BASE_PRICE', 'FEATURE', 'DISPLAY']
+
+
+@pytest.fixture(scope='module')
+def history(data_dir, tmp_path_factory):
+    """A history CSV as the service reads it, with WEEK_END_DATE as it is in the file."""
+    path = tmp_path_factory.mktemp('service') / 'updated_train_data.csv'
+    read_train(data_dir=data_dir, parse_dates=False).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope='module')
+def models(data_dir, history):
+    data = pd.read_csv(history).dropna(subset=['BASE_PRICE'])
+    data['CATEGORY'] = data.UPC.map(read_product_data(data_dir=data_dir).set_index('UPC')['CATEGORY']).astype(str)
+    results = train_segments(data, 'CATEGORY', workers=1, features=FEATURES)
+    return {'segments': ['CATEGORY'], 'features': FEATURES, 'models': {r.segment: r.model for r in results}}
+
+
+@pytest.fixture(scope='module')
+def forecaster(data_dir, history, models):
+    product_data = read_product_data(data_dir=data_dir)
+    return Forecaster(pd.read_csv(history), models, product_data, read_store_data(data_dir=data_dir),
+                      product_data.set_index('UPC')['SUB_CATEGORY'])
+
+
+def run_service(service, coroutine):
+    async def run():
+        batcher = asyncio.ensure_future(service.batcher.run())
+        try:
+            return await coroutine
+        finally:
+            batcher.cancel()
+    return asyncio.run(run())
+
+
+def test_score_uses_the_model_of_the_series_segment(data_dir, history, models, forecaster):
+    train = pd.read_csv(history)
+    store, upc = train[['STORE_NUM', 'UPC']].iloc[0]
+    response, = forecaster.score([{'STORE_NUM': int(store), 'UPC': int(upc), 'BASE_PRICE': 2.5, 'FEATURE': 1}])
+    category = str(read_product_data(data_dir=data_dir).set_index('UPC').CATEGORY[upc])
+    assert response['model'] == category
+    expected = models['models'][category].predict(np.array([[2.5, 1.0, 0.0]]))[0]
+    assert response['UNITS'] == pytest.approx(max(expected, 0))
+    assert response['WEEK_END_DATE'] == forecaster.week
+
+
+def test_score_imputes_missing_prices_and_flags_unknown_series(forecaster, history):
+    store, upc = pd.read_csv(history)[['STORE_NUM', 'UPC']].iloc[0]
+    known, unknown = forecaster.score([{'STORE_NUM': int(store), 'UPC': int(upc)}, {'STORE_NUM': -1, 'UPC': int(upc)}])
+    assert np.isfinite(known['UNITS'])
+    assert unknown['error'] == 'unknown series'
+
+
+def test_baseline_without_models(data_dir, history):
+    sub_category = read_product_data(data_dir=data_dir).set_index('UPC')['SUB_CATEGORY']
+    forecaster = Forecaster(pd.read_csv(history), sub_category=sub_category)
+    store, upc = pd.read_csv(history)[['STORE_NUM', 'UPC']].iloc[0]
+    response, = forecaster.score([{'STORE_NUM': int(store), 'UPC': int(upc)}])
+    assert response['model'] == BASELINE
+
+
+def test_forecast_route_batches_requests(forecaster, history):
+    service = ForecastService(forecaster, max_batch=8, window=0.001)
+    keys = pd.read_csv(history)[['STORE_NUM', 'UPC']].drop_duplicates().values[:20]
+    body = json.dumps([{'STORE_NUM': int(store), 'UPC': int(upc)} for store, upc in keys]).encode()
+    status, payload = run_service(service, service.route('POST', '/forecast', body))
+    assert status == 200 and len(payload) == len(keys)
+    assert payload == forecaster.score([{'STORE_NUM': int(store), 'UPC': int(upc)} for store, upc in keys])
+    with pytest.raises(HttpError):
+        run_service(service, service.route('POST', '/forecast', b'{"UPC": 1}'))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_service_starts_with_its_default_tables(data_dir, history, models, tmp_path):
+    # the defaults: updated_train_data.csv and the raw tables of dataset/ in the working directory
+    os.symlink(history, tmp_path / 'updated_train_data.csv')
+    os.symlink(data_dir, tmp_path / 'dataset')
+    with open(tmp_path / 'segment_models.pkl', 'wb') as f:
+        pickle.dump(models, f)
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=REPO)
+    process = subprocess.Popen([sys.executable, '-m', 'retail_demand', 'forecast_service', '--models',
+                                'segment_models.pkl', '--port', str(port)], cwd=str(tmp_path), env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                with urllib.request.urlopen('http://127.0.0.1:{}/health'.format(port), timeout=1) as response:
+                    health = json.load(response)
+                break
+            except OSError:
+                if process.poll() is not None or time.time() > deadline:
+                    pytest.fail('the service did not start:\n' + process.stdout.read().decode())
+                time.sleep(0.2)
+        assert health['status'] == 'ok' and health['series'] > 0
+    finally:
+        process.terminate()
+        process.wait(10)
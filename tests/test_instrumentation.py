@@ -0,0 +1,28 @@
+import os
+
+import pandas as pd
+
+from retail_demand.instrumentation import StageRecorder, read_report, summary
+
+
+def test_report_directory_is_created(tmp_path):
+    report = os.path.join(str(tmp_path), 'out', 'run.jsonl')
+    recorder = StageRecorder.from_env({'PIPELINE_REPORT': report})
+    with recorder.stage('double', pd.DataFrame({'a': [1, 2]})) as stage:
+        stage.output(rows=4)
+    recorder.close()
+
+    stages = read_report(report)
+    assert list(stages['stage']) == ['double']
+    assert summary(stages).loc['double', 'rows_out'] == 4
+
+
+def test_tracemalloc_is_opt_in(tmp_path):
+    report = os.path.join(str(tmp_path), 'run.jsonl')
+    untraced = StageRecorder.from_env({'PIPELINE_REPORT': report})
+    traced = StageRecorder.from_env({'PIPELINE_REPORT': report, 'PIPELINE_TRACEMALLOC': '1'})
+    for recorder in (untraced, traced):
+        with recorder.stage('allocate'):
+            [0] * 100000
+    assert not untraced.run['tracemalloc'] and untraced.records[0]['traced_peak_mb'] is None
+    assert traced.run['tracemalloc'] and traced.records[0]['traced_peak_mb'] > 0
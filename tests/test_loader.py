@@ -0,0 +1,28 @@
+import pandas as pd
+import pytest
+
+from retail_demand.loader import iter_table, parquet_parts, read_train
+from retail_demand.synthetic import generate
+
+from conftest import CONFIG
+
+
+@pytest.fixture(scope='module')
+def parquet_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('parquet'))
+    generate(path, CONFIG, shards=3, workers=1, file_format='parquet')
+    return path
+
+
+def test_parquet_shards_read_like_the_csv(data_dir, parquet_dir):
+    assert len(parquet_parts('train', parquet_dir)) == 3
+    assert parquet_parts('train', data_dir) == []
+    pd.testing.assert_frame_equal(read_train(data_dir=parquet_dir), read_train(data_dir=data_dir, use_cache=False))
+
+
+def test_parquet_shards_iterate_like_the_csv(data_dir, parquet_dir):
+    columns = ['WEEK_END_DATE', 'STORE_NUM', 'UPC', 'UNITS']
+    chunks = list(iter_table('train', 100, columns=columns, data_dir=parquet_dir))
+    assert max(len(chunk) for chunk in chunks) == 100
+    expected = pd.concat(iter_table('train', 100, columns=columns, data_dir=data_dir), ignore_index=True)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), expected)
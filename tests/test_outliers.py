@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from retail_demand.imputation import series_key
+from retail_demand.outliers import RELATIVE_ACCURACY, UnitsSketch, flag_outliers
+
+
+def rows(seed, n=20000, series=50):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'STORE_NUM': rng.integers(1, 6, n), 'UPC': rng.integers(100, 100 + series // 5, n),
+                         'UNITS': rng.negative_binomial(2, 0.05, n)})
+
+
+def test_quantiles_are_within_the_relative_accuracy():
+    data = rows(0)
+    sketch = UnitsSketch().update(data)
+    quantiles = sketch.quantiles([0.25, 0.5, 0.75])
+    for i, (key, group) in enumerate(data.assign(KEY=series_key(data.STORE_NUM, data.UPC)).groupby('KEY')):
+        assert sketch.keys[i] == key
+        exact = np.sort(group.UNITS.values)[(np.array([0.25, 0.5, 0.75]) * (len(group) - 1)).astype(int)]
+        positive = exact > 0
+        np.testing.assert_allclose(quantiles[i][positive], exact[positive], rtol=2 * RELATIVE_ACCURACY)
+
+
+def test_chunked_and_merged_sketches_match_one_pass():
+    data = rows(1)
+    whole = UnitsSketch().update(data)
+    left, right = UnitsSketch(), UnitsSketch()
+    for i, chunk in enumerate(np.array_split(np.arange(len(data)), 9)):
+        (left if i % 2 else right).update(data.iloc[chunk])
+    merged = left.merge(right)
+    np.testing.assert_array_equal(merged.keys, whole.keys)
+    np.testing.assert_array_equal(merged.quantiles([0.1, 0.9]), whole.quantiles([0.1, 0.9]))
+    np.testing.assert_array_equal(merged.totals(), whole.totals())
+
+
+def test_subset_keeps_the_sketches_of_the_given_series():
+    sketch = UnitsSketch().update(rows(2))
+    keys = np.append(sketch.keys[::3], -1)
+    subset = sketch.subset(keys)
+    np.testing.assert_array_equal(subset.keys, sketch.keys[::3])
+    np.testing.assert_array_equal(subset.fences()[1], sketch.fences()[1][::3])
+
+
+def test_flag_outliers_flags_spikes_of_their_series_only():
+    data = rows(3)
+    spike = data.iloc[:1].assign(UNITS=100000)
+    flagged = flag_outliers(pd.concat([data, spike]), UnitsSketch().update(data))
+    assert flagged[-1]
+    assert flagged[:-1].mean() < 0.01
+    unknown = spike.assign(STORE_NUM=99)
+    assert not flag_outliers(unknown, UnitsSketch().update(data)).any()
@@ -0,0 +1,16 @@
+import os
+
+from retail_demand.preprocessing import OUTPUTS, TRANSFORMER, preprocess
+from retail_demand.transformer import PreprocessingTransformer
+
+
+def test_outputs_and_transformer_go_to_output_dir(data_dir, tmp_path, monkeypatch):
+    output_dir = os.path.join(str(tmp_path), 'out')
+    monkeypatch.chdir(tmp_path)
+    tables = preprocess(data_dir, output_dir)
+
+    for name in OUTPUTS.values():
+        assert os.path.exists(os.path.join(output_dir, name))
+    assert not os.path.exists(TRANSFORMER)
+    transformer = PreprocessingTransformer.load(os.path.join(output_dir, TRANSFORMER))
+    assert len(transformer.transform(tables['train'].head())) == 5
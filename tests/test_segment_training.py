@@ -0,0 +1,70 @@
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from retail_demand.loader import read_train
+from retail_demand.segment_training import (RidgeModel, SegmentResult, add_segment_columns, main, predict_segments,
+                                            segment_rows, train_segments)
+
+
+def test_ridge_recovers_linear_coefficients():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(5000, 3))
+    y = X @ np.array([2.0, -1.0, 0.5]) + 3.0
+    model = RidgeModel(alpha=1e-6).fit(X, y)
+    np.testing.assert_allclose(model.predict(X), y, atol=1e-6)
+
+
+def test_ridge_fills_nan_and_ignores_constant_columns():
+    X = np.array([[1.0, 5.0], [np.nan, 5.0], [3.0, 5.0], [4.0, 5.0]])
+    y = np.array([1.0, 2.0, 3.0, 4.0])
+    predictions = RidgeModel().fit(X, y).predict(X)
+    assert np.isfinite(predictions).all()
+
+
+def test_segment_rows_groups_every_segment():
+    data = pd.DataFrame({'CATEGORY': ['b', 'a', 'b', 'c', 'a']})
+    order, ranges = segment_rows(data, ['CATEGORY'])
+    assert [segment for segment, _, _ in ranges] == ['a', 'b', 'c']
+    for segment, start, stop in ranges:
+        assert (data.CATEGORY.values[order[start:stop]] == segment).all()
+
+
+def test_train_segments_matches_fitting_each_segment(data_dir):
+    data = read_train(data_dir=data_dir).dropna(subset=['BASE_PRICE'])
+    data = data.assign(SEGMENT=data.STORE_NUM % 3)
+    features = ['BASE_PRICE', 'FEATURE', 'DISPLAY']
+    results = train_segments(data, 'SEGMENT', workers=1, features=features)
+    assert all(isinstance(result, SegmentResult) for result in results)
+    assert sorted(result.segment for result in results) == [0, 1, 2]
+    assert [result.rows for result in results] == sorted((result.rows for result in results), reverse=True)
+
+    models = {result.segment: result.model for result in results}
+    predictions = predict_segments(data, 'SEGMENT', models, features)
+    for segment, model in models.items():
+        rows = data.SEGMENT == segment
+        reference = RidgeModel().fit(data.loc[rows, features].to_numpy(np.float64), data.loc[rows, 'UNITS'].values)
+        np.testing.assert_allclose(predictions[rows].values,
+                                   reference.predict(data.loc[rows, features].to_numpy(np.float64)))
+
+
+def test_add_segment_columns_raises_for_unknown_columns():
+    with pytest.raises(KeyError):
+        add_segment_columns(pd.DataFrame({'UPC': [1], 'STORE_NUM': [2]}), ['CLUSTER'])
+
+
+def test_main_segments_by_category_with_the_default_tables(data_dir, tmp_path, monkeypatch):
+    train = read_train(data_dir=data_dir, parse_dates=False)
+    train.to_csv(tmp_path / 'train_features.csv', index=False)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'argv', ['segment_training', '--data-dir', data_dir, '--workers', '1'])
+    main()
+    with open(tmp_path / 'segment_models.pkl', 'rb') as f:
+        saved = pickle.load(f)
+    assert saved['segments'] == ['CATEGORY']
+    assert 'CATEGORY' not in saved['features'] and 'STORE_NUM' not in saved['features']
+    # segments are the category labels of the raw product table
+    assert set(saved['models']) == set(pd.read_csv(data_dir + '/product_data.csv').CATEGORY)
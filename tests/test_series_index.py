@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from retail_demand.series_index import SeriesIndex
+
+
+@pytest.fixture
+def train():
+    return pd.DataFrame({
+        'WEEK_END_DATE': pd.to_datetime(['2009-01-14', '2009-01-21', '2009-01-14', '2009-01-14']),
+        'STORE_NUM': [1, 1, 2, 1],
+        'UPC': [10, 10, 10, 20],
+        'UNITS': [3, 4, 5, 6],
+        'FEATURE': [0, 1, 0, 0],
+        'DISPLAY': [0, 0, 1, 1],
+    })
+
+
+def test_series_matches_groupby(train):
+    stores = SeriesIndex.build(train, by='STORE_NUM')
+    expected = train.groupby(['STORE_NUM', 'WEEK_END_DATE']).UNITS.sum().unstack()
+    for store in expected.index:
+        np.testing.assert_array_equal(stores.series(store, 'UNITS').values, expected.loc[store].values)
+
+
+def test_missing_key_names_the_key(train):
+    store_data = pd.DataFrame({'STORE_ID': [1, 2, 3], 'STORE_NAME': ['a', 'b', 'c']})
+    stores = SeriesIndex.build(train, by='STORE_NUM', metadata=store_data)
+    assert 3 not in stores
+    with pytest.raises(KeyError, match='STORE_NUM 3 has no train rows'):
+        stores.series(3)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from retail_demand.instrumentation import StageRecorder
+from retail_demand.loader import read_product_data, read_store_data, read_train
+from retail_demand.transformer import PreprocessingTransformer
+
+pytest.importorskip('category_encoders')
+
+from retail_demand.preprocessing import preprocess_product_data, preprocess_store_data  # noqa: E402
+
+
+def shuffled(frame, seed):
+    return frame.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+@pytest.fixture(scope='module')
+def tables(data_dir):
+    # rows out of key order, so levels numbered by first appearance and by sorted key differ
+    return (read_train(data_dir=data_dir), shuffled(read_product_data(data_dir=data_dir), 3),
+            shuffled(read_store_data(data_dir=data_dir), 5))
+
+
+def test_transform_matches_one_hot_encoder_on_unsorted_tables(tables):
+    train, product_data, store_data = tables
+    transformer = PreprocessingTransformer().fit(train, product_data, store_data)
+    recorder = StageRecorder(enabled=False)
+    encoded_products, _ = preprocess_product_data(product_data, recorder)
+    encoded_stores = preprocess_store_data(store_data, recorder)
+
+    assert transformer.product_columns == list(encoded_products.columns.drop('UPC'))
+    expected = encoded_products.set_index('UPC').loc[transformer.upcs, transformer.product_columns]
+    np.testing.assert_array_equal(transformer.product_matrix, expected.values.astype(np.float32))
+    assert set(transformer.store_columns) <= set(encoded_stores.columns)
+    expected = encoded_stores.set_index('STORE_ID').loc[transformer.stores, transformer.store_columns]
+    np.testing.assert_array_equal(transformer.store_matrix, expected.values.astype(np.float32))
+
+    rows = train.iloc[:50]
+    features = transformer.transform(rows)
+    expected = np.hstack([rows[['BASE_PRICE', 'FEATURE', 'DISPLAY']].values.astype(np.float32),
+                          encoded_products.set_index('UPC').loc[rows.UPC, transformer.product_columns].values,
+                          encoded_stores.set_index('STORE_ID').loc[rows.STORE_NUM, transformer.store_columns].values])
+    observed = ~np.isnan(rows.BASE_PRICE.values)
+    np.testing.assert_array_equal(features[observed], expected[observed].astype(np.float32))
+
+
+def test_transform_row_and_sparse_match_transform(tables):
+    train, product_data, store_data = tables
+    transformer = PreprocessingTransformer().fit(train, product_data, store_data)
+    rows = train.iloc[::97].assign(BASE_PRICE=np.nan)
+    features = transformer.transform(rows)
+    assert not np.isnan(features).any()
+    for i, row in enumerate(rows.itertuples()):
+        np.testing.assert_array_equal(features[i], transformer.transform_row(row.STORE_NUM, row.UPC, row.FEATURE,
+                                                                             row.DISPLAY))
+    pytest.importorskip('scipy')
+    np.testing.assert_array_equal(transformer.transform(rows, sparse=True).toarray(), features)
+
+
+def test_save_and_load(tables, tmp_path):
+    train, product_data, store_data = tables
+    transformer = PreprocessingTransformer().fit(train, product_data, store_data)
+    path = str(tmp_path / 'transformer.pkl')
+    transformer.save(path)
+    loaded = PreprocessingTransformer.load(path)
+    rows = train.iloc[:20]
+    np.testing.assert_array_equal(loaded.transform(rows), transformer.transform(rows))
+
+
+def test_unknown_store_raises(tables):
+    train, product_data, store_data = tables
+    transformer = PreprocessingTransformer().fit(train, product_data, store_data)
+    rows = train.iloc[:1].assign(STORE_NUM=-1)
+    with pytest.raises(KeyError):
+        transformer.transform(rows)